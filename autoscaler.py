@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按队列深度自动伸缩本机worker
+定期读取 task_routes 中各队列（加上默认队列）在Redis/Tair中的积压长度，
+根据学习到的单worker处理速率估算排队时延，在本机启动或排空worker进程，
+使估算时延不超过目标值；受最小/最大worker数和扩缩容冷却时间约束。
+缩容时先取消该worker的队列消费再热关闭，正在执行的任务执行完再退出，
+task_acks_late 下未确认的预取消息由broker重新投递。
+每次决策打印日志，并把各队列指标写入Redis供外部查看
+"""
+
+import argparse
+import json
+import math
+import socket
+import subprocess
+import time
+from typing import Any, Dict, Optional
+
+from kombu.transport.redis import PRIORITY_STEPS
+
+from metrics import queue_depths
+from worker_launcher import build_command, build_profiles, worker_env
+
+
+class QueueScaler:
+    """单个队列的伸缩状态"""
+
+    def __init__(self, queue: str, profile: Dict[str, Any], settings: Dict[str, Any]):
+        self.queue = queue
+        self.profile = profile
+        self.min_workers = settings['min_workers']
+        self.max_workers = settings['max_workers']
+        self.target_latency = settings['target_latency']
+        self.rate_per_worker = float(settings['initial_rate'])
+        self.workers: Dict[str, subprocess.Popen] = {}
+        self.draining: Dict[str, Dict[str, Any]] = {}
+        self.next_index = 1
+        self.last_scale_up = 0.0
+        self.last_scale_down = 0.0
+        self.processed: Dict[str, int] = {}
+        self.metrics: Dict[str, Any] = {
+            'queue': queue,
+            'depth': 0,
+            'workers': 0,
+            'draining': 0,
+            'desired': self.min_workers,
+            'rate_per_worker': self.rate_per_worker,
+            'estimated_latency': 0.0,
+            'scale_ups': 0,
+            'scale_downs': 0,
+            'forced_kills': 0,
+            'last_action': None,
+        }
+
+    def desired_workers(self, depth: int) -> int:
+        """满足目标时延所需的worker数"""
+        if depth <= 0:
+            return self.min_workers
+        needed = math.ceil(depth / (self.rate_per_worker * self.target_latency))
+        return max(self.min_workers, min(self.max_workers, needed))
+
+    def estimated_latency(self, depth: int) -> float:
+        """按当前worker数估算的排队时延（秒），没有worker时为无穷大"""
+        if depth <= 0:
+            return 0.0
+        if not self.workers:
+            return float('inf')
+        return depth / (self.rate_per_worker * len(self.workers))
+
+
+class Autoscaler:
+    """本机worker自动伸缩器"""
+
+    def __init__(self, app, config_manager, dry_run: bool = False, loglevel: str = 'warning'):
+        self.app = app
+        self.config = config_manager.get_autoscaler_config()
+        self.dry_run = dry_run
+        self.loglevel = loglevel
+        self.hostname = socket.gethostname()
+        self.acks_late = app.conf.task_acks_late
+        self.client = config_manager.get_backend_redis_client()
+        if self.client is None:
+            raise RuntimeError("当前使用内存传输，没有可读取的队列，无法自动伸缩")
+
+        transport_options = app.conf.broker_transport_options or {}
+        self.priority_steps = transport_options.get('priority_steps', PRIORITY_STEPS)
+        self.metrics_key = f"{self.config['metrics_key']}:{self.hostname}"
+        self.decisions_key = f"{self.config['metrics_key']}:decisions"
+
+        profiles = build_profiles(config_manager.get_worker_profiles(), app.conf.task_routes,
+                                  app.conf.task_default_queue)
+        self.scalers: Dict[str, QueueScaler] = {}
+        for queue, profile in profiles.items():
+            settings = {key: self.config[key] for key in
+                        ('min_workers', 'max_workers', 'target_latency', 'initial_rate')}
+            settings.update(self.config['queues'].get(queue, {}))
+            self.scalers[queue] = QueueScaler(queue, profile, settings)
+
+    # ---- 采样 ----
+
+    def sample_depths(self) -> Dict[str, int]:
+        """一次管道读取所有队列的积压长度"""
+        return queue_depths(self.client, self.scalers, self.priority_steps)
+
+    def _worker_hostname(self, name: str) -> str:
+        return f"{name}@{self.hostname}"
+
+    def update_rates(self, interval: float):
+        """根据各worker已处理任务数的增量更新单worker处理速率（指数平滑）"""
+        destinations = [self._worker_hostname(name)
+                        for scaler in self.scalers.values() for name in scaler.workers]
+        if not destinations or self.dry_run:
+            return
+        stats = self.app.control.inspect(destination=destinations, timeout=1).stats() or {}
+        alpha = self.config['rate_smoothing']
+
+        for scaler in self.scalers.values():
+            delta, reporting = 0, 0
+            for name in scaler.workers:
+                worker_stats = stats.get(self._worker_hostname(name))
+                if worker_stats is None:
+                    continue
+                total = sum(worker_stats.get('total', {}).values())
+                if name in scaler.processed:
+                    delta += total - scaler.processed[name]
+                    reporting += 1
+                scaler.processed[name] = total
+            # 队列空闲时处理数为0并不代表处理能力为0，只在有积压时更新
+            if reporting and (delta > 0 or scaler.metrics['depth'] > 0):
+                observed = delta / interval / reporting
+                scaler.rate_per_worker = max(
+                    self.config['min_rate'], (1 - alpha) * scaler.rate_per_worker + alpha * observed
+                )
+
+    # ---- 扩缩容 ----
+
+    def _start_worker(self, scaler: QueueScaler):
+        name = f"{scaler.queue}-{scaler.next_index}"
+        scaler.next_index += 1
+        if not self.dry_run:
+            command = build_command(name, scaler.profile, self.loglevel)
+            scaler.workers[name] = subprocess.Popen(command, env=worker_env(scaler.profile))
+        else:
+            scaler.workers[name] = None
+
+    def _drain_worker(self, scaler: QueueScaler):
+        """停止消费后热关闭最新启动的worker"""
+        name = list(scaler.workers)[-1]
+        process = scaler.workers.pop(name)
+        scaler.processed.pop(name, None)
+        if self.dry_run:
+            return
+        try:
+            # 先取消队列消费，不再预取新消息
+            self.app.control.cancel_consumer(scaler.queue, destination=[self._worker_hostname(name)])
+        except Exception as e:
+            print(f"⚠️  取消 {name} 的队列消费失败: {e}")
+        process.terminate()
+        scaler.draining[name] = {'process': process, 'deadline': time.monotonic() + self.config['drain_timeout']}
+
+    def reap_draining(self):
+        """回收已退出的排空worker，超时未退出的强制结束"""
+        now = time.monotonic()
+        for scaler in self.scalers.values():
+            for name, state in list(scaler.draining.items()):
+                process = state['process']
+                if process.poll() is not None:
+                    del scaler.draining[name]
+                elif now >= state['deadline']:
+                    if self.acks_late:
+                        print(f"⚠️  {name} 排空超时，强制结束；未确认的任务将在可见性超时后重新投递")
+                    else:
+                        print(f"⚠️  {name} 排空超时，强制结束；task_acks_late 未开启，正在执行的任务会丢失")
+                    process.kill()
+                    scaler.metrics['forced_kills'] += 1
+                    del scaler.draining[name]
+            # 意外退出的worker从在线列表中移除，下一轮按需补齐
+            for name, process in list(scaler.workers.items()):
+                if process is not None and process.poll() is not None:
+                    print(f"❌ {name} 意外退出 (返回码 {process.returncode})")
+                    del scaler.workers[name]
+                    scaler.processed.pop(name, None)
+
+    def _record(self, scaler: QueueScaler, action: str, before: int, after: int, depth: int):
+        decision = {
+            'time': time.time(),
+            'host': self.hostname,
+            'queue': scaler.queue,
+            'action': action,
+            'from': before,
+            'to': after,
+            'depth': depth,
+            'rate_per_worker': round(scaler.rate_per_worker, 3),
+            'target_latency': scaler.target_latency,
+        }
+        scaler.metrics['last_action'] = decision
+        icon = '📈' if action == 'scale_up' else '📉'
+        print(f"{icon} [{time.strftime('%H:%M:%S')}] {scaler.queue}: {before} -> {after} 个worker "
+              f"(积压 {depth}, 单worker {scaler.rate_per_worker:.1f} 个/秒, 目标时延 {scaler.target_latency}s)")
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.lpush(self.decisions_key, json.dumps(decision))
+            pipe.ltrim(self.decisions_key, 0, self.config['decision_history'] - 1)
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️  记录伸缩决策失败: {e}")
+
+    def scale(self, depths: Dict[str, int]):
+        now = time.monotonic()
+        for queue, scaler in self.scalers.items():
+            depth = depths.get(queue, 0)
+            current = len(scaler.workers)
+            desired = scaler.desired_workers(depth)
+
+            if desired > current and now - scaler.last_scale_up >= self.config['scale_up_cooldown']:
+                for _ in range(desired - current):
+                    self._start_worker(scaler)
+                scaler.last_scale_up = now
+                scaler.metrics['scale_ups'] += 1
+                self._record(scaler, 'scale_up', current, desired, depth)
+            elif desired < current and now - max(scaler.last_scale_up, scaler.last_scale_down) \
+                    >= self.config['scale_down_cooldown']:
+                # 缩容每次只减一个，避免积压短暂清空时大幅抖动
+                self._drain_worker(scaler)
+                scaler.last_scale_down = now
+                scaler.metrics['scale_downs'] += 1
+                self._record(scaler, 'scale_down', current, current - 1, depth)
+
+            scaler.metrics.update({
+                'depth': depth,
+                'workers': len(scaler.workers),
+                'draining': len(scaler.draining),
+                'desired': desired,
+                'rate_per_worker': round(scaler.rate_per_worker, 3),
+                'estimated_latency': scaler.estimated_latency(depth),
+            })
+
+    # ---- 指标 ----
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """各队列当前指标"""
+        return {queue: dict(scaler.metrics) for queue, scaler in self.scalers.items()}
+
+    def publish_metrics(self):
+        """把指标写入Redis哈希（按主机），过期时间为三个采样周期"""
+        metrics = self.get_metrics()
+        for values in metrics.values():
+            if values['estimated_latency'] == float('inf'):
+                values['estimated_latency'] = None
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hset(self.metrics_key, mapping={queue: json.dumps(values) for queue, values in metrics.items()})
+            pipe.expire(self.metrics_key, max(1, int(self.config['interval'] * 3)))
+            pipe.execute()
+        except Exception as e:
+            print(f"⚠️  写入伸缩指标失败: {e}")
+
+    # ---- 主循环 ----
+
+    def step(self, interval: float):
+        self.reap_draining()
+        self.update_rates(interval)
+        depths = self.sample_depths()
+        for queue, depth in depths.items():
+            self.scalers[queue].metrics['depth'] = depth
+        self.scale(depths)
+        self.publish_metrics()
+
+    def run(self, iterations: Optional[int] = None):
+        interval = self.config['interval']
+        print(f"🔄 自动伸缩启动: 队列 {', '.join(self.scalers)}，采样间隔 {interval}s"
+              f"{'（仅模拟）' if self.dry_run else ''}")
+        count = 0
+        last = time.monotonic()
+        try:
+            while iterations is None or count < iterations:
+                now = time.monotonic()
+                try:
+                    self.step(max(now - last, 1e-3))
+                except Exception as e:
+                    print(f"❌ 伸缩采样失败: {e}")
+                last = now
+                count += 1
+                if iterations is None or count < iterations:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            print("\n收到中断，正在排空所有worker...")
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """排空所有worker并等待退出"""
+        for scaler in self.scalers.values():
+            while scaler.workers:
+                self._drain_worker(scaler)
+        while any(scaler.draining for scaler in self.scalers.values()):
+            self.reap_draining()
+            time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按队列深度自动伸缩本机Celery worker')
+    parser.add_argument('--dry-run', action='store_true', help='只打印伸缩决策，不启动worker')
+    parser.add_argument('--iterations', type=int, help='采样次数（默认一直运行）')
+    parser.add_argument('--loglevel', default='warning', help='worker日志级别')
+    args = parser.parse_args()
+
+    from celery_app import app, config_manager
+    Autoscaler(app, config_manager, dry_run=args.dry_run, loglevel=args.loglevel).run(args.iterations)
+
+
+if __name__ == '__main__':
+    main()
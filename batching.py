@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+生产者端批量提交模块
+将 (x, y) 操作数流按数量或等待时间自动分批，提交给 add_many / multiply_many，
+再把批量结果拆回到每个元素，使每条消息的开销由整批分摊
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+
+class _Batch:
+    """一个已提交的批次，结果只从后端获取一次"""
+
+    def __init__(self, async_result):
+        self.async_result = async_result
+        self._values: Optional[List[Any]] = None
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def ready(self) -> bool:
+        # 完成后不再查询后端，同一批次的其余元素直接返回
+        if not self._ready:
+            self._ready = self._values is not None or self.async_result.ready()
+        return self._ready
+
+    def get(self, timeout: Optional[float] = None) -> List[Any]:
+        if self._values is None:
+            with self._lock:
+                if self._values is None:
+                    self._values = self.async_result.get(timeout=timeout)
+        return self._values
+
+
+class BatchItemResult:
+    """批次中单个元素的结果句柄"""
+
+    def __init__(self):
+        self._batch: Optional[_Batch] = None
+        self._index = 0
+        self._error: Optional[BaseException] = None
+        self._submitted = threading.Event()
+
+    def _bind(self, batch: _Batch, index: int):
+        self._batch = batch
+        self._index = index
+        self._submitted.set()
+
+    def _fail(self, error: BaseException):
+        """所在批次发送失败"""
+        self._error = error
+        self._submitted.set()
+
+    @property
+    def submitted(self) -> bool:
+        """所在批次是否已发送"""
+        return self._submitted.is_set()
+
+    def ready(self) -> bool:
+        if not self.submitted:
+            return False
+        return self._error is not None or self._batch.ready()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """等待所在批次完成并返回本元素的结果"""
+        start = time.monotonic()
+        if not self._submitted.wait(timeout):
+            raise TimeoutError("批次尚未提交")
+        if self._error is not None:
+            raise self._error
+        if timeout is not None:
+            timeout = max(0.0, timeout - (time.monotonic() - start))
+        return self._batch.get(timeout=timeout)[self._index]
+
+
+class BatchSubmitter:
+    """
+    按数量或等待时间自动分批的提交器（线程安全）
+
+    达到 max_batch_size 立即发送；不足一批时，最早的元素等待超过 linger 秒后
+    由后台线程发送。发送在锁外进行；发送失败时该批元素的 get() 抛出发送时的异常。
+    """
+
+    def __init__(self, task, max_batch_size: int = 1000, linger: float = 0.05):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size 必须大于0")
+        self.task = task
+        self.max_batch_size = max_batch_size
+        self.linger = linger
+        self.batches_sent = 0
+        self.items_sent = 0
+
+        self._xs: List[Any] = []
+        self._ys: List[Any] = []
+        self._items: List[BatchItemResult] = []
+        self._first_at = 0.0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._flusher = threading.Thread(target=self._linger_loop, name='batch-linger', daemon=True)
+        self._flusher.start()
+
+    def submit(self, x, y) -> BatchItemResult:
+        """加入一对操作数，返回该元素的结果句柄"""
+        item = BatchItemResult()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BatchSubmitter 已关闭")
+            if not self._items:
+                self._first_at = time.monotonic()
+                self._cond.notify()
+            self._xs.append(x)
+            self._ys.append(y)
+            self._items.append(item)
+            batch = self._take_locked() if len(self._items) >= self.max_batch_size else None
+        if batch is not None:
+            self._send(*batch)
+        return item
+
+    def flush(self):
+        """立即发送当前未满的批次"""
+        with self._cond:
+            batch = self._take_locked()
+        if batch is not None:
+            self._send(*batch)
+
+    def close(self):
+        """发送剩余元素并停止后台线程"""
+        with self._cond:
+            batch = self._take_locked()
+            self._closed = True
+            self._cond.notify()
+        try:
+            if batch is not None:
+                self._send(*batch)
+        finally:
+            self._flusher.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _take_locked(self) -> Optional[Tuple[List[Any], List[Any], List[BatchItemResult]]]:
+        """取出当前批次（须持有锁），没有元素时返回None"""
+        if not self._items:
+            return None
+        batch = self._xs, self._ys, self._items
+        self._xs, self._ys, self._items = [], [], []
+        return batch
+
+    def _send(self, xs: List[Any], ys: List[Any], items: List[BatchItemResult]):
+        """发送一个批次（不持有锁）；失败时让该批元素的 get() 抛出异常，并向调用方抛出"""
+        try:
+            batch = _Batch(self.task.delay(xs, ys))
+        except Exception as e:
+            for item in items:
+                item._fail(e)
+            raise
+        for index, item in enumerate(items):
+            item._bind(batch, index)
+        with self._cond:
+            self.batches_sent += 1
+            self.items_sent += len(items)
+
+    def _linger_loop(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                if not self._items:
+                    self._cond.wait()
+                    continue
+                remaining = self._first_at + self.linger - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                batch = self._take_locked()
+            try:
+                self._send(*batch)
+            except Exception as e:
+                # 元素已标记失败，线程继续处理之后的批次
+                print(f"⚠️  批次发送失败（{len(batch[2])} 个元素）: {e}")
+
+
+def map_pairs(task, pairs: Iterable[Tuple[Any, Any]], max_batch_size: int = 1000,
+              linger: float = 0.05, timeout: Optional[float] = None) -> Iterator[Any]:
+    """
+    对 (x, y) 操作数流分批执行批量任务，按输入顺序逐个产出结果
+
+    输入可以是无限流：已完成批次的结果会在继续读取输入时及时产出。
+    """
+    pending = deque()
+    checked = 0
+    with BatchSubmitter(task, max_batch_size=max_batch_size, linger=linger) as submitter:
+        for x, y in pairs:
+            pending.append(submitter.submit(x, y))
+            # 每发送一个批次才检查一次最早批次是否完成，不按元素查询后端
+            if submitter.batches_sent == checked:
+                continue
+            checked = submitter.batches_sent
+            while pending and pending[0].ready():
+                yield pending.popleft().get()
+        submitter.flush()
+        while pending:
+            yield pending.popleft().get(timeout=timeout)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+任务日志开销基准
+在任务上下文中直接调用任务函数体（不经过消息代理），对比每次调用的耗时：
+- print：原来的同步print，stdout按worker的方式重定向到logging（LoggingProxy）后写入文件
+- task_log：后台批量写出；后台线程在调用期间并发格式化写出，争用GIL的耗时计入调用方，
+  循环结束后队列中剩余日志的写出耗时单独列出
+- task_log 采样10%
+- 基线：日志级别高于INFO，日志调用只剩级别判断
+每次调用前后进入/退出任务上下文（采样在这里决定），这部分耗时计入所有方式。
+开销 = 该方式的耗时 - 基线耗时。
+
+用法示例：
+    python benchmark_logging.py --runs 20000
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from celery.utils import uuid
+from celery.utils.log import LoggingProxy
+
+
+def make_calls(size: int):
+    """(任务, 参数) 列表：廉价任务 add 与处理大列表的 process_list / generate_random_numbers"""
+    from tasks import add, generate_random_numbers, process_list
+
+    numbers = [random.randint(1, 100) for _ in range(size)]
+    return [
+        ('add', add, (1, 2)),
+        (f'process_list[{size}]', process_list, (numbers,)),
+        (f'generate_random_numbers[{size}]', generate_random_numbers, (size,)),
+    ]
+
+
+def run_calls(task, args, runs: int) -> float:
+    """每次调用都进入一次任务执行（与worker中task_prerun/postrun相同），返回每次耗时（秒）"""
+    import task_log
+
+    run = task.run
+    task_ids = [uuid() for _ in range(runs)]
+    start = time.perf_counter()
+    for task_id in task_ids:
+        task_log.task_started(task.name, task_id)
+        run(*args)
+        task_log.task_finished()
+    return (time.perf_counter() - start) / runs
+
+
+@contextlib.contextmanager
+def worker_stdout(path: str):
+    """按worker的方式把stdout重定向到logging，日志写入文件"""
+    logger = logging.getLogger('benchmark.stdout')
+    logger.propagate = False
+    handler = logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('[%(asctime)s: %(levelname)s/%(processName)s] %(message)s'))
+    logger.addHandler(handler)
+    original = sys.stdout
+    sys.stdout = LoggingProxy(logger, loglevel=logging.WARNING)
+    try:
+        yield
+    finally:
+        sys.stdout = original
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='任务日志开销：同步print与后台批量写出对比')
+    parser.add_argument('--runs', type=int, default=20000, help='每项调用次数')
+    parser.add_argument('--size', type=int, default=1000, help='列表长度')
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import task_log
+        calls = make_calls(args.size)
+
+    directory = tempfile.mkdtemp(prefix='benchmark-logging-')
+    log_path = os.path.join(directory, 'task.log')
+    modes = [
+        ('基线(无日志)', {'enabled': True, 'level': 'WARNING'}),
+        ('print', {'enabled': False}),
+        ('task_log', {'enabled': True, 'stream': log_path}),
+        ('task_log 采样10%', {'enabled': True, 'stream': log_path, 'sample_rate': 0.1}),
+    ]
+
+    print("任务日志开销基准（每次调用耗时: 微秒）")
+    print("=" * 78)
+    for name, task, task_args in calls:
+        print(f"\n{name}  x {args.runs}")
+        baseline = None
+        for mode, config in modes:
+            task_log.configure(dict(config, queue_size=args.runs * 3, batch_size=1000))
+            with worker_stdout(log_path):
+                elapsed = run_calls(task, task_args, args.runs)
+                start = time.perf_counter()
+                task_log.flush()
+                background = (time.perf_counter() - start) / args.runs
+            if baseline is None:
+                baseline = elapsed
+            print(f"  {mode:<16} 调用方 {elapsed * 1e6:9.2f}  开销 {(elapsed - baseline) * 1e6:9.2f}"
+                  f"  剩余写出 {background * 1e6:8.2f}")
+        stats = task_log.get_stats()
+        print(f"  task_log 累计: 写出 {stats['written']}  采样丢弃 {stats['sampled']}  队列满丢弃 {stats['dropped']}")
+
+    os.remove(log_path)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+优先级通道基准
+先以 bulk 级别向 math 队列灌入大量积压（模拟回填任务），在积压排空期间按固定速率
+提交交互式 add 任务，测量它们的入队→开始时延分位数。依次运行两个场景：
+- fifo：交互式任务与积压同级别（相当于没有优先级通道）
+- lanes：交互式任务使用 high 级别
+需要Redis传输（内存传输不支持优先级通道）。
+
+用法示例：
+    python benchmark_priority.py --spawn-redis --backlog 5000
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import time
+from typing import Any, Dict
+
+from benchmark_tasks import TaskTimeline, clock, git_revision, percentiles, spawn_redis
+
+
+def run_scenario(app, timeline: TaskTimeline, name: str, interactive_priority: str, args) -> Dict[str, Any]:
+    """灌入积压后按速率提交交互式任务，等待全部完成"""
+    from bulk import submit_many
+    from priority import submit
+    from tasks import add
+
+    timeline.reset()
+    base = random.randint(1, 10 ** 9)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = clock()
+        backlog = submit_many(add, ((base + i, i) for i in range(args.backlog)),
+                              priority='bulk', memoize=False)
+        enqueued: Dict[str, float] = {}
+        for i in range(args.interactive):
+            delay = start + i / args.interactive_rate - clock()
+            if delay > 0:
+                time.sleep(delay)
+            submitted = clock()
+            result = submit(add, (base - i, i), priority=interactive_priority, memoize=False)
+            enqueued[result.id] = submitted
+        for task_id in enqueued:
+            app.AsyncResult(task_id).get(timeout=args.timeout)
+        interactive_done = clock() - start
+        backlog.get(timeout=args.timeout)
+        elapsed = clock() - start
+
+    waits = [timeline.started[task_id] - submitted for task_id, submitted in enqueued.items()
+             if task_id in timeline.started]
+    backlog_waits = [timeline.started[task_id] - start for task_id in backlog.ids
+                     if task_id in timeline.started]
+    return {
+        'interactive_priority': interactive_priority,
+        'backlog': args.backlog,
+        'interactive': args.interactive,
+        'elapsed': round(elapsed, 3),
+        'interactive_done': round(interactive_done, 3),
+        'throughput': round((args.backlog + args.interactive) / elapsed, 2),
+        'interactive_wait_ms': percentiles(waits),
+        'backlog_wait_ms': percentiles(backlog_waits),
+    }
+
+
+def print_result(name: str, result: Dict[str, Any]):
+    print(f"\n{name}  (积压 {result['backlog']} 个, 交互式 {result['interactive']} 个, "
+          f"交互式级别 {result['interactive_priority']})")
+    print(f"  总耗时 {result['elapsed']}s  吞吐 {result['throughput']} 个/秒")
+    for label, key in (('交互式 入队→开始', 'interactive_wait_ms'), ('积压   入队→开始', 'backlog_wait_ms')):
+        stats = result[key]
+        if stats['count']:
+            print(f"  {label}  p50 {stats['p50']:>10} ms  p99 {stats['p99']:>10} ms  max {stats['max']:>10} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='优先级通道基准：队列饱和时高优先级任务的时延')
+    parser.add_argument('--transport', choices=['auto', 'redis', 'local_redis'], default='auto')
+    parser.add_argument('--spawn-redis', action='store_true', help='启动本地redis-server替身（使用local_redis端口）')
+    parser.add_argument('--backlog', type=int, default=5000, help='bulk级别的积压任务数')
+    parser.add_argument('--interactive', type=int, default=200, help='交互式任务数')
+    parser.add_argument('--interactive-rate', type=float, default=50, help='交互式任务每秒提交数')
+    parser.add_argument('--concurrency', type=int, default=4, help='内嵌worker的线程数')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--output', default='benchmark_priority.json', help='JSON结果文件')
+    args = parser.parse_args()
+
+    import celery_app
+
+    config_manager = celery_app.config_manager
+    redis_process = None
+    if args.spawn_redis:
+        redis_process = spawn_redis(config_manager)
+        args.transport = 'local_redis'
+    if args.transport != 'auto':
+        config_manager.force_backend(args.transport)
+    resolved = config_manager.resolve_backend()
+    if resolved['type'] == 'memory':
+        print("❌ 内存传输不支持优先级通道，请使用Redis（可加 --spawn-redis）")
+        return
+
+    from celery import signals
+    from celery.contrib.testing.worker import start_worker
+
+    app = celery_app.app
+    # 预取的消息不再参与优先级排序，基准固定为每线程只预取一条
+    app.conf.worker_prefetch_multiplier = 1
+    timeline = TaskTimeline()
+    signals.task_prerun.connect(timeline.on_prerun, weak=False)
+
+    print("优先级通道基准")
+    print("=" * 60)
+    print(f"后端: {resolved['type']}  worker: threads x {args.concurrency}  "
+          f"通道: {app.conf.broker_transport_options.get('priority_steps')}")
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_revision': git_revision(),
+            'transport': resolved['type'],
+            'args': {key: value for key, value in vars(args).items() if key != 'output'},
+        },
+        'scenarios': {},
+    }
+    try:
+        with start_worker(app, pool='threads', concurrency=args.concurrency, loglevel='error',
+                          perform_ping_check=False, queues=['math'], shutdown_timeout=30):
+            for name, level in (('fifo', 'bulk'), ('lanes', 'high')):
+                result = run_scenario(app, timeline, name, level, args)
+                report['scenarios'][name] = result
+                print_result(name, result)
+    finally:
+        if redis_process is not None:
+            redis_process.terminate()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ 结果已写入: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+序列化基准测试
+对比 json 与 numpack 在数值负载上的消息大小和编码/解码耗时
+负载形式与 process_list 的参数、generate_random_numbers 的结果一致
+"""
+
+import argparse
+import random
+import time
+
+from kombu.serialization import dumps, loads
+
+from serializers import SERIALIZER_NAME, register_numpack
+
+# 整数窄化的边界：负数与接近64位上限的值混合、各整数类型的上下限
+INT_EDGE_CASES = [
+    [-1] + [2 ** 60 + 1] * 20,
+    [-1, 2 ** 63 - 1] * 10,
+    [-2 ** 63, 2 ** 63 - 1] * 10,
+    [-129, 255] * 10,
+    [0, 2 ** 32] * 10,
+    [-2 ** 31, 2 ** 31 - 1] * 10,
+]
+
+
+def make_payloads(size):
+    """构造与任务消息体结构一致的负载：(args, kwargs, embed)"""
+    ints = [random.randint(1, 100) for _ in range(size)]
+    floats = [random.random() * 100 for _ in range(size)]
+    embed = {'callbacks': None, 'errbacks': None, 'chain': None, 'chord': None}
+    return {
+        f'process_list 参数 (int x {size})': ((ints,), {}, embed),
+        f'结果 (float x {size})': {'status': 'SUCCESS', 'result': floats, 'traceback': None, 'children': []},
+    }
+
+
+def check_roundtrip():
+    """边界取值编码再解码后应与原值完全一致；返回不一致的用例数"""
+    import numpy as np
+
+    failures = 0
+    for values in INT_EDGE_CASES:
+        for payload in (values, np.array(values, dtype=np.int64)):
+            content_type, encoding, data = dumps(payload, serializer=SERIALIZER_NAME)
+            decoded = loads(data, content_type, encoding)
+            decoded = decoded.tolist() if isinstance(decoded, np.ndarray) else decoded
+            if decoded != list(payload):
+                failures += 1
+                print(f"❌ 往返不一致: {type(payload).__name__} {values[:4]}... -> {decoded[:4]}...")
+    if not failures:
+        print(f"✅ 整数边界往返检查通过（{len(INT_EDGE_CASES)} 组）")
+    return failures
+
+
+def check_decoded_arrays():
+    """
+    解码得到的数组是只读的：大数组直接映射消息缓冲区（零复制），窄化传输的小数组解码时复制一次；
+    返回不符合的用例数
+    """
+    import numpy as np
+
+    from serializers import _options
+
+    failures = 0
+    large = _options['narrow_max_items'] + 1
+    for name, array, zero_copy in (('小整数数组（窄化传输）', np.arange(100, dtype=np.int64), False),
+                                   ('大整数数组', np.arange(large, dtype=np.int64), True),
+                                   ('浮点数组', np.linspace(0, 1, 1000), True)):
+        content_type, encoding, data = dumps(array, serializer=SERIALIZER_NAME)
+        decoded = loads(data, content_type, encoding)
+        problems = []
+        if not np.array_equal(decoded, array) or decoded.dtype != array.dtype:
+            problems.append('值或dtype不一致')
+        if decoded.flags.writeable:
+            problems.append('可写')
+        if zero_copy and decoded.flags.owndata:
+            problems.append('发生了复制')
+        try:
+            decoded[0] = 1
+            problems.append('修改没有报错')
+        except ValueError:
+            pass
+        if problems:
+            failures += 1
+            print(f"❌ {name}: {', '.join(problems)}")
+    if not failures:
+        print("✅ 解码数组检查通过（只读；大数组零复制，修改前需 .copy()）")
+    return failures
+
+
+def bench(serializer, payload, runs):
+    content_type, encoding, data = dumps(payload, serializer=serializer)
+    start = time.perf_counter()
+    for _ in range(runs):
+        dumps(payload, serializer=serializer)
+    encode = (time.perf_counter() - start) / runs
+    start = time.perf_counter()
+    for _ in range(runs):
+        loads(data, content_type, encoding)
+    decode = (time.perf_counter() - start) / runs
+    return len(data), encode, decode
+
+
+def main():
+    parser = argparse.ArgumentParser(description='json 与 numpack 序列化对比')
+    parser.add_argument('--sizes', default='10,1000,100000,1000000', help='数值个数，逗号分隔')
+    parser.add_argument('--runs', type=int, default=5, help='每项重复次数')
+    args = parser.parse_args()
+
+    register_numpack()
+    if check_roundtrip() + check_decoded_arrays():
+        raise SystemExit(1)
+    print("序列化基准测试（大小: 字节，耗时: 毫秒）")
+    print("=" * 78)
+    for size in (int(s) for s in args.sizes.split(',')):
+        for name, payload in make_payloads(size).items():
+            print(f"\n{name}")
+            base = None
+            for serializer in ('json', SERIALIZER_NAME):
+                length, encode, decode = bench(serializer, payload, args.runs)
+                base = base or (length, encode + decode)
+                print(f"  {serializer:<8} 大小 {length:>10}  编码 {encode * 1000:9.3f}  解码 {decode * 1000:9.3f}"
+                      f"  (大小 {length / base[0]:.2f}x, 总耗时 {(encode + decode) / base[1]:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
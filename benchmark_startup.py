@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+启动耗时基准测试
+分别测量 Tair / 本地Redis / 内存传输 三种后端下
+导入 celery_app 以及首次解析后端的耗时（冷缓存与热缓存）
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 子进程中执行的测量脚本：分别统计导入耗时和首次解析后端耗时
+MEASURE_SCRIPT = """
+import json, time
+t0 = time.perf_counter()
+import celery_app
+t1 = time.perf_counter()
+celery_app.app.conf.broker_url
+t2 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'first_use': t2 - t1,
+                  'broker': celery_app.config_manager.resolve_backend()['type']}))
+"""
+
+
+def build_scenarios(tair_config_file, local_port):
+    """构建三种后端场景的配置"""
+    scenarios = {}
+
+    if os.path.exists(tair_config_file):
+        with open(tair_config_file, 'r', encoding='utf-8') as f:
+            scenarios['tair'] = json.load(f)
+    else:
+        print(f"⚠️  未找到 {tair_config_file}，跳过Tair场景")
+
+    scenarios['local_redis'] = {
+        "redis": {"type": "local", "host": "localhost", "port": local_port, "db": 0},
+        "celery": {"broker_url": f"redis://localhost:{local_port}/0",
+                   "result_backend": f"redis://localhost:{local_port}/0"},
+    }
+
+    # 指向一个不监听的端口并关闭本地备选，最终落到内存传输
+    scenarios['memory'] = {
+        "redis": {"type": "unreachable", "host": "127.0.0.1", "port": 1, "db": 0,
+                  "connection_pool": {"socket_timeout": 1, "socket_connect_timeout": 1}},
+        "local_redis": {"fallback_enabled": False},
+    }
+    return scenarios
+
+
+def run_once(workdir):
+    """在独立子进程中测量一次"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = PROJECT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    output = subprocess.run(
+        [sys.executable, '-c', MEASURE_SCRIPT],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_scenario(name, config, runs):
+    """测量一个场景的冷缓存与热缓存耗时"""
+    with tempfile.TemporaryDirectory() as workdir:
+        config = dict(config)
+        cache_path = os.path.join(workdir, 'backend_cache.json')
+        config['backend_cache'] = {"enabled": True, "ttl": 300, "path": cache_path}
+        with open(os.path.join(workdir, 'config.json'), 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+
+        results = {'cold': [], 'warm': []}
+        broker = None
+        for _ in range(runs):
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            cold = run_once(workdir)
+            warm = run_once(workdir)
+            results['cold'].append(cold)
+            results['warm'].append(warm)
+            broker = warm['broker']
+
+    print(f"\n[{name}] 实际使用后端: {broker}")
+    for mode in ('cold', 'warm'):
+        imports = [r['import'] * 1000 for r in results[mode]]
+        first_use = [r['first_use'] * 1000 for r in results[mode]]
+        print(f"  {mode:<5} 导入: {statistics.median(imports):8.1f} ms   "
+              f"首次解析: {statistics.median(first_use):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='celery_app 启动耗时基准测试')
+    parser.add_argument('--config', default='config.json', help='Tair场景使用的配置文件')
+    parser.add_argument('--local-port', type=int, default=6379, help='本地Redis端口')
+    parser.add_argument('--runs', type=int, default=5, help='每个场景的测量次数')
+    args = parser.parse_args()
+
+    print("celery_app 启动耗时基准测试（中位数）")
+    print("=" * 50)
+    for name, config in build_scenarios(args.config, args.local_port).items():
+        try:
+            bench_scenario(name, config, args.runs)
+        except subprocess.CalledProcessError as e:
+            print(f"\n[{name}] 测量失败: {e.stderr}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+任务提交吞吐基准测试
+对比 .delay() 循环与 bulk.submit_many 批量提交的消息发送速率（条/秒）
+add 是确定性任务，测试时关闭结果记忆（memoize=False），每条都实际发送消息
+"""
+
+import argparse
+import time
+
+from celery_app import app
+from bulk import submit_many
+from tasks import add
+
+
+def purge_queue(queue):
+    """清空测试产生的消息，避免被worker执行"""
+    with app.connection_for_write() as conn:
+        try:
+            return conn.default_channel.queue_purge(queue) or 0
+        except Exception:
+            return 0
+
+
+def bench_delay(count):
+    start = time.perf_counter()
+    for i in range(count):
+        add.apply_async((i, i), memoize=False)
+    return time.perf_counter() - start
+
+
+def bench_submit_many(count, batch_size):
+    start = time.perf_counter()
+    submit_many(add, ((i, i) for i in range(count)), batch_size=batch_size, memoize=False)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='任务提交吞吐基准测试')
+    parser.add_argument('--count', type=int, default=5000, help='每轮发送的消息数')
+    parser.add_argument('--batch-sizes', default='100,500,1000', help='submit_many 的批大小，逗号分隔')
+    parser.add_argument('--keep', action='store_true', help='保留测试消息（默认测试后清空math队列）')
+    args = parser.parse_args()
+
+    print("任务提交吞吐基准测试")
+    print("=" * 50)
+    print(f"消息代理: {app.conf.broker_url.split('@')[-1]}")
+    print(f"每轮消息数: {args.count}")
+
+    # 预热：建立连接、声明队列
+    submit_many(add, [(0, 0)] * 10, memoize=False)
+    if not args.keep:
+        purge_queue('math')
+
+    elapsed = bench_delay(args.count)
+    print(f"\n.delay() 循环:              {args.count / elapsed:10.0f} 条/秒  ({elapsed:.2f} s)")
+    if not args.keep:
+        purge_queue('math')
+
+    for batch_size in (int(b) for b in args.batch_sizes.split(',')):
+        bulk_elapsed = bench_submit_many(args.count, batch_size)
+        print(f"submit_many(batch={batch_size:<5}):  {args.count / bulk_elapsed:10.0f} 条/秒  "
+              f"({bulk_elapsed:.2f} s, {elapsed / bulk_elapsed:.1f}x)")
+        if not args.keep:
+            purge_queue('math')
+
+
+if __name__ == '__main__':
+    main()
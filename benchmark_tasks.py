@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+任务负载测试与基准套件
+以可配置的速率和负载大小驱动 tasks.py 中的任务（add、multiply、process_list、
+generate_random_numbers、long_running_task、retry_task），由本进程内嵌的线程池worker执行，
+报告吞吐、端到端时延分位数（入队→开始、开始→完成、完成→取回结果）以及
+消息代理/结果后端的内存增长，结果写入JSON文件，可与基线对比发现性能回退。
+
+用法示例：
+    python benchmark_tasks.py --transport memory --output bench.json
+    python benchmark_tasks.py --spawn-redis --compare bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import redis
+
+# 与线程worker共享同一计时基准
+clock = time.perf_counter
+
+
+class TaskTimeline:
+    """通过任务信号记录每个任务的开始/完成时间（内嵌worker与本进程共用时钟）"""
+
+    def __init__(self):
+        self.started: Dict[str, float] = {}
+        self.finished: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def on_prerun(self, task_id=None, **kwargs):
+        now = clock()
+        with self._lock:
+            # 重试时保留第一次开始的时间
+            self.started.setdefault(task_id, now)
+
+    def on_postrun(self, task_id=None, state=None, **kwargs):
+        from celery import states
+        if state in states.READY_STATES:
+            with self._lock:
+                self.finished[task_id] = clock()
+
+    def reset(self):
+        with self._lock:
+            self.started.clear()
+            self.finished.clear()
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """毫秒为单位的分位数（最近秩法）"""
+    if not values:
+        return {'count': 0, 'mean': None, 'p50': None, 'p90': None, 'p99': None, 'max': None}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50': round(rank(50) * 1000, 3),
+        'p90': round(rank(90) * 1000, 3),
+        'p99': round(rank(99) * 1000, 3),
+        'max': round(ordered[-1] * 1000, 3),
+    }
+
+
+def memory_snapshot(config_manager) -> Dict[str, Any]:
+    """消息代理/结果后端的内存占用：Redis取INFO used_memory，内存传输统计队列和缓存中的字节数"""
+    client = config_manager.get_backend_redis_client()
+    if client is not None:
+        try:
+            return {'kind': 'redis', 'bytes': client.info('memory').get('used_memory'), 'keys': client.dbsize()}
+        except redis.exceptions.RedisError:
+            # 部分托管实例禁用了INFO/DBSIZE命令
+            return {'kind': 'redis', 'bytes': None, 'keys': None}
+
+    from celery.backends.cache import _DUMMY_CLIENT_CACHE
+    from kombu.transport.memory import Channel
+
+    broker_bytes = 0
+    for queue in list(Channel.queues.values()):
+        for message in list(queue.queue):
+            broker_bytes += len(message.get('body', '')) if isinstance(message, dict) else 0
+    backend_bytes = sum(len(value) for value in list(_DUMMY_CLIENT_CACHE.values())
+                        if isinstance(value, (bytes, str)))
+    return {'kind': 'memory', 'bytes': broker_bytes + backend_bytes, 'keys': len(_DUMMY_CLIENT_CACHE)}
+
+
+def memory_growth(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    growth = {'kind': after['kind']}
+    for key in ('bytes', 'keys'):
+        known = before[key] is not None and after[key] is not None
+        growth[key] = after[key] - before[key] if known else None
+    return growth
+
+
+def build_scenarios(args) -> List[Dict[str, Any]]:
+    """场景列表：名称、签名工厂和任务数"""
+    from tasks import (add, generate_random_numbers, long_running_task, multiply,
+                       process_list, retry_task)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    # 每次运行使用不同的参数，避免命中之前运行留下的结果记忆
+    base = random.randint(1, 10 ** 9)
+    scenarios = [
+        {'name': 'add', 'count': args.count, 'make': lambda i: add.s(base + i, i)},
+        {'name': 'multiply', 'count': args.count, 'make': lambda i: multiply.s(base + i, i + 1)},
+    ]
+    for size in sizes:
+        numbers = [random.randint(1, 100) for _ in range(size)]
+        scenarios.append({'name': f'process_list[size={size}]', 'task': 'process_list',
+                          'count': args.payload_count, 'make': lambda i, n=numbers: process_list.s(n)})
+    for size in sizes:
+        scenarios.append({'name': f'generate_random_numbers[count={size}]', 'task': 'generate_random_numbers',
+                          'count': args.payload_count, 'make': lambda i, n=size: generate_random_numbers.s(n)})
+    scenarios.append({'name': f'long_running_task[duration={args.long_duration}]', 'task': 'long_running_task',
+                      'count': args.long_count, 'make': lambda i: long_running_task.s(args.long_duration)})
+    scenarios.append({'name': f'retry_task[p={args.retry_probability}]', 'task': 'retry_task',
+                      'count': args.retry_count, 'make': lambda i: retry_task.s(args.retry_probability)})
+
+    selected = set(args.tasks.split(',')) if args.tasks else None
+    return [s for s in scenarios if selected is None or s.get('task', s['name']) in selected]
+
+
+def run_scenario(app, config_manager, timeline: TaskTimeline, scenario: Dict[str, Any],
+                 rate: float, timeout: float, memoize: bool = False) -> Dict[str, Any]:
+    """按速率提交一个场景的任务并收集时间线"""
+    from result_collector import ResultCollector
+
+    timeline.reset()
+    memory_before = memory_snapshot(config_manager)
+    enqueued: Dict[str, float] = {}
+    fetched: Dict[str, float] = {}
+    failures = 0
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = clock()
+        for i in range(scenario['count']):
+            if rate:
+                delay = start + i / rate - clock()
+                if delay > 0:
+                    time.sleep(delay)
+            signature = scenario['make'](i)
+            if not memoize and getattr(signature.type, 'deterministic', False):
+                # 默认测量实际执行，不让结果记忆命中
+                signature = signature.set(memoize=False)
+            submitted = clock()
+            task_id = signature.apply_async().id
+            enqueued.setdefault(task_id, submitted)
+        submit_elapsed = clock() - start
+
+        collector = ResultCollector(list(enqueued), app=app, interval=0.005, max_interval=0.05)
+        for task_id, result in collector.iter(timeout=timeout):
+            fetched[task_id] = clock()
+            if isinstance(result, BaseException):
+                failures += 1
+        elapsed = clock() - start
+
+    memory_after = memory_snapshot(config_manager)
+
+    queue_wait, execution, fetch_delay, end_to_end = [], [], [], []
+    for task_id, enqueue_time in enqueued.items():
+        started = timeline.started.get(task_id)
+        finished = timeline.finished.get(task_id)
+        if started is not None:
+            queue_wait.append(started - enqueue_time)
+        if started is not None and finished is not None:
+            execution.append(finished - started)
+        if finished is not None and task_id in fetched:
+            # 结果在postrun信号之前写入后端，轮询可能先于信号取到
+            fetch_delay.append(max(0.0, fetched[task_id] - finished))
+        if task_id in fetched:
+            end_to_end.append(fetched[task_id] - enqueue_time)
+
+    count = scenario['count']
+    return {
+        'count': count,
+        'failures': failures,
+        'submit_rate': round(count / submit_elapsed, 2) if submit_elapsed else None,
+        'throughput': round(count / elapsed, 2) if elapsed else None,
+        'elapsed': round(elapsed, 3),
+        'latency_ms': {
+            'enqueue_to_start': percentiles(queue_wait),
+            'start_to_finish': percentiles(execution),
+            'finish_to_fetch': percentiles(fetch_delay),
+            'end_to_end': percentiles(end_to_end),
+        },
+        'backend_calls': collector.backend_calls,
+        'memory_growth': memory_growth(memory_before, memory_after),
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """与基线对比：吞吐下降或端到端p50/p99上升超过容差即视为回退"""
+    regressions = []
+    for name, result in current['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base:
+            continue
+        if base.get('throughput') and result.get('throughput') \
+                and result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: 吞吐 {base['throughput']} -> {result['throughput']} 个/秒")
+        for key in ('p50', 'p99'):
+            old = base['latency_ms']['end_to_end'].get(key)
+            new = result['latency_ms']['end_to_end'].get(key)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f"{name}: 端到端{key} {old} -> {new} ms")
+    return regressions
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def spawn_redis(config_manager) -> Optional[subprocess.Popen]:
+    """在local_redis端口启动一个不落盘的redis-server作为本地替身"""
+    local_config = config_manager.get_local_redis_config()
+    port = local_config.get('port', 6379)
+    binary = shutil.which('redis-server')
+    if binary is None and local_config.get('path'):
+        binary = shutil.which('redis-server', path=local_config['path'])
+    if binary is None:
+        raise RuntimeError("未找到redis-server，请安装或在local_redis.path中配置所在目录")
+    process = subprocess.Popen([binary, '--port', str(port), '--save', '', '--appendonly', 'no'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.5)
+    print(f"🚀 已启动本地redis-server替身: 端口 {port}")
+    return process
+
+
+def print_result(name: str, result: Dict[str, Any]):
+    latency = result['latency_ms']
+    growth = result['memory_growth']
+    growth_text = '未知' if growth['bytes'] is None else f"{growth['bytes'] / 1024:.1f} KB"
+    keys_text = '未知' if growth['keys'] is None else growth['keys']
+    print(f"\n{name}  ({result['count']} 个, 失败 {result['failures']})")
+    print(f"  吞吐 {result['throughput']:>10} 个/秒    提交 {result['submit_rate']:>10} 个/秒")
+    for label, key in (('入队→开始', 'enqueue_to_start'), ('开始→完成', 'start_to_finish'),
+                       ('完成→取回', 'finish_to_fetch'), ('端到端', 'end_to_end')):
+        stats = latency[key]
+        if stats['count']:
+            print(f"  {label}  p50 {stats['p50']:>9} ms  p90 {stats['p90']:>9} ms  p99 {stats['p99']:>9} ms")
+    print(f"  内存增长 {growth_text}（{growth['kind']}，新增键 {keys_text}）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='任务负载测试与基准套件')
+    parser.add_argument('--transport', choices=['auto', 'memory', 'redis', 'local_redis'], default='auto',
+                        help='auto按配置探测；memory为进程内传输')
+    parser.add_argument('--spawn-redis', action='store_true', help='启动本地redis-server替身（使用local_redis端口）')
+    parser.add_argument('--tasks', help='只运行指定任务，逗号分隔')
+    parser.add_argument('--count', type=int, default=1000, help='add/multiply 的任务数')
+    parser.add_argument('--payload-count', type=int, default=100, help='每个负载大小的任务数')
+    parser.add_argument('--sizes', default='10,1000,100000', help='process_list/generate_random_numbers 的负载大小')
+    parser.add_argument('--long-count', type=int, default=4)
+    parser.add_argument('--long-duration', type=int, default=1)
+    parser.add_argument('--retry-count', type=int, default=10)
+    parser.add_argument('--retry-probability', type=float, default=0.3)
+    parser.add_argument('--rate', type=float, default=0, help='每秒提交任务数，0为不限速')
+    parser.add_argument('--concurrency', type=int, default=8, help='内嵌worker的线程数')
+    parser.add_argument('--prefetch-multiplier', type=int,
+                        help='内嵌worker的预取倍数（默认沿用配置；内存传输默认0即不限）')
+    parser.add_argument('--memoize', action='store_true', help='允许确定性任务命中结果记忆')
+    parser.add_argument('--timeout', type=float, default=600, help='单个场景的超时（秒）')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON结果文件')
+    parser.add_argument('--compare', help='基线JSON文件，发现回退时返回码为1')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='回退判定容差（比例）')
+    args = parser.parse_args()
+
+    import celery_app
+
+    config_manager = celery_app.config_manager
+    redis_process = None
+    if args.spawn_redis:
+        redis_process = spawn_redis(config_manager)
+        args.transport = 'local_redis'
+    if args.transport != 'auto':
+        config_manager.force_backend(args.transport)
+
+    from celery import signals
+    from celery.contrib.testing.worker import start_worker
+
+    app = celery_app.app
+    resolved = config_manager.resolve_backend()
+    if resolved['type'] == 'memory':
+        # 内存传输默认每秒轮询一次队列，且没有事件循环：预取额度用完后worker要等到
+        # drain_events 超时（2秒）才继续取消息，两者都会掩盖任务本身的时延
+        app.conf.broker_transport_options = dict(app.conf.broker_transport_options or {}, polling_interval=0.005)
+        if args.prefetch_multiplier is None:
+            args.prefetch_multiplier = 0
+    if args.prefetch_multiplier is not None:
+        app.conf.worker_prefetch_multiplier = args.prefetch_multiplier
+    timeline = TaskTimeline()
+    signals.task_prerun.connect(timeline.on_prerun, weak=False)
+    signals.task_postrun.connect(timeline.on_postrun, weak=False)
+
+    queues = [app.conf.task_default_queue]
+    for route in app.conf.task_routes.values():
+        if route['queue'] not in queues:
+            queues.append(route['queue'])
+
+    print("任务负载测试与基准套件")
+    print("=" * 60)
+    print(f"后端: {resolved['type']}  worker: threads x {args.concurrency}  "
+          f"预取倍数: {app.conf.worker_prefetch_multiplier}  速率: {args.rate or '不限'}")
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'transport': resolved['type'],
+            'concurrency': args.concurrency,
+            'rate': args.rate,
+            'args': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        },
+        'scenarios': {},
+    }
+
+    try:
+        with start_worker(app, pool='threads', concurrency=args.concurrency, loglevel='error',
+                          perform_ping_check=False, queues=queues, shutdown_timeout=30):
+            for scenario in build_scenarios(args):
+                result = run_scenario(app, config_manager, timeline, scenario, args.rate, args.timeout,
+                                      args.memoize)
+                report['scenarios'][scenario['name']] = result
+                print_result(scenario['name'], result)
+    finally:
+        if redis_process is not None:
+            redis_process.terminate()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ 结果已写入: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('transport') != resolved['type']:
+            print(f"⚠️  基线使用的后端为 {baseline.get('meta', {}).get('transport')}，与本次不同，对比结果仅供参考")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ 相对 {args.compare} 发现 {len(regressions)} 项性能回退:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print(f"✅ 与 {args.compare} 相比无性能回退（容差 {args.tolerance:.0%}）")
+
+
+if __name__ == '__main__':
+    main()
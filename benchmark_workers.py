@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+worker并发模型对比基准测试
+在同一混合负载（若干 long_running_task + 大量 add）下对比：
+- 原方式：单个 --pool=solo worker 消费 celery,math,long_tasks
+- 按队列启动（worker_launcher，config.json 的 worker_profiles）
+报告 add 的吞吐和全部完成耗时
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+from celery_app import app, config_manager
+from bulk import submit_many
+from result_collector import ResultCollector
+from tasks import add, long_running_task
+from worker_launcher import build_profiles, launch, stop, worker_env
+
+
+def start_solo():
+    command = [sys.executable, '-m', 'celery', '-A', 'celery_app', 'worker', '--pool=solo',
+               '--queues=celery,math,long_tasks', '--hostname=solo@%h', '--loglevel=warning']
+    return {'solo': subprocess.Popen(command, env=worker_env())}
+
+
+def start_profiles():
+    profiles = build_profiles(config_manager.get_worker_profiles(), app.conf.task_routes,
+                              app.conf.task_default_queue)
+    return launch(profiles, loglevel='warning')
+
+
+def wait_for_workers(expected, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        replies = app.control.ping(timeout=1) or []
+        if len(replies) >= expected:
+            return
+    raise RuntimeError("worker未在规定时间内启动")
+
+
+def run_workload(long_tasks, long_duration, adds):
+    """先提交长任务，再提交加法，统计加法完成情况"""
+    long_results = submit_many(long_running_task, [(long_duration,)] * long_tasks)
+    start = time.perf_counter()
+    handle = submit_many(add, [(i, i) for i in range(adds)], memoize=False)
+    for _ in ResultCollector(handle.ids, app=app).iter(timeout=600):
+        pass
+    add_elapsed = time.perf_counter() - start
+    for _ in ResultCollector(long_results.ids, app=app).iter(timeout=600):
+        pass
+    total_elapsed = time.perf_counter() - start
+    return add_elapsed, total_elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='solo 与按队列worker配置的吞吐对比')
+    parser.add_argument('--adds', type=int, default=2000)
+    parser.add_argument('--long-tasks', type=int, default=4)
+    parser.add_argument('--long-duration', type=int, default=3)
+    args = parser.parse_args()
+
+    print("worker并发模型对比")
+    print("=" * 60)
+    print(f"负载: {args.long_tasks} x long_running_task({args.long_duration}) + {args.adds} x add")
+
+    for label, starter in (('solo（原方式）', start_solo), ('按队列配置', start_profiles)):
+        processes = starter()
+        try:
+            wait_for_workers(len(processes))
+            add_elapsed, total_elapsed = run_workload(args.long_tasks, args.long_duration, args.adds)
+            print(f"\n{label}")
+            print(f"  add 全部完成: {add_elapsed:8.2f} s  ({args.adds / add_elapsed:8.0f} 个/秒)")
+            print(f"  全部完成:     {total_elapsed:8.2f} s")
+        finally:
+            stop(processes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+工作流延迟基准测试
+对比客户端逐步驱动（每步 .get() 后再提交下一步）与服务端流水线（chain/chord）的端到端延迟
+需要先启动worker: celery -A celery_app worker -Q celery,math,long_tasks
+"""
+
+import argparse
+import statistics
+import time
+
+from tasks import add, multiply, generate_random_numbers, process_list
+from workflows import random_numbers_pipeline, arithmetic_pipeline
+
+TIMEOUT = 30
+
+
+def without_memo(signature):
+    """流水线中的每个任务签名都关闭结果记忆，两种方式都实际执行每一步"""
+    # chain() 实际返回 _chain，按签名类型而不是类判断
+    subtask_type = signature.get('subtask_type')
+    if subtask_type in ('chain', 'group', 'chord'):
+        for task in signature.tasks:
+            without_memo(task)
+        if subtask_type == 'chord':
+            without_memo(signature.body)
+    else:
+        signature.set(memoize=False)
+    return signature
+
+
+# 确定性任务（add/multiply/process_list）关闭提交去重和worker上的结果复用，每次都实际发送并执行
+
+def client_random_numbers():
+    numbers = generate_random_numbers.delay(8).get(timeout=TIMEOUT)
+    return process_list.apply_async((numbers,), memoize=False).get(timeout=TIMEOUT)
+
+
+def client_arithmetic():
+    result1 = add.apply_async((10, 20), memoize=False).get(timeout=TIMEOUT)
+    result2 = multiply.apply_async((result1, 2), memoize=False).get(timeout=TIMEOUT)
+    return process_list.apply_async(([result1, result2, 100],), memoize=False).get(timeout=TIMEOUT)
+
+
+def server_random_numbers():
+    return without_memo(random_numbers_pipeline(8)).apply_async().get(timeout=TIMEOUT)
+
+
+def server_arithmetic():
+    return without_memo(arithmetic_pipeline(10, 20, 2)).apply_async().get(timeout=TIMEOUT)
+
+
+def measure(func, runs):
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='工作流延迟基准测试')
+    parser.add_argument('--runs', type=int, default=20, help='每种方式的执行次数')
+    args = parser.parse_args()
+
+    print("工作流延迟基准测试（毫秒）")
+    print("=" * 60)
+
+    # 校验两种方式结果一致
+    assert client_arithmetic() == server_arithmetic(), "客户端与服务端流水线结果不一致"
+
+    cases = [
+        ('生成随机数 -> 处理列表', client_random_numbers, server_random_numbers),
+        ('加法 -> 乘法 -> 数据处理', client_arithmetic, server_arithmetic),
+    ]
+    for name, client_func, server_func in cases:
+        print(f"\n{name}")
+        for label, func in (('客户端驱动', client_func), ('服务端流水线', server_func)):
+            latencies = sorted(measure(func, args.runs))
+            p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+            print(f"  {label:<8} 中位数 {statistics.median(latencies):8.1f}   p95 {p95:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
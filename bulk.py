@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+批量任务提交模块
+通过同一个生产者连接，按批次以Redis pipeline发送任务消息，
+避免 .delay() 循环中每条消息一次往返
+"""
+
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any, Iterable, List, Optional, Tuple
+
+from celery.result import ResultSet
+
+from priority import resolve_priority
+
+# 当前线程是否处于批量提交中
+_state = threading.local()
+
+
+class BulkSubmission:
+    """批量提交的轻量句柄，只保存任务ID，需要时才创建AsyncResult"""
+
+    def __init__(self, app, task_ids: List[str], results: Optional[list] = None):
+        self.app = app
+        self.ids = task_ids
+        self._results = results
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    @property
+    def results(self):
+        """按提交顺序的AsyncResult列表"""
+        if self._results is None:
+            self._results = [self.app.AsyncResult(task_id) for task_id in self.ids]
+        return self._results
+
+    def ready(self) -> bool:
+        return ResultSet(self.results, app=self.app).ready()
+
+    def completed_count(self) -> int:
+        return ResultSet(self.results, app=self.app).completed_count()
+
+    def get(self, timeout: Optional[float] = None, propagate: bool = True) -> List[Any]:
+        """按提交顺序返回所有结果"""
+        # 确定性任务去重后多个条目可能共用同一任务ID，只等待一次
+        unique_ids = list(dict.fromkeys(self.ids))
+        if len(unique_ids) == len(self.ids):
+            return ResultSet(self.results, app=self.app).get(timeout=timeout, propagate=propagate)
+        by_id = {result.id: result for result in self.results}
+        values = ResultSet([by_id[task_id] for task_id in unique_ids], app=self.app).get(
+            timeout=timeout, propagate=propagate)
+        value_by_id = dict(zip(unique_ids, values))
+        return [value_by_id[task_id] for task_id in self.ids]
+
+    def collect(self, **kwargs):
+        """按完成顺序收集结果的收集器（批量MGET，见 result_collector）"""
+        from result_collector import ResultCollector
+        return ResultCollector(self.ids, app=self.app, **kwargs)
+
+    def revoke(self, terminate: bool = False):
+        self.app.control.revoke(self.ids, terminate=terminate)
+
+
+def _split_call(item) -> Tuple[tuple, dict]:
+    """把一个输入元素转换为 (args, kwargs)：元组/列表为位置参数，字典为关键字参数"""
+    if isinstance(item, dict):
+        return (), item
+    if isinstance(item, (tuple, list)):
+        return tuple(item), {}
+    return (item,), {}
+
+
+@contextmanager
+def _pipelined(producer):
+    """
+    让kombu Redis通道在本上下文内把所有写操作放入同一个pipeline，
+    退出时一次性执行；非Redis传输原样使用同一个生产者
+    """
+    channel = producer.channel
+    if not hasattr(channel, 'conn_or_acquire') or not hasattr(channel, 'pool'):
+        yield
+        return
+
+    pipe = channel.Client(connection_pool=channel.pool).pipeline(transaction=False)
+
+    @contextmanager
+    def conn_or_acquire(client=None):
+        yield client or pipe
+
+    channel.conn_or_acquire = conn_or_acquire
+    try:
+        yield
+        pipe.execute()
+    finally:
+        del channel.conn_or_acquire
+        pipe.reset()
+
+
+@contextmanager
+def _deferred_result_subscription(app):
+    """
+    批量提交时跳过结果后端对每个任务的订阅（Redis后端每个任务一次SUBSCRIBE），
+    等待结果时后端会重新订阅并先读取一次当前状态，因此不会丢失结果
+    """
+    backend = app.backend
+    if not getattr(backend, '_bulk_deferrable', False):
+        original = backend.on_task_call
+
+        def on_task_call(producer, task_id):
+            if getattr(_state, 'deferring', False):
+                return
+            return original(producer, task_id)
+
+        backend.on_task_call = on_task_call
+        backend._bulk_deferrable = True
+
+    _state.deferring = True
+    try:
+        yield
+    finally:
+        _state.deferring = False
+
+
+def submit_many(task, iterable_of_args: Iterable[Any], batch_size: int = 500,
+                **options) -> BulkSubmission:
+    """
+    批量提交任务
+
+    iterable_of_args 的每个元素是一组位置参数（元组/列表）、关键字参数（字典）
+    或单个参数。每 batch_size 条消息通过一次pipeline发送到消息代理。
+    其余关键字参数会传给 apply_async（如 queue、countdown）；
+    priority 可以是级别名称（如 'bulk'），作用于整批任务。
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size 必须大于0")
+    if options.get('priority') is not None:
+        options['priority'] = resolve_priority(options['priority'])
+
+    app = task.app
+    task_ids: List[str] = []
+    items = iter(iterable_of_args)
+
+    if app.conf.task_always_eager:
+        # 同步模式下结果不写入后端，直接保留EagerResult
+        results = []
+        for item in items:
+            args, kwargs = _split_call(item)
+            results.append(task.apply_async(args, kwargs, **options))
+        return BulkSubmission(app, [r.id for r in results], results=results)
+
+    with app.producer_or_acquire() as producer, _deferred_result_subscription(app):
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                break
+            with _pipelined(producer):
+                for item in batch:
+                    args, kwargs = _split_call(item)
+                    # 确定性任务去重时返回的是已有任务的ID
+                    result = task.apply_async(args, kwargs, producer=producer, **options)
+                    task_ids.append(result.id)
+
+    return BulkSubmission(app, task_ids)
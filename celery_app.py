@@ -1,54 +1,74 @@
 from celery import Celery
 import os
 from config_manager import ConfigManager
+from serializers import SERIALIZER_NAME, SerializerAnnotation, register_numpack
+from claim_check import SERIALIZER_NAME as CLAIM_CHECK_SERIALIZER, register_claim_check
+import endpoints
+import live_config
+import local_executor
+import metrics
+import priority
+import result_store
+import task_events
+import task_log
 
-# 创建Celery应用实例
-app = Celery('demo')
+# 创建Celery应用实例（默认任务基类执行前做集群级令牌桶限流）
+app = Celery('demo', task_cls='rate_limit:RateLimitedTask')
 
 # 创建配置管理器
 config_manager = ConfigManager()
 
-# 测试Redis连接并获取配置
-success, message, redis_client = config_manager.test_redis_connection()
-print(message)
-
-if success:
-    # 使用配置文件中的Redis设置
-    broker_url = config_manager.get_broker_url()
-    result_backend = config_manager.get_result_backend_url()
-    redis_config = config_manager.get_redis_config()
-    redis_type = redis_config.get('type', 'redis')
-    print(f"使用{redis_type}作为消息代理和结果后端")
-else:
-    # 尝试本地Redis作为备选
-    try:
-        import redis
-        r = redis.Redis(host='localhost', port=6379, db=0)
-        r.ping()
-        broker_url = 'redis://localhost:6379/0'
-        result_backend = 'redis://localhost:6379/0'
-        print("使用本地Redis作为消息代理和结果后端")
-    except:
-        # 最后使用内存传输
-        broker_url = 'memory://'
-        result_backend = 'cache+memory://'
-        print("Redis不可用，使用内存传输（仅适用于单进程演示）")
+
+def _resolve_backend_settings():
+    """首次读取配置时才解析消息代理和结果后端，避免导入时探测网络"""
+    resolved = config_manager.resolve_backend()
+    print(resolved['message'])
+    return {
+        'broker_url': resolved['broker_url'],
+        'result_backend': result_store.backend_url(resolved['result_backend'],
+                                                   config_manager.get_result_store_config()),
+    }
+
+# 延迟解析消息代理和结果后端（Celery在首次访问配置时调用）
+app.add_defaults(_resolve_backend_settings)
 
 # 获取Celery配置
 celery_config = config_manager.get_celery_config()
 
+# 注册numpack二进制序列化器（可按任务/队列在config.json中选择）
+serialization_config = config_manager.get_serialization_config()
+register_numpack(serialization_config)
+# 注册claimcheck序列化器：大负载写入旁路存储，消息中只携带引用
+register_claim_check(config_manager.get_claim_check_config(), config_manager.get_backend_redis_client)
+accept_content = list(celery_config.get('accept_content', ['json']))
+for serializer_name in (SERIALIZER_NAME, CLAIM_CHECK_SERIALIZER):
+    if serializer_name not in accept_content:
+        accept_content.append(serializer_name)
+
+# 任务路由
+task_routes = {
+    'tasks.add': {'queue': 'math'},
+    'tasks.multiply': {'queue': 'math'},
+    'tasks.add_many': {'queue': 'math'},
+    'tasks.multiply_many': {'queue': 'math'},
+    'tasks.partial_stats': {'queue': 'math'},
+    'tasks.long_running_task': {'queue': 'long_tasks'},
+}
+# 未路由任务使用的队列
+task_default_queue = celery_config.get('task_default_queue', 'celery')
+
+# 任务注解：按任务/队列选择消息序列化器（下面的模块再追加各自的注解）
+# 注意：导入时只写app.conf不读app.conf，读取会提前解析消息代理和结果后端
+task_annotations = [SerializerAnnotation(serialization_config, task_routes)]
+
 # 配置Celery
 app.conf.update(
-    # 动态选择消息代理
-    broker_url=broker_url,
-    # 动态选择结果后端
-    result_backend=result_backend,
     # 任务序列化格式
     task_serializer=celery_config.get('task_serializer', 'json'),
     # 结果序列化格式
     result_serializer=celery_config.get('result_serializer', 'json'),
     # 接受的内容类型
-    accept_content=celery_config.get('accept_content', ['json']),
+    accept_content=accept_content,
     # 结果过期时间（秒）
     result_expires=celery_config.get('result_expires', 3600),
     # 时区设置
@@ -56,16 +76,46 @@ app.conf.update(
     # 启用UTC
     enable_utc=celery_config.get('enable_utc', True),
     # 任务路由
-    task_routes={
-        'tasks.add': {'queue': 'math'},
-        'tasks.multiply': {'queue': 'math'},
-        'tasks.long_running_task': {'queue': 'long_tasks'},
-    },
+    task_routes=task_routes,
+    task_default_queue=task_default_queue,
     # 工作进程配置
-    worker_prefetch_multiplier=celery_config.get('worker_prefetch_multiplier', 1),
+    # worker_launcher按队列配置的预取倍数通过环境变量传入（0表示不限制预取）
+    worker_prefetch_multiplier=int(os.environ.get('CELERY_WORKER_PREFETCH_MULTIPLIER',
+                                                  celery_config.get('worker_prefetch_multiplier', 1))),
     task_acks_late=celery_config.get('task_acks_late', True),
+    # 连接池设置（与ConfigManager共享连接池使用同一份connection_pool配置）
+    **config_manager.get_celery_pool_settings(),
 )
 
+# 队列内优先级通道（按任务/队列的默认级别通过注解设置），worker启动时开启防饥饿老化提升
+priority_annotation = priority.install(app, config_manager, task_routes, task_default_queue)
+if priority_annotation is not None:
+    task_annotations.append(priority_annotation)
+
+# 按任务的结果存储策略（不存储/只存失败/自定义过期时间），worker中结果批量写入
+result_policy_annotation = result_store.install(app, config_manager, task_routes, task_default_queue)
+if result_policy_annotation is not None:
+    task_annotations.append(result_policy_annotation)
+app.conf.task_annotations = task_annotations
+
+# 连接指标埋点信号（worker启动时开启本地指标端点，须在序列化器注册之后）
+metrics.install(app, config_manager)
+
+# 聚合任务事件：按间隔写出按任务/队列的汇总，代替逐任务的事件消息（python task_events.py 查看）
+task_events.install(app, config_manager)
+
+# 多端点模式：端点切换时重新排序消息代理URL、重置生产者连接池并让worker消费者重连
+endpoints.install(app, config_manager)
+
+# 任务日志：后台批量写出，按任务采样
+task_log.configure(config_manager.get_task_logging_config())
+
+# 本地并发执行模式（local_executor.enabled）：首次发送任务时在本进程内嵌worker
+local_executor.install(app, config_manager)
+
+# 配置热更新：worker检查本机配置文件和推送配置，预取/池大小/结果过期/限流规则在线生效
+live_config.install(app, config_manager)
+
 # 手动导入任务模块
 try:
     from tasks import *
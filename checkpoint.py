@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+长任务断点续跑与协作式取消模块
+task_acks_late=True 时worker崩溃或重启会让消息重新投递，任务ID不变；
+绑定任务通过 Checkpoint 把循环状态按 interval 秒写入Redis（带TTL），
+重新投递后 load() 取回最近一次的状态，从断点继续而不是从头开始：
+
+    with Checkpoint(self) as checkpoint:
+        state = checkpoint.load({'i': 0})
+        for i in range(state['i'], n):
+            ...
+            checkpoint.step({'i': i + 1})
+
+step() 同时检查取消和worker关闭：
+- 取消：python checkpoint.py --cancel <任务ID>（或 request_cancel）写入取消标记，
+  也识别本进程收到的 revoke（不带terminate），任务在下一次检查时结束，状态记为REVOKED
+- worker热关闭（threads/solo池）：立即保存断点并把消息退回队列，由其他worker接着执行；
+  prefork子进程收不到关闭信号，照常执行到结束
+任务成功结束或被取消时删除断点；抛出异常时保留，重试（任务ID不变）时同样从断点继续。
+状态需可JSON序列化。使用内存传输时不保存断点，只支持revoke取消。
+"""
+
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from celery import signals
+from celery.exceptions import Ignore, Reject
+from celery.worker import state as worker_state
+
+import metrics
+from celery_app import config_manager
+
+_checkpoint_config = config_manager.get_checkpoint_config()
+_shutting_down = threading.Event()
+
+
+class TaskCancelled(Exception):
+    """任务在检查点处被协作式取消"""
+
+
+def checkpoint_key(task_id: str) -> str:
+    return f"{_checkpoint_config['key_prefix']}{task_id}"
+
+
+def cancel_key(task_id: str) -> str:
+    return f"{_checkpoint_config['key_prefix']}cancel:{task_id}"
+
+
+def _count(event: str):
+    if metrics.registry is not None:
+        metrics.registry.inc('celery_checkpoint_total', (('event', event),))
+
+
+class Checkpoint:
+    """
+    绑定任务的断点保存器
+
+    step() 可以每次迭代调用：距上次保存不足 interval 的状态只保留在内存中，
+    取消标记按 cancel_check_interval 节流检查，热路径上只有时间比较。
+    """
+
+    def __init__(self, task, interval: Optional[float] = None):
+        self.task = task
+        self.task_id = task.request.id
+        self.interval = _checkpoint_config['interval'] if interval is None else interval
+        self.cancel_check_interval = _checkpoint_config['cancel_check_interval']
+        self.ttl = _checkpoint_config['ttl']
+
+        # 直接调用（非worker执行）时没有任务ID，不保存
+        self.client = config_manager.get_backend_redis_client() \
+            if self.task_id and _checkpoint_config['enabled'] else None
+        self.key = checkpoint_key(self.task_id) if self.task_id else None
+
+        self.state: Any = None
+        self.resumed = False
+        self.saves = 0
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._last_cancel_check = float('-inf')
+
+    def load(self, default: Any = None) -> Any:
+        """取回上次保存的状态，没有断点时返回default"""
+        self.state = default
+        if self.client is None:
+            return default
+        try:
+            payload = self.client.get(self.key)
+        except Exception as e:
+            print(f"⚠️  读取断点失败，从头开始: {e}")
+            return default
+        if payload is None:
+            return default
+        saved = json.loads(payload)
+        self.state = saved['state']
+        self.resumed = True
+        _count('resumed')
+        print(f"🔄 任务 {self.task_id} 从断点继续（{time.time() - saved['saved_at']:.0f}秒前保存）: {self.state}")
+        return self.state
+
+    def save(self, state: Any = None, force: bool = False) -> bool:
+        """记录状态，距上次保存达到 interval（或force）时写入Redis；返回是否写入"""
+        if state is not None:
+            self.state = state
+            self._dirty = True
+        now = time.monotonic()
+        if not self._dirty or (not force and now - self._last_save < self.interval):
+            return False
+        self._last_save = now
+        self._dirty = False
+        if self.client is None:
+            return False
+        try:
+            self.client.set(self.key, json.dumps({'state': self.state, 'saved_at': time.time()}),
+                            ex=self.ttl)
+        except Exception as e:
+            # 断点写入失败不影响任务本身
+            print(f"⚠️  断点保存失败: {e}")
+            return False
+        self.saves += 1
+        _count('saved')
+        return True
+
+    def cancelled(self) -> bool:
+        """是否已请求取消（取消标记按间隔节流检查）"""
+        if not self.task_id:
+            return False
+        if self.task_id in worker_state.revoked:
+            return True
+        now = time.monotonic()
+        if self.client is None or now - self._last_cancel_check < self.cancel_check_interval:
+            return False
+        self._last_cancel_check = now
+        try:
+            return bool(self.client.exists(cancel_key(self.task_id)))
+        except Exception:
+            return False
+
+    def step(self, state: Any = None):
+        """记录状态并检查取消/worker关闭，需要停止时抛出异常"""
+        self.save(state)
+        if self.cancelled():
+            raise TaskCancelled(self.task_id)
+        if _shutting_down.is_set() and self.task_id:
+            self.save(force=True)
+            _count('requeued')
+            print(f"🔄 worker正在关闭，任务 {self.task_id} 已保存断点并退回队列")
+            raise Reject('worker正在关闭，从断点继续', requeue=True)
+
+    def clear(self):
+        if self.client is None:
+            return
+        try:
+            self.client.delete(self.key, cancel_key(self.task_id))
+        except Exception as e:
+            print(f"⚠️  删除断点失败: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.clear()
+        elif issubclass(exc_type, TaskCancelled):
+            self.clear()
+            _count('cancelled')
+            print(f"🛑 任务 {self.task_id} 已取消（停在 {self.state}）")
+            self.task.backend.mark_as_revoked(self.task_id, reason=f'cancelled at {self.state}',
+                                              request=self.task.request)
+            raise Ignore()
+        elif not issubclass(exc_type, Reject):
+            # 任务失败：保留最新状态，重试时从这里继续
+            self.save(force=True)
+        return False
+
+
+def request_cancel(task_id: str) -> bool:
+    """请求协作式取消（任务在下一次检查点结束）；使用内存传输时返回False"""
+    client = config_manager.get_backend_redis_client()
+    if client is None:
+        return False
+    client.set(cancel_key(task_id), 1, ex=_checkpoint_config['ttl'])
+    return True
+
+
+def get_checkpoint(task_id: str) -> Optional[Dict[str, Any]]:
+    """任务最近一次保存的断点（state, saved_at）"""
+    client = config_manager.get_backend_redis_client()
+    if client is None:
+        return None
+    payload = client.get(checkpoint_key(task_id))
+    return None if payload is None else json.loads(payload)
+
+
+@signals.worker_shutting_down.connect
+def _on_worker_shutting_down(sig=None, how=None, **kwargs):
+    # 只在热关闭时让任务退回队列，冷关闭时未确认的消息本来就会被恢复
+    if how == 'Warm' and _checkpoint_config['requeue_on_shutdown']:
+        _shutting_down.set()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='查看任务断点或请求取消')
+    parser.add_argument('task_id')
+    parser.add_argument('--cancel', action='store_true', help='请求在下一个检查点取消任务')
+    args = parser.parse_args()
+
+    if args.cancel:
+        if request_cancel(args.task_id):
+            print(f"✅ 已请求取消任务 {args.task_id}")
+        else:
+            print("❌ 当前使用内存传输，无法写入取消标记")
+        return
+    saved = get_checkpoint(args.task_id)
+    if saved is None:
+        print(f"任务 {args.task_id} 没有断点")
+    else:
+        print(f"断点（{time.time() - saved['saved_at']:.0f}秒前保存）: {json.dumps(saved['state'], ensure_ascii=False)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+大负载旁路存储模块（Claim-Check）
+注册kombu序列化器 claimcheck：先用内层序列化器（默认numpack）编码，
+超过阈值的负载写入旁路存储（Redis键或本地/共享目录文件，均带过期时间），
+消息和结果中只携带引用；worker在解码任务消息时才读取负载（文件使用mmap）
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from kombu.serialization import dumps as kombu_dumps, loads as kombu_loads, register
+
+SERIALIZER_NAME = 'claimcheck'
+CONTENT_TYPE = 'application/x-claimcheck'
+
+# 负载首字节：内联 / 引用
+FLAG_INLINE = b'\x00'
+FLAG_REFERENCE = b'\x01'
+
+KEY_PREFIX = 'celery-claim-check:'
+
+# 引用键是负载的SHA-256十六进制摘要
+_KEY_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+
+class RedisPayloadStore:
+    """Redis旁路存储，过期由键的TTL负责"""
+
+    name = 'redis'
+
+    def __init__(self, client, ttl: int):
+        self.client = client
+        self.ttl = ttl
+
+    def put(self, key: str, data: bytes):
+        # 按内容寻址：相同负载只写一次，再次引用时延长过期时间
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(KEY_PREFIX + key, data, ex=self.ttl, nx=True)
+        pipe.expire(KEY_PREFIX + key, self.ttl)
+        pipe.execute()
+
+    def get(self, key: str):
+        data = self.client.get(KEY_PREFIX + key)
+        if data is None:
+            raise KeyError(f"旁路负载已过期或不存在: {key}")
+        return data
+
+    def cleanup(self) -> int:
+        return 0
+
+
+class FilePayloadStore:
+    """文件旁路存储（本地或共享目录），读取时内存映射，定期清理过期文件"""
+
+    name = 'file'
+
+    def __init__(self, directory: str, ttl: int, cleanup_interval: float = 300):
+        self.directory = directory
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        # 键来自消息内容，不是摘要格式（如包含路径分隔符、..）时拒绝，不能读写目录之外的文件
+        if not isinstance(key, str) or not _KEY_PATTERN.fullmatch(key):
+            raise ValueError(f"无效的旁路负载引用: {key!r}")
+        return os.path.join(self.directory, key)
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        if os.path.exists(path):
+            # 已存在则只刷新修改时间，延长过期
+            os.utime(path)
+        else:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp_')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        self._maybe_cleanup()
+
+    def get(self, key: str):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            raise KeyError(f"旁路负载已过期或不存在: {key}")
+
+    def _maybe_cleanup(self):
+        now = time.time()
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        with self._lock:
+            if now - self._last_cleanup < self.cleanup_interval:
+                return
+            self._last_cleanup = now
+        self.cleanup()
+
+    def cleanup(self) -> int:
+        """删除超过TTL的文件，返回删除数量"""
+        expire_before = time.time() - self.ttl
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < expire_before:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+class ClaimCheckSerializer:
+    """包装内层序列化器，超过阈值的负载写入旁路存储"""
+
+    def __init__(self, store, inner: str, threshold: int):
+        self.store = store
+        self.inner = inner
+        self.threshold = threshold
+        self.offloaded = 0
+        self.offloaded_bytes = 0
+
+    @staticmethod
+    def _header(content_type: str) -> bytes:
+        header = content_type.encode('ascii')
+        return struct.pack('B', len(header)) + header
+
+    def dumps(self, obj) -> bytes:
+        content_type, _, data = kombu_dumps(obj, serializer=self.inner)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        header = self._header(content_type)
+
+        if len(data) < self.threshold:
+            return FLAG_INLINE + header + data
+
+        key = hashlib.sha256(data).hexdigest()
+        self.store.put(key, data)
+        self.offloaded += 1
+        self.offloaded_bytes += len(data)
+        reference = json.dumps({'store': self.store.name, 'key': key, 'size': len(data)})
+        return FLAG_REFERENCE + header + reference.encode('ascii')
+
+    def loads(self, data) -> Any:
+        view = memoryview(data)
+        flag = bytes(view[:1])
+        header_len = view[1]
+        content_type = bytes(view[2:2 + header_len]).decode('ascii')
+        body = view[2 + header_len:]
+
+        # 内层负载一律按字节交给对应的解码器
+        if flag == FLAG_INLINE:
+            return kombu_loads(body, content_type, 'binary')
+
+        reference = json.loads(bytes(body))
+        payload = self.store.get(reference['key'])
+        try:
+            return kombu_loads(memoryview(payload), content_type, 'binary')
+        finally:
+            if isinstance(payload, mmap.mmap):
+                try:
+                    payload.close()
+                except BufferError:
+                    # 解码结果仍引用映射内存时由GC释放
+                    pass
+
+
+def create_store(claim_config: Dict[str, Any], redis_client=None):
+    """根据配置创建旁路存储；Redis不可用时使用文件存储"""
+    ttl = claim_config.get('ttl', 86400)
+    if claim_config.get('store', 'redis') == 'redis' and redis_client is not None:
+        return RedisPayloadStore(redis_client, ttl)
+    directory = claim_config.get('directory') or os.path.join(tempfile.gettempdir(), 'celery_claim_check')
+    return FilePayloadStore(directory, ttl, claim_config.get('cleanup_interval', 300))
+
+
+class _LazyClaimCheck:
+    """延迟创建旁路存储，避免导入时连接Redis"""
+
+    def __init__(self, claim_config: Dict[str, Any], client_factory):
+        self.claim_config = claim_config
+        self.client_factory = client_factory
+        self.serializer: Optional[ClaimCheckSerializer] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> ClaimCheckSerializer:
+        if self.serializer is None:
+            with self._lock:
+                if self.serializer is None:
+                    client = None
+                    if self.claim_config.get('store', 'redis') == 'redis':
+                        client = self.client_factory()
+                    self.serializer = ClaimCheckSerializer(
+                        create_store(self.claim_config, client),
+                        self.claim_config.get('inner_serializer', 'numpack'),
+                        self.claim_config.get('threshold', 262144)
+                    )
+        return self.serializer
+
+    def dumps(self, obj):
+        return self.get().dumps(obj)
+
+    def loads(self, data):
+        return self.get().loads(data)
+
+
+_claim_check: Optional[_LazyClaimCheck] = None
+
+
+def register_claim_check(claim_config: Dict[str, Any], client_factory):
+    """注册claimcheck序列化器；client_factory 返回Redis客户端或None"""
+    global _claim_check
+    _claim_check = _LazyClaimCheck(claim_config, client_factory)
+    register(SERIALIZER_NAME, _claim_check.dumps, _claim_check.loads,
+             content_type=CONTENT_TYPE, content_encoding='binary')
+
+
+def get_claim_check() -> Optional[ClaimCheckSerializer]:
+    """当前进程的claimcheck序列化器（用于查看统计或手动清理）"""
+    return _claim_check.get() if _claim_check else None
+
+
+def main():
+    """清理过期的旁路负载文件"""
+    from celery_app import config_manager
+    claim_config = config_manager.get_claim_check_config()
+    store = create_store(dict(claim_config, store='file'))
+    print(f"清理旁路存储目录: {store.directory}")
+    print(f"已删除 {store.cleanup()} 个过期文件")
+
+
+if __name__ == '__main__':
+    main()
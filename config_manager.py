@@ -6,17 +6,158 @@
 支持阿里云Tair、本地Redis等多种配置
 """
 
+import hashlib
 import json
 import os
+import tempfile
+import threading
+import time
 import redis
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple
+
+# 进程级共享的Redis连接池，按连接参数区分
+_shared_pools: Dict[str, "InstrumentedConnectionPool"] = {}
+_shared_pools_lock = threading.Lock()
+
+
+def _reset_shared_pools():
+    """fork后在子进程中丢弃父进程的连接池，首次使用时重新创建"""
+    global _shared_pools_lock
+    _shared_pools.clear()
+    _shared_pools_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_shared_pools)
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """带统计信息的阻塞连接池，连接数达到上限时等待而不是新建连接"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._acquire_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._errors = 0
+    
+    def get_connection(self, command_name, *keys, **options):
+        """获取连接并记录等待耗时（包含新建连接的耗时）"""
+        start = time.perf_counter()
+        try:
+            return super().get_connection(command_name, *keys, **options)
+        except redis.ConnectionError:
+            with self._stats_lock:
+                self._errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self._acquire_count += 1
+                self._wait_total += elapsed
+                self._wait_max = max(self._wait_max, elapsed)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池统计：使用中、空闲、等待耗时"""
+        created = len(self._connections)
+        idle = sum(1 for conn in list(self.pool.queue) if conn is not None)
+        with self._stats_lock:
+            acquire_count = self._acquire_count
+            wait_total = self._wait_total
+            wait_max = self._wait_max
+            errors = self._errors
+        return {
+            'pid': self.pid,
+            'max_connections': self.max_connections,
+            'created': created,
+            'in_use': created - idle,
+            'idle': idle,
+            'acquire_count': acquire_count,
+            'acquire_errors': errors,
+            'wait_avg_ms': (wait_total / acquire_count * 1000) if acquire_count else 0.0,
+            'wait_max_ms': wait_max * 1000
+        }
+
+
+_NUMBER = (int, float)
+
+# 配置结构校验：块 -> {键: 允许的类型}；未列出的块和键不校验
+CONFIG_SCHEMA: Dict[str, Dict[str, Any]] = {
+    "redis": {"host": str, "port": int, "db": int, "password": (str, type(None)), "ssl": bool,
+              "connection_pool": dict},
+    "local_redis": {"host": str, "port": int, "db": int},
+    "celery": {"task_serializer": str, "result_serializer": str, "accept_content": list, "result_expires": int,
+               "timezone": str, "enable_utc": bool, "worker_prefetch_multiplier": int, "task_acks_late": bool},
+    "worker_profiles": {},
+    "rate_limits": {"enabled": bool, "key_prefix": str, "max_defer": _NUMBER, "jitter": _NUMBER,
+                    "tasks": dict, "queues": dict},
+    "live_config": {"enabled": bool, "interval": _NUMBER, "key": str},
+}
+
+
+def validate_config(config: Any) -> List[str]:
+    """按CONFIG_SCHEMA校验配置，返回错误列表（为空表示通过）"""
+    if not isinstance(config, dict):
+        return ["配置文件顶层必须是对象"]
+    errors = []
+    for block, fields in CONFIG_SCHEMA.items():
+        if block not in config:
+            continue
+        values = config[block]
+        if not isinstance(values, dict):
+            errors.append(f"{block} 必须是对象")
+            continue
+        for key, expected in fields.items():
+            if key not in values:
+                continue
+            value = values[key]
+            # bool是int的子类，整数字段不接受true/false
+            if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):
+                errors.append(f"{block}.{key} 类型错误: {value!r}")
+
+    celery_config = config.get("celery", {})
+    if isinstance(celery_config.get("worker_prefetch_multiplier"), int) \
+            and celery_config["worker_prefetch_multiplier"] < 0:
+        errors.append("celery.worker_prefetch_multiplier 不能为负数")
+    if isinstance(celery_config.get("result_expires"), int) and celery_config["result_expires"] <= 0:
+        errors.append("celery.result_expires 必须大于0")
+
+    for name, profile in (config.get("worker_profiles") or {}).items():
+        if not isinstance(profile, dict):
+            errors.append(f"worker_profiles.{name} 必须是对象")
+            continue
+        concurrency = profile.get("concurrency")
+        if concurrency is not None and (not isinstance(concurrency, int) or concurrency < 1):
+            errors.append(f"worker_profiles.{name}.concurrency 必须为正整数或null")
+        multiplier = profile.get("prefetch_multiplier")
+        if multiplier is not None and (not isinstance(multiplier, int) or multiplier < 0):
+            errors.append(f"worker_profiles.{name}.prefetch_multiplier 必须为非负整数或null")
+
+    limits_config = config.get("rate_limits", {})
+    for kind in ("tasks", "queues"):
+        rules = limits_config.get(kind, {}) if isinstance(limits_config, dict) else {}
+        for name, rule in (rules.items() if isinstance(rules, dict) else ()):
+            if not isinstance(rule, dict) or not isinstance(rule.get("rate"), _NUMBER) or rule["rate"] <= 0:
+                errors.append(f"rate_limits.{kind}.{name}.rate 必须为正数")
+            elif not isinstance(rule.get("burst", rule["rate"]), _NUMBER) or rule.get("burst", rule["rate"]) < 1:
+                errors.append(f"rate_limits.{kind}.{name}.burst 必须不小于1")
+    return errors
+
 
 class ConfigManager:
     """配置管理器"""
     
     def __init__(self, config_file: str = "config.json"):
         self.config_file = config_file
+        self._config_mtime = self._file_mtime()
         self.config = self._load_config()
+        # 已解析的消息代理/结果后端（首次使用时才解析）
+        self._resolved_backend: Optional[Dict[str, Any]] = None
+        self._resolve_lock = threading.Lock()
+        self._health_check_thread: Optional[threading.Thread] = None
+        # 多端点模式下跟随当前端点的连接池（首次使用时创建）
+        self._failover_pool = None
         
     def _load_config(self) -> Dict[str, Any]:
         """加载配置文件"""
@@ -25,6 +166,8 @@ class ConfigManager:
                 with open(self.config_file, 'r', encoding='utf-8') as f:
                     config = json.load(f)
                 print(f"✅ 已加载配置文件: {self.config_file}")
+                for error in validate_config(config):
+                    print(f"⚠️  配置项有误: {error}")
                 return config
             except Exception as e:
                 print(f"❌ 配置文件加载失败: {e}")
@@ -33,6 +176,38 @@ class ConfigManager:
             print(f"⚠️  配置文件不存在: {self.config_file}，使用默认配置")
             return self._get_default_config()
     
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.config_file).st_mtime_ns
+        except OSError:
+            return None
+    
+    def check_for_changes(self) -> Optional[Dict[str, Tuple[Any, Any]]]:
+        """
+        配置文件修改时间变化时重新加载并校验（只有一次stat调用，可定期调用）
+        返回 {块: (旧值, 新值)}；文件未变化、无法解析或校验失败时返回None并保留当前配置
+        """
+        mtime = self._file_mtime()
+        if mtime == self._config_mtime or mtime is None:
+            return None
+        self._config_mtime = mtime
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                new_config = json.load(f)
+        except Exception as e:
+            print(f"❌ 配置文件重新加载失败，保留当前配置: {e}")
+            return None
+        errors = validate_config(new_config)
+        if errors:
+            print(f"❌ 配置文件校验失败，保留当前配置: {'; '.join(errors)}")
+            return None
+        old_config = self.config
+        # 整体替换引用，读取方无需加锁
+        self.config = new_config
+        return {block: (old_config.get(block), new_config.get(block))
+                for block in set(old_config) | set(new_config)
+                if old_config.get(block) != new_config.get(block)}
+    
     def _get_default_config(self) -> Dict[str, Any]:
         """获取默认配置"""
         return {
@@ -47,7 +222,10 @@ class ConfigManager:
                     "max_connections": 20,
                     "retry_on_timeout": True,
                     "socket_timeout": 5,
-                    "socket_connect_timeout": 5
+                    "socket_connect_timeout": 5,
+                    "socket_keepalive": True,
+                    "health_check_interval": 0,
+                    "pool_timeout": 10
                 }
             },
             "celery": {
@@ -66,7 +244,12 @@ class ConfigManager:
                 "port": 5555,
                 "basic_auth": None,
                 "url_prefix": "",
-                "enable_events": True
+                "enable_events": False
+            },
+            "backend_cache": {
+                "enabled": True,
+                "ttl": 300,
+                "path": None
             }
         }
     
@@ -82,36 +265,402 @@ class ConfigManager:
         """获取Flower配置"""
         return self.config.get("flower", {})
     
-
+    def get_local_redis_config(self) -> Dict[str, Any]:
+        """获取本地Redis备选配置"""
+        return self.config.get("local_redis", {})
+    
+    def get_backend_cache_config(self) -> Dict[str, Any]:
+        """获取后端解析结果缓存配置"""
+        cache_config = {"enabled": True, "ttl": 300, "path": None}
+        cache_config.update(self.config.get("backend_cache", {}))
+        return cache_config
+    
+    def get_progress_config(self) -> Dict[str, Any]:
+        """获取任务进度推送配置"""
+        progress_config = {"min_interval": 1.0, "backend_interval": 5.0, "stream_ttl": 3600, "maxlen": 100}
+        progress_config.update(self.config.get("progress", {}))
+        return progress_config
+    
+    def get_checkpoint_config(self) -> Dict[str, Any]:
+        """获取长任务断点续跑与协作式取消配置"""
+        checkpoint_config = {
+            "enabled": True,
+            "key_prefix": "celery-checkpoint:",
+            "interval": 5.0,
+            "ttl": 86400,
+            "cancel_check_interval": 1.0,
+            "requeue_on_shutdown": True
+        }
+        checkpoint_config.update(self.config.get("checkpoint", {}))
+        return checkpoint_config
+    
+    def get_task_logging_config(self) -> Dict[str, Any]:
+        """获取任务日志配置（tasks为 {任务名: 采样率}）"""
+        task_logging_config = {
+            "enabled": True,
+            "level": "INFO",
+            "format": "text",
+            "stream": "stderr",
+            "sample_rate": 1.0,
+            "tasks": {},
+            "max_arg_chars": 200,
+            "max_items": 10,
+            "max_message_chars": 2000,
+            "batch_size": 500,
+            "flush_interval": 0.2,
+            "queue_size": 10000
+        }
+        task_logging_config.update(self.config.get("task_logging", {}))
+        return task_logging_config
+    
+    def get_task_events_config(self) -> Dict[str, Any]:
+        """获取聚合任务事件配置（按间隔写出按任务/队列的汇总，代替逐任务的Celery事件）"""
+        events_config = {
+            "enabled": True,
+            "interval": 10,
+            "stream": "celery-events:summary",
+            "maxlen": 10000,
+            "sample_rate": 0.0,
+            "samples_stream": "celery-events:samples",
+            "samples_maxlen": 1000,
+            "ttl": 86400,
+            "disable_remote_enable": True,
+            "buckets": [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0]
+        }
+        events_config.update(self.config.get("task_events", {}))
+        return events_config
+    
+    def get_result_store_config(self) -> Dict[str, Any]:
+        """获取任务结果存储策略与批量写入配置（tasks/queues为 {任务名/队列: 策略}）"""
+        batching_config = {
+            "enabled": True,
+            "max_batch": 200,
+            "max_latency": 0.02,
+            "max_pending": 5000
+        }
+        result_store_config = {
+            "enabled": True,
+            "default": "store",
+            "tasks": {},
+            "queues": {}
+        }
+        result_store_config.update(self.config.get("result_store", {}))
+        batching_config.update(result_store_config.get("batching", {}))
+        result_store_config["batching"] = batching_config
+        return result_store_config
+    
+    def get_serialization_config(self) -> Dict[str, Any]:
+        """获取numpack序列化器配置及按任务/队列的选择"""
+        serialization_config = {
+            "array_threshold": 16,
+            "compress_threshold": 65536,
+            "compress_level": 1,
+            "decode_arrays": "numpy",
+            "narrow_max_items": 65536,
+            "tasks": {},
+            "queues": {}
+        }
+        serialization_config.update(self.config.get("serialization", {}))
+        return serialization_config
+    
+    def get_claim_check_config(self) -> Dict[str, Any]:
+        """获取大负载旁路存储（claimcheck序列化器）配置"""
+        claim_config = {
+            "threshold": 262144,
+            "store": "redis",
+            "ttl": 86400,
+            "directory": None,
+            "cleanup_interval": 300,
+            "inner_serializer": "numpack"
+        }
+        claim_config.update(self.config.get("claim_check", {}))
+        return claim_config
+    
+    def get_worker_profiles(self) -> Dict[str, Dict[str, Any]]:
+        """获取按队列的worker配置（并发模型、并发数、预取倍数等）"""
+        return self.config.get("worker_profiles", {})
+    
+    def get_autoscaler_config(self) -> Dict[str, Any]:
+        """获取按队列深度自动伸缩worker的配置"""
+        autoscaler_config = {
+            "interval": 5,
+            "target_latency": 10,
+            "min_workers": 1,
+            "max_workers": 4,
+            "initial_rate": 10,
+            "min_rate": 0.1,
+            "rate_smoothing": 0.3,
+            "scale_up_cooldown": 15,
+            "scale_down_cooldown": 60,
+            "drain_timeout": 300,
+            "metrics_key": "celery-autoscaler",
+            "decision_history": 1000,
+            "queues": {}
+        }
+        autoscaler_config.update(self.config.get("autoscaler", {}))
+        return autoscaler_config
+    
+    def get_metrics_config(self) -> Dict[str, Any]:
+        """获取指标埋点与导出配置"""
+        metrics_config = {
+            "enabled": True,
+            "worker_endpoint": True,
+            "host": "127.0.0.1",
+            "port": 9808,
+            "port_range": 16,
+            "queue_depth_interval": 15,
+            "serialization": True,
+            "flush_interval": 5,
+            "multiprocess_dir": None,
+            "buckets": [0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                        0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0]
+        }
+        metrics_config.update(self.config.get("metrics", {}))
+        return metrics_config
+    
+    def get_memoization_config(self) -> Dict[str, Any]:
+        """获取确定性任务结果记忆配置"""
+        memo_config = {"enabled": True, "ttl": 3600, "lru_size": 1024, "key_prefix": "celery-memo:"}
+        memo_config.update(self.config.get("memoization", {}))
+        return memo_config
+    
+    def get_retry_policy_config(self) -> Dict[str, Any]:
+        """获取重试退避、重试预算和熔断器配置（default为默认策略，tasks按任务覆盖）"""
+        default_policy = {
+            "backoff_base": 1.0,
+            "backoff_max": 300.0,
+            "budget_ratio": 0.2,
+            "budget_min": 10,
+            "window": 60,
+            "failure_threshold": 0.5,
+            "min_requests": 20,
+            "open_seconds": 30,
+            "half_open_probes": 3
+        }
+        retry_config = dict(self.config.get("retry_policy", {}))
+        default_policy.update(retry_config.get("default", {}))
+        return {
+            "enabled": retry_config.get("enabled", True),
+            "key_prefix": retry_config.get("key_prefix", "celery-breaker:"),
+            "default": default_policy,
+            "tasks": retry_config.get("tasks", {})
+        }
+    
+    def get_rate_limits_config(self) -> Dict[str, Any]:
+        """获取集群级令牌桶限流配置（tasks按任务名、queues按队列，rate为每秒令牌数，burst为桶容量）"""
+        limits_config = {
+            "enabled": True,
+            "key_prefix": "celery-ratelimit:",
+            "max_defer": 60,
+            "jitter": 0.1,
+            "tasks": {},
+            "queues": {}
+        }
+        limits_config.update(self.config.get("rate_limits", {}))
+        return limits_config
+    
+    def get_priority_config(self) -> Dict[str, Any]:
+        """获取队列内优先级通道配置（Redis传输中数值越小优先级越高）"""
+        aging_config = {
+            "enabled": True,
+            "max_wait": 30,
+            "interval": 2,
+            "batch": 100,
+            "queues": []
+        }
+        priority_config = {
+            "enabled": True,
+            "key_prefix": "celery-priority:",
+            "steps": [0, 3, 6, 9],
+            "levels": {"high": 0, "normal": 3, "low": 6, "bulk": 9},
+            "default": "normal",
+            "inherit_parent": True,
+            "tasks": {},
+            "queues": {}
+        }
+        priority_config.update(self.config.get("priority", {}))
+        aging_config.update(priority_config.get("aging", {}))
+        priority_config["aging"] = aging_config
+        return priority_config
+    
+    def get_live_config(self) -> Dict[str, Any]:
+        """获取配置热更新设置（interval为检查间隔秒数，key为推送配置在Redis中的键）"""
+        live_config = {"enabled": True, "interval": 2.0, "key": "celery-live-config"}
+        live_config.update(self.config.get("live_config", {}))
+        return live_config
+    
+    def get_local_executor_config(self) -> Dict[str, Any]:
+        """获取本地并发执行模式配置（代替task_always_eager，任务在本进程内嵌的worker中执行）"""
+        local_config = {
+            "enabled": False,
+            "pool": "threads",
+            "concurrency": 4,
+            "queues": [],
+            "polling_interval": 0.005,
+            "shutdown_timeout": 30
+        }
+        local_config.update(self.config.get("local_executor", {}))
+        return local_config
+    
+    def get_endpoints_config(self) -> Dict[str, Any]:
+        """获取多端点探测与故障转移配置（endpoints为 [{name, url}]，按偏好排序）"""
+        endpoints_config = {
+            "enabled": False,
+            "endpoints": [],
+            "probe_interval": 1.0,
+            "probe_timeout": 0.5,
+            "failure_threshold": 2,
+            "recovery_threshold": 5,
+            "max_rtt_ms": 200,
+            "switch_margin": 0.5,
+            "min_rtt_gain_ms": 1.0,
+            "rtt_smoothing": 0.3,
+            "socket_timeout": 2
+        }
+        endpoints_config.update(self.config.get("endpoints", {}))
+        return endpoints_config
+    
+    def get_connection_pool_params(self) -> Dict[str, Any]:
+        """根据配置文件中的connection_pool构建连接池参数"""
+        redis_config = self.get_redis_config()
+        pool_config = redis_config.get('connection_pool', {})
+        
+        params = {
+            'host': redis_config.get('host', 'localhost'),
+            'port': redis_config.get('port', 6379),
+            'db': redis_config.get('db', 0),
+            'max_connections': pool_config.get('max_connections', 20),
+            'timeout': pool_config.get('pool_timeout', 10),
+            'socket_timeout': pool_config.get('socket_timeout', 5),
+            'socket_connect_timeout': pool_config.get('socket_connect_timeout', 5),
+            'socket_keepalive': pool_config.get('socket_keepalive', True),
+            'retry_on_timeout': pool_config.get('retry_on_timeout', True),
+            # 默认关闭：redis==5.0.1 中连接被服务器断开后，健康检查会导致 RecursionError 而不是 ConnectionError
+            'health_check_interval': pool_config.get('health_check_interval', 0)
+        }
+        
+        # 添加密码（如果有）
+        if redis_config.get('password'):
+            params['password'] = redis_config['password']
+        
+        # 添加SSL支持（如果需要）
+        if redis_config.get('ssl', False):
+            params['connection_class'] = redis.SSLConnection
+            params['ssl_cert_reqs'] = None
+        
+        return params
+    
+    def get_local_pool_params(self) -> Dict[str, Any]:
+        """本地Redis备选的连接池参数（沿用connection_pool配置，不带密码和SSL）"""
+        params = self.get_connection_pool_params()
+        for key in ('password', 'connection_class', 'ssl_cert_reqs'):
+            params.pop(key, None)
+        params.update({
+            'host': 'localhost',
+            'port': self.get_local_redis_config().get('port', 6379),
+            'db': 0
+        })
+        return params
+    
+    def get_connection_pool(self, params: Optional[Dict[str, Any]] = None) -> InstrumentedConnectionPool:
+        """获取进程级共享连接池，fork后在子进程中自动重建"""
+        if params is None:
+            params = self.get_connection_pool_params()
+        key = json.dumps(
+            {k: (v.__name__ if isinstance(v, type) else v) for k, v in params.items()},
+            sort_keys=True
+        )
+        
+        pool = _shared_pools.get(key)
+        if pool is not None and pool.pid == os.getpid():
+            return pool
+        
+        with _shared_pools_lock:
+            pool = _shared_pools.get(key)
+            if pool is None or pool.pid != os.getpid():
+                pool = InstrumentedConnectionPool(**params)
+                _shared_pools[key] = pool
+            return pool
+    
+    def get_redis_client(self) -> redis.Redis:
+        """获取使用共享连接池的Redis客户端"""
+        return redis.Redis(connection_pool=self.get_connection_pool())
+    
+    def get_endpoint_pool_params(self, url: str) -> Dict[str, Any]:
+        """多端点模式下某个端点的连接池参数（沿用connection_pool配置，地址和认证取自URL）"""
+        params = self.get_connection_pool_params()
+        for key in ('host', 'port', 'db', 'password', 'connection_class', 'ssl_cert_reqs'):
+            params.pop(key, None)
+        params.update(redis.connection.parse_url(url))
+        params['socket_timeout'] = self.get_endpoints_config()['socket_timeout']
+        return params
+    
+    def get_backend_redis_client(self) -> Optional[redis.Redis]:
+        """获取指向已解析后端的Redis客户端（共享连接池），使用内存传输时返回None"""
+        resolved = self.resolve_backend()
+        if resolved['type'] in ('memory', 'local_executor'):
+            return None
+        if resolved['type'] == 'endpoints':
+            from endpoints import FailoverConnectionPool
+            if self._failover_pool is None:
+                self._failover_pool = FailoverConnectionPool(
+                    lambda url: self.get_connection_pool(self.get_endpoint_pool_params(url)))
+            return redis.Redis(connection_pool=self._failover_pool)
+        if resolved['type'] == 'local_redis':
+            return redis.Redis(connection_pool=self.get_connection_pool(self.get_local_pool_params()))
+        return self.get_redis_client()
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """获取共享连接池统计信息"""
+        return self.get_connection_pool().get_stats()
+    
+    def get_celery_pool_settings(self) -> Dict[str, Any]:
+        """将connection_pool配置映射到Celery/kombu自己的连接池设置"""
+        pool_config = self.get_redis_config().get('connection_pool', {})
+        max_connections = pool_config.get('max_connections', 20)
+        socket_timeout = pool_config.get('socket_timeout', 5)
+        endpoints_config = self.get_endpoints_config()
+        if endpoints_config['enabled']:
+            # 多端点模式下由探测发现故障，连接本身不必长时间等待
+            socket_timeout = endpoints_config['socket_timeout']
+        socket_connect_timeout = pool_config.get('socket_connect_timeout', 5)
+        socket_keepalive = pool_config.get('socket_keepalive', True)
+        health_check_interval = pool_config.get('health_check_interval', 0)
+        transport_options = {
+            'max_connections': max_connections,
+            'socket_timeout': socket_timeout,
+            'socket_connect_timeout': socket_connect_timeout,
+            'socket_keepalive': socket_keepalive,
+            'health_check_interval': health_check_interval
+        }
+        priority_config = self.get_priority_config()
+        if priority_config['enabled']:
+            # 队列内优先级通道（Redis传输按级别拆分队列）
+            transport_options['priority_steps'] = list(priority_config['steps'])
+        local_config = self.get_local_executor_config()
+        if local_config['enabled']:
+            # 本地执行模式的内存传输轮询间隔
+            transport_options['polling_interval'] = local_config['polling_interval']
+        
+        return {
+            # 消息代理连接池
+            'broker_pool_limit': max_connections,
+            'broker_transport_options': transport_options,
+            # 结果后端连接池
+            'redis_max_connections': max_connections,
+            'redis_socket_timeout': socket_timeout,
+            'redis_socket_connect_timeout': socket_connect_timeout,
+            'redis_socket_keepalive': socket_keepalive,
+            'redis_retry_on_timeout': pool_config.get('retry_on_timeout', True),
+            'redis_backend_health_check_interval': health_check_interval
+        }
     
     def test_redis_connection(self) -> Tuple[bool, str, Optional[redis.Redis]]:
-        """测试Redis连接"""
+        """测试Redis连接（使用共享连接池）"""
         redis_config = self.get_redis_config()
         
         try:
-            # 构建Redis连接参数
-            connection_params = {
-                'host': redis_config.get('host', 'localhost'),
-                'port': redis_config.get('port', 6379),
-                'db': redis_config.get('db', 0),
-                'decode_responses': True,
-                'socket_timeout': redis_config.get('connection_pool', {}).get('socket_timeout', 5),
-                'socket_connect_timeout': redis_config.get('connection_pool', {}).get('socket_connect_timeout', 5),
-                'retry_on_timeout': redis_config.get('connection_pool', {}).get('retry_on_timeout', True),
-                'max_connections': redis_config.get('connection_pool', {}).get('max_connections', 20)
-            }
-            
-            # 添加密码（如果有）
-            if redis_config.get('password'):
-                connection_params['password'] = redis_config['password']
-            
-            # 添加SSL支持（如果需要）
-            if redis_config.get('ssl', False):
-                connection_params['ssl'] = True
-                connection_params['ssl_cert_reqs'] = None
-            
-            # 创建Redis连接
-            r = redis.Redis(**connection_params)
+            r = self.get_redis_client()
             
             # 测试连接
             response = r.ping()
@@ -123,10 +672,10 @@ class ConfigManager:
             else:
                 return False, "❌ Redis连接失败: ping无响应", None
                 
-        except redis.ConnectionError as e:
-            return False, f"❌ Redis连接错误: {e}", None
         except redis.AuthenticationError as e:
             return False, f"❌ Redis认证失败: {e}", None
+        except redis.ConnectionError as e:
+            return False, f"❌ Redis连接错误: {e}", None
         except Exception as e:
             return False, f"❌ Redis连接异常: {e}", None
     
@@ -159,6 +708,211 @@ class ConfigManager:
         # 如果没有配置，使用与broker相同的URL
         return self.get_broker_url()
     
+    def _probe_local_redis(self) -> bool:
+        """测试本地Redis备选是否可用"""
+        local_config = self.get_local_redis_config()
+        if not local_config.get('fallback_enabled', True):
+            return False
+        
+        try:
+            r = redis.Redis(connection_pool=self.get_connection_pool(self.get_local_pool_params()))
+            return bool(r.ping())
+        except Exception:
+            return False
+    
+    def probe_backend(self) -> Dict[str, Any]:
+        """按 Tair -> 本地Redis -> 内存传输 的顺序探测可用的后端"""
+        success, message, _ = self.test_redis_connection()
+        if success:
+            redis_type = self.get_redis_config().get('type', 'redis')
+            return {
+                'type': redis_type,
+                'broker_url': self.get_broker_url(),
+                'result_backend': self.get_result_backend_url(),
+                'message': f"{message}\n使用{redis_type}作为消息代理和结果后端"
+            }
+        
+        if self._probe_local_redis():
+            port = self.get_local_redis_config().get('port', 6379)
+            local_url = f"redis://localhost:{port}/0"
+            return {
+                'type': 'local_redis',
+                'broker_url': local_url,
+                'result_backend': local_url,
+                'message': f"{message}\n使用本地Redis作为消息代理和结果后端"
+            }
+        
+        return {
+            'type': 'memory',
+            'broker_url': 'memory://',
+            'result_backend': 'cache+memory://',
+            'message': f"{message}\nRedis不可用，使用内存传输（仅适用于单进程演示）"
+        }
+    
+    def _get_backend_cache_path(self) -> str:
+        """获取后端缓存文件路径，按配置内容区分，避免不同配置互相覆盖"""
+        cache_config = self.get_backend_cache_config()
+        if cache_config.get('path'):
+            return cache_config['path']
+        
+        key_source = json.dumps(
+            {
+                'redis': self.get_redis_config(),
+                'celery': self.get_celery_config(),
+                'local_redis': self.get_local_redis_config()
+            },
+            sort_keys=True
+        )
+        key = hashlib.sha1(key_source.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(tempfile.gettempdir(), f"celery_demo_backend_{key}.json")
+    
+    def _read_backend_cache(self) -> Optional[Dict[str, Any]]:
+        """读取磁盘上的后端缓存，过期或损坏时返回None"""
+        cache_config = self.get_backend_cache_config()
+        if not cache_config.get('enabled', True):
+            return None
+        
+        try:
+            with open(self._get_backend_cache_path(), 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        age = time.time() - cached.get('resolved_at', 0)
+        if age < 0 or age > cache_config.get('ttl', 300):
+            return None
+        cached['age'] = age
+        return cached
+    
+    def _write_backend_cache(self, resolved: Dict[str, Any]):
+        """原子写入后端缓存，文件包含密码，仅当前用户可读"""
+        if not self.get_backend_cache_config().get('enabled', True):
+            return
+        
+        path = self._get_backend_cache_path()
+        data = {key: resolved[key] for key in ('type', 'broker_url', 'result_backend', 'message')}
+        data['resolved_at'] = time.time()
+        try:
+            directory = os.path.dirname(os.path.abspath(path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.celery_backend_')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  后端缓存写入失败: {e}")
+    
+    def invalidate_backend_cache(self):
+        """删除磁盘上的后端缓存，下次使用时重新探测"""
+        self._resolved_backend = None
+        try:
+            os.remove(self._get_backend_cache_path())
+        except OSError:
+            pass
+    
+    def _background_health_check(self, cached: Dict[str, Any]):
+        """后台重新探测后端，结果变化时更新缓存供后续进程使用"""
+        try:
+            resolved = self.probe_backend()
+        except Exception as e:
+            print(f"⚠️  后台健康检查失败: {e}")
+            return
+        
+        self._write_backend_cache(resolved)
+        if resolved['broker_url'] != cached['broker_url']:
+            print(f"⚠️  后台健康检查发现后端已变化: {cached['type']} -> {resolved['type']}，新进程将使用新后端")
+    
+    def _start_health_check(self, cached: Dict[str, Any]):
+        """缓存已过半个TTL时在后台刷新，避免每个短进程都去探测"""
+        ttl = self.get_backend_cache_config().get('ttl', 300)
+        if cached.get('age', 0) < ttl / 2:
+            return
+        if self._health_check_thread and self._health_check_thread.is_alive():
+            return
+        
+        self._health_check_thread = threading.Thread(
+            target=self._background_health_check,
+            args=(cached,),
+            name='backend-health-check',
+            daemon=True
+        )
+        self._health_check_thread.start()
+    
+    def force_backend(self, backend_type: str) -> Dict[str, Any]:
+        """跳过探测和缓存，直接使用指定后端（memory / local_redis / redis），用于基准测试"""
+        if backend_type == 'memory':
+            resolved = {'type': 'memory', 'broker_url': 'memory://', 'result_backend': 'cache+memory://'}
+        elif backend_type == 'local_redis':
+            port = self.get_local_redis_config().get('port', 6379)
+            local_url = f"redis://localhost:{port}/0"
+            resolved = {'type': 'local_redis', 'broker_url': local_url, 'result_backend': local_url}
+        else:
+            resolved = {
+                'type': self.get_redis_config().get('type', 'redis'),
+                'broker_url': self.get_broker_url(),
+                'result_backend': self.get_result_backend_url()
+            }
+        resolved['message'] = f"指定使用{resolved['type']}作为消息代理和结果后端"
+        with self._resolve_lock:
+            self._resolved_backend = resolved
+        return resolved
+    
+    def _resolve_endpoints(self, endpoints_config: Dict[str, Any]) -> Dict[str, Any]:
+        """多端点模式：同步探测一轮后选出当前端点，之后由后台探测持续切换（不使用磁盘缓存）"""
+        from endpoints import get_monitor
+        monitor = get_monitor(endpoints_config)
+        current = monitor.current_endpoint()
+        status = ', '.join(
+            f"{endpoint.name} {'%.2f ms' % endpoint.rtt_ms if endpoint.healthy else '不可用'}"
+            for endpoint in monitor.endpoints
+        )
+        return {
+            'type': 'endpoints',
+            'broker_url': ';'.join(monitor.ordered_urls()),
+            'result_backend': f"endpoints.FailoverRedisBackend+{current.url}",
+            'message': f"多端点模式: {status}\n使用{current.name}作为消息代理和结果后端（后台持续探测）"
+        }
+    
+    def _resolve_local(self) -> Dict[str, Any]:
+        """本地执行模式：内存传输和进程内结果后端，由本进程内嵌的worker执行任务"""
+        from local_executor import BROKER_URL, RESULT_BACKEND
+        return {
+            'type': 'local_executor',
+            'broker_url': BROKER_URL,
+            'result_backend': RESULT_BACKEND,
+            'message': "本地执行模式: 任务由本进程内嵌的worker并发执行（不连接Redis）"
+        }
+    
+    def resolve_backend(self) -> Dict[str, Any]:
+        """解析消息代理和结果后端：优先进程内结果，其次磁盘缓存，最后同步探测"""
+        if self._resolved_backend is not None:
+            return self._resolved_backend
+        
+        with self._resolve_lock:
+            if self._resolved_backend is not None:
+                return self._resolved_backend
+            
+            if self.get_local_executor_config()['enabled']:
+                self._resolved_backend = self._resolve_local()
+                return self._resolved_backend
+            
+            endpoints_config = self.get_endpoints_config()
+            if endpoints_config['enabled'] and endpoints_config['endpoints']:
+                self._resolved_backend = self._resolve_endpoints(endpoints_config)
+                return self._resolved_backend
+            
+            cached = self._read_backend_cache()
+            if cached is not None:
+                cached['message'] = f"{cached['message']}（缓存, {cached['age']:.0f}秒前解析）"
+                self._start_health_check(cached)
+                self._resolved_backend = cached
+            else:
+                resolved = self.probe_backend()
+                self._write_backend_cache(resolved)
+                self._resolved_backend = resolved
+            
+            return self._resolved_backend
+    
     def create_example_config(self):
         """创建示例配置文件"""
         example_config = {
@@ -173,7 +927,10 @@ class ConfigManager:
                     "max_connections": 20,
                     "retry_on_timeout": True,
                     "socket_timeout": 5,
-                    "socket_connect_timeout": 5
+                    "socket_connect_timeout": 5,
+                    "socket_keepalive": True,
+                    "health_check_interval": 0,
+                    "pool_timeout": 10
                 }
             },
             "celery": {
@@ -192,12 +949,17 @@ class ConfigManager:
                 "port": 5555,
                 "basic_auth": None,
                 "url_prefix": "",
-                "enable_events": True
+                "enable_events": False
             },
             "local_redis": {
                 "path": "E:\\redis-2.8",
                 "port": 6379,
                 "fallback_enabled": True
+            },
+            "backend_cache": {
+                "enabled": True,
+                "ttl": 300,
+                "path": None
             }
         }
         
@@ -239,6 +1001,10 @@ def main():
             print(f"使用内存: {info.get('used_memory_human', 'unknown')}")
         except Exception as e:
             print(f"获取Redis信息失败: {e}")
+        
+        stats = config_manager.get_pool_stats()
+        print(f"连接池: 使用中 {stats['in_use']} / 空闲 {stats['idle']} / 上限 {stats['max_connections']}, "
+              f"平均等待 {stats['wait_avg_ms']:.2f} ms")
     
     # 创建示例配置文件
     print("\n📝 创建示例配置文件...")
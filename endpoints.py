@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+多端点延迟感知选择与快速故障转移模块
+config.json 的 endpoints 块列出多个Redis/Tair端点（如Tair主地址、备用地址、本地redis-server），
+后台线程按 probe_interval 对每个端点PING，记录往返时延（指数平滑）：
+- 连续 failure_threshold 次失败或时延超过 max_rtt_ms 视为不健康，当前端点不健康时立即切换（故障转移）
+- 当前端点健康时，其他端点需连续 recovery_threshold 轮时延都比当前端点低 switch_margin 比例
+  且至少 min_rtt_gain_ms 毫秒才会切换；首选端点（列表第一个）恢复后时延相当即切回，
+  避免时延抖动引起在两个端点之间来回切换
+切换后新连接都会指向新端点：消息代理URL按健康度重新排序并作为kombu的故障转移策略，
+生产者连接池被重置，worker消费者被打断后重新连接，结果后端和共享Redis客户端按当前端点取连接。
+各端点之间不复制数据时，切换前已在旧端点排队的消息要等旧端点恢复并被切回后才会被消费；
+端点应是同一份数据的不同地址（如Tair主备/代理地址，或主从复制的本地redis-server对）。
+"""
+
+import os
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import redis
+from celery.backends.redis import RedisBackend
+from redis.connection import parse_url
+
+import metrics
+
+
+class Endpoint:
+    """单个端点的探测状态"""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self.params = parse_url(url)
+        self.rtt_ms: Optional[float] = None
+        self.last_rtt_ms: Optional[float] = None
+        self.healthy = False
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+        self.probes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._client: Optional[redis.Redis] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'url': self.url.split('@')[-1],
+            'healthy': self.healthy,
+            'rtt_ms': None if self.rtt_ms is None else round(self.rtt_ms, 3),
+            'last_rtt_ms': None if self.last_rtt_ms is None else round(self.last_rtt_ms, 3),
+            'probes': self.probes,
+            'failures': self.failures,
+            'last_error': self.last_error,
+        }
+
+
+class EndpointMonitor:
+    """持续探测各端点并选出当前端点"""
+
+    def __init__(self, endpoints_config: Dict[str, Any]):
+        self.config = endpoints_config
+        self.endpoints = [Endpoint(item.get('name') or f"endpoint-{i}", item['url'])
+                          for i, item in enumerate(endpoints_config['endpoints'])]
+        if not self.endpoints:
+            raise ValueError("endpoints.endpoints 不能为空")
+        self.current = self.endpoints[0]
+        self.switches = 0
+        # 连续几轮都更优的候选端点
+        self._candidate: Optional[Endpoint] = None
+        self._candidate_rounds = 0
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+
+    # ---- 探测 ----
+
+    def _probe_client(self, endpoint: Endpoint) -> redis.Redis:
+        if endpoint._client is None:
+            timeout = self.config['probe_timeout']
+            endpoint._client = redis.Redis(**endpoint.params, socket_timeout=timeout,
+                                           socket_connect_timeout=timeout, single_connection_client=True)
+        return endpoint._client
+
+    def probe(self, endpoint: Endpoint):
+        endpoint.probes += 1
+        try:
+            # 建立连接的耗时不计入时延
+            client = self._probe_client(endpoint)
+            start = time.perf_counter()
+            client.ping()
+        except Exception as e:
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            endpoint.consecutive_successes = 0
+            endpoint.last_error = str(e)
+            # 连接可能已损坏，下次重新建立
+            endpoint._client = None
+            if endpoint.consecutive_failures >= self.config['failure_threshold']:
+                endpoint.healthy = False
+        else:
+            rtt = (time.perf_counter() - start) * 1000
+            alpha = self.config['rtt_smoothing']
+            endpoint.last_rtt_ms = rtt
+            endpoint.rtt_ms = rtt if endpoint.rtt_ms is None else (1 - alpha) * endpoint.rtt_ms + alpha * rtt
+            endpoint.consecutive_failures = 0
+            endpoint.consecutive_successes += 1
+            endpoint.last_error = None
+            if endpoint.rtt_ms > self.config['max_rtt_ms']:
+                endpoint.healthy = False
+            elif endpoint.healthy or endpoint.consecutive_successes >= self.config['recovery_threshold'] \
+                    or endpoint.probes == 1:
+                # 首次探测成功即视为健康，启动时不必等待
+                endpoint.healthy = True
+        if metrics.registry is not None:
+            labels = (('endpoint', endpoint.name),)
+            metrics.registry.set_gauge('celery_endpoint_up', labels, 1 if endpoint.healthy else 0)
+            if endpoint.last_rtt_ms is not None:
+                metrics.registry.set_gauge('celery_endpoint_rtt_ms', labels, round(endpoint.rtt_ms, 3))
+
+    def select(self) -> Tuple[Endpoint, str]:
+        """
+        返回 (端点, 原因)：当前端点不健康时换到时延最低的健康端点；
+        健康时只有其他端点连续 recovery_threshold 轮都明显更快才切换，避免时延抖动引起来回切换
+        """
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.healthy]
+        if not healthy:
+            return self.current, ''
+        best = min(healthy, key=lambda endpoint: (endpoint.rtt_ms, self.endpoints.index(endpoint)))
+        if not self.current.healthy:
+            return best, '故障转移'
+        faster = best if best is not self.current and self._gain(best) > 0 else None
+        # 首选端点（列表第一个）恢复且时延相当时切回
+        preferred = self.endpoints[0]
+        if faster is None and preferred is not self.current and preferred.healthy \
+                and preferred.rtt_ms <= self.current.rtt_ms * (1 + self.config['switch_margin']):
+            faster = preferred
+        if faster is not self._candidate:
+            self._candidate, self._candidate_rounds = faster, 0
+        if faster is None:
+            return self.current, ''
+        self._candidate_rounds += 1
+        if self._candidate_rounds < self.config['recovery_threshold']:
+            return self.current, ''
+        return faster, '切回首选端点' if faster is preferred else '切换到更快的端点'
+
+    def _gain(self, endpoint: Endpoint) -> float:
+        """相对当前端点节省的时延（毫秒），不足 switch_margin 比例或 min_rtt_gain_ms 时为0"""
+        gain = self.current.rtt_ms - endpoint.rtt_ms
+        if gain < self.current.rtt_ms * self.config['switch_margin'] or gain < self.config['min_rtt_gain_ms']:
+            return 0
+        return gain
+
+    def probe_all(self):
+        for endpoint in self.endpoints:
+            self.probe(endpoint)
+        with self._lock:
+            previous = self.current
+            selected, reason = self.select()
+            if selected is previous:
+                return
+            self.current = selected
+            self._candidate, self._candidate_rounds = None, 0
+            self.switches += 1
+        print(f"🔀 {reason}: {previous.name} -> {selected.name} "
+              f"(时延 {selected.rtt_ms:.2f} ms{'' if previous.last_error is None else ', ' + previous.last_error})")
+        if metrics.registry is not None:
+            metrics.registry.inc('celery_endpoint_switch_total', (('from', previous.name), ('to', selected.name)))
+        for listener in list(_listeners):
+            try:
+                listener(previous, selected)
+            except Exception as e:
+                print(f"⚠️  端点切换回调失败: {e}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.config['probe_interval'])
+            try:
+                self.probe_all()
+            except Exception as e:
+                print(f"⚠️  端点探测失败: {e}")
+
+    def ensure_running(self):
+        """启动（fork后的子进程中重新启动）后台探测线程"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for endpoint in self.endpoints:
+                endpoint._client = None
+        threading.Thread(target=self._run, name='endpoint-monitor', daemon=True).start()
+
+    # ---- 查询 ----
+
+    def current_endpoint(self) -> Endpoint:
+        self.ensure_running()
+        return self.current
+
+    def ordered_urls(self) -> List[str]:
+        """当前端点在前，其余按健康度和时延排序"""
+        others = sorted((endpoint for endpoint in self.endpoints if endpoint is not self.current),
+                        key=lambda endpoint: (not endpoint.healthy, endpoint.rtt_ms or float('inf')))
+        return [self.current.url] + [endpoint.url for endpoint in others]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'current': self.current.name,
+            'switches': self.switches,
+            'endpoints': {endpoint.name: endpoint.stats() for endpoint in self.endpoints},
+        }
+
+
+_monitor: Optional[EndpointMonitor] = None
+# 端点切换回调 (旧端点, 新端点)
+_listeners: List[Callable[[Endpoint, Endpoint], None]] = []
+
+
+def get_monitor(endpoints_config: Optional[Dict[str, Any]] = None) -> Optional[EndpointMonitor]:
+    """进程内唯一的端点监视器，首次创建时同步探测一轮"""
+    global _monitor
+    if _monitor is None and endpoints_config is not None:
+        monitor = EndpointMonitor(endpoints_config)
+        for endpoint in monitor.endpoints:
+            monitor.probe(endpoint)
+        # 启动时使用第一个健康的端点，之后由后台探测按时延调整
+        monitor.current = next((e for e in monitor.endpoints if e.healthy), monitor.endpoints[0])
+        _monitor = monitor
+        monitor.ensure_running()
+    return _monitor
+
+
+def healthiest_failover(urls: List[str]) -> Iterator[str]:
+    """kombu故障转移策略：重连时总是尝试当前最健康的端点"""
+    index = 0
+    while True:
+        if _monitor is not None and _monitor.current.url in urls:
+            yield _monitor.current_endpoint().url
+        else:
+            yield urls[index % len(urls)]
+            index += 1
+
+
+class FailoverConnectionPool:
+    """
+    按当前端点转发的连接池：每次取连接时使用当前端点的共享连接池，
+    长期持有Redis客户端的组件（限流、老化提升等）在切换后自动使用新端点
+    """
+
+    def __init__(self, pool_for_url: Callable[[str], redis.ConnectionPool]):
+        self._pool_for_url = pool_for_url
+        # 连接 -> 借出它的连接池，切换后归还到原来的池
+        self._owners: Dict[Any, redis.ConnectionPool] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def current_pool(self) -> redis.ConnectionPool:
+        return self._pool_for_url(get_monitor().current_endpoint().url)
+
+    def get_connection(self, command_name, *keys, **options):
+        pool = self.current_pool
+        connection = pool.get_connection(command_name, *keys, **options)
+        with self._lock:
+            self._owners[connection] = pool
+        return connection
+
+    def release(self, connection):
+        with self._lock:
+            pool = self._owners.pop(connection, None)
+        (pool or self.current_pool).release(connection)
+
+    def __getattr__(self, name):
+        return getattr(self.current_pool, name)
+
+
+class FailoverRedisBackend(RedisBackend):
+    """按当前端点取连接的Redis结果后端"""
+
+    # 所有实例（线程池中每个线程一个），切换端点时重新订阅结果
+    _instances: 'weakref.WeakSet[FailoverRedisBackend]' = weakref.WeakSet()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._clients: Dict[str, redis.Redis] = {}
+        self._instances.add(self)
+
+    @property
+    def client(self):
+        if _monitor is None:
+            return super().client
+        endpoint = _monitor.current_endpoint()
+        client = self._clients.get(endpoint.name)
+        if client is None:
+            params = dict(self.connparams)
+            params.update(self._params_from_url(endpoint.url, {}))
+            client = self._clients[endpoint.name] = self._create_client(**params)
+        return client
+
+    def on_endpoint_switch(self):
+        """等待结果的订阅连接还在旧端点上，改到新端点重新订阅（会先补取一次已订阅任务的结果）"""
+        consumer = self.result_consumer
+        if consumer._pubsub is None:
+            return
+        # 旧的订阅对象可能正被等待结果的线程使用，不主动关闭，释放引用后由其自身回收连接
+        if not consumer.subscribed_to:
+            # 下次等待结果时在新端点上重新创建
+            consumer._pubsub = None
+            return
+        consumer._ensure(consumer._reconnect_pubsub, ())
+
+
+def _resubscribe_results(previous: Endpoint, selected: Endpoint):
+    for backend in list(FailoverRedisBackend._instances):
+        backend.on_endpoint_switch()
+
+
+_listeners.append(_resubscribe_results)
+
+
+def _interrupt_consumer(consumer):
+    """让worker消费者断开当前连接，按重新排序的URL重连"""
+    connection = getattr(consumer, 'connection', None)
+    if connection is None:
+        return
+    hub = getattr(consumer.controller, 'hub', None)
+    if hub is not None:
+        # 事件循环中抛出连接错误，消费者按连接中断处理并重启
+        def interrupt():
+            raise redis.ConnectionError('切换到新的端点')
+        hub.call_soon(interrupt)
+        return
+    poller = getattr(connection.transport, 'cycle', None)
+    for channel in list(getattr(poller, '_channels', ())):
+        channel.client.connection_pool.disconnect()
+
+
+def install(app, config_manager) -> Optional[EndpointMonitor]:
+    """端点切换时重新排序消息代理URL、重置生产者连接池并让worker消费者重连"""
+    endpoints_config = config_manager.get_endpoints_config()
+    if not endpoints_config['enabled']:
+        return None
+
+    from celery import signals
+    from kombu import pools
+    from kombu.utils.collections import eqhash
+
+    app.conf.broker_failover_strategy = healthiest_failover
+    state = {'consumer': None}
+
+    def on_switch(previous: Endpoint, selected: Endpoint):
+        monitor = get_monitor()
+        # kombu按连接参数全局登记连接池和生产者池，从登记中移除旧的，切回时不会拿到已关闭的池
+        key = eqhash(app.connection_for_write())
+        app.conf.broker_url = ';'.join(monitor.ordered_urls())
+        app._pool = None
+        app.amqp._producer_pool = None
+        stale = [pool for pool in (pools.producers.pop(key, None), pools.connections.pop(key, None))
+                 if pool is not None]
+        if stale:
+            # 正在发送的消息可能还在用旧连接，等待一个socket超时后再关闭
+            def close():
+                for pool in stale:
+                    pool.force_close_all()
+            timer = threading.Timer(endpoints_config['socket_timeout'], close)
+            timer.daemon = True
+            timer.start()
+        if state['consumer'] is not None:
+            _interrupt_consumer(state['consumer'])
+
+    def on_worker_ready(sender=None, **kwargs):
+        state['consumer'] = sender
+
+    _listeners.append(on_switch)
+    signals.worker_ready.connect(on_worker_ready, weak=False)
+    return get_monitor()
+
+
+def main():
+    """持续显示各端点的探测结果"""
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='查看端点探测结果')
+    parser.add_argument('--watch', type=float, default=0, help='每隔N秒刷新一次（默认只显示一次）')
+    args = parser.parse_args()
+
+    from config_manager import ConfigManager
+
+    endpoints_config = ConfigManager().get_endpoints_config()
+    if not endpoints_config['endpoints']:
+        print("❌ 未配置 endpoints.endpoints")
+        return
+    monitor = get_monitor(endpoints_config)
+    while True:
+        print(json.dumps(monitor.get_stats(), indent=2, ensure_ascii=False))
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    main()
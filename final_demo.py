@@ -4,45 +4,59 @@
 """
 完整的Celery演示程序
 展示同步和异步任务执行
+默认使用本地并发执行模式（本进程内嵌worker，不需要Redis），--eager 时退回同步执行
 """
 
+import argparse
 import time
-from celery import Celery
+from celery import Celery, signals
 
-# 创建Celery应用
+import local_executor
+import task_log
+
+# 创建Celery应用（消息走内存传输，结果写入进程内结果后端）
 app = Celery('final_demo')
 app.conf.update(
-    broker_url='memory://',
-    result_backend='cache+memory://',
-    task_always_eager=True,  # 设为True进行同步演示
+    broker_url=local_executor.BROKER_URL,
+    result_backend=local_executor.RESULT_BACKEND,
     task_serializer='json',
     result_serializer='json',
     accept_content=['json'],
 )
 
+# 任务日志写到标准输出，与演示输出交替显示
+task_log.configure({'stream': 'stdout'})
+logger = task_log.get_task_logger(__name__)
+
+
+@signals.task_postrun.connect
+def _flush_task_log(**kwargs):
+    # 每个任务结束时写出，保持与演示输出的先后顺序
+    task_log.flush()
+
 # 定义任务
 @app.task
 def add_numbers(x, y):
     """加法任务"""
-    print(f"  执行加法: {x} + {y}")
+    logger.info("  执行加法: %s + %s", x, y)
     time.sleep(0.5)  # 模拟处理时间
     result = x + y
-    print(f"  加法结果: {result}")
+    logger.info("  加法结果: %s", result)
     return result
 
 @app.task
 def multiply_numbers(x, y):
     """乘法任务"""
-    print(f"  执行乘法: {x} * {y}")
+    logger.info("  执行乘法: %s * %s", x, y)
     time.sleep(0.5)  # 模拟处理时间
     result = x * y
-    print(f"  乘法结果: {result}")
+    logger.info("  乘法结果: %s", result)
     return result
 
 @app.task
 def process_data(data_list):
     """处理数据列表"""
-    print(f"  处理数据: {data_list}")
+    logger.info("  处理数据: %s", data_list)
     time.sleep(1)
     total = sum(data_list)
     average = total / len(data_list) if data_list else 0
@@ -52,13 +66,13 @@ def process_data(data_list):
         'average': round(average, 2),
         'count': len(data_list)
     }
-    print(f"  处理结果: {result}")
+    logger.info("  处理结果: %s", result)
     return result
 
 @app.task
 def simulate_error():
     """模拟错误的任务"""
-    print("  模拟任务错误...")
+    logger.info("  模拟任务错误...")
     raise Exception("这是一个模拟的错误")
 
 def demo_basic_tasks():
@@ -105,9 +119,11 @@ def demo_multiple_tasks():
         print(f"  发送乘法任务 {i+1}: {i + 2} * {i + 3}")
     
     print("\n收集所有任务结果:")
+    start = time.perf_counter()
     for i, (task_type, task) in enumerate(tasks):
         result = task.get()
         print(f"  任务 {i+1} ({task_type}): {result}")
+    print(f"  等待结果耗时: {time.perf_counter() - start:.2f}秒")
 
 def demo_error_handling():
     """演示错误处理"""
@@ -145,12 +161,24 @@ def demo_task_chaining():
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description='Celery 完整演示程序')
+    parser.add_argument('--eager', action='store_true', help='使用task_always_eager同步执行（不启动内嵌worker）')
+    parser.add_argument('--concurrency', type=int, default=4, help='内嵌worker的线程数')
+    args = parser.parse_args()
+
     print("Celery 完整演示程序")
     print("=" * 60)
-    print("注意：此演示使用同步模式，所有任务立即执行")
-    print("在生产环境中，任务会在后台异步执行")
+    if args.eager:
+        app.conf.task_always_eager = True
+        print("注意：此演示使用同步模式，所有任务立即执行")
+        print("在生产环境中，任务会在后台异步执行")
+    else:
+        app.conf.update(local_executor.app_settings(local_executor.DEFAULT_CONFIG))
+        local_executor.start(app, {'concurrency': args.concurrency})
+        print("注意：此演示使用本地并发执行模式，任务在本进程内嵌的worker中并发执行")
     print("=" * 60)
     
+    start = time.perf_counter()
     try:
         # 运行各种演示
         demo_basic_tasks()
@@ -160,11 +188,11 @@ def main():
         demo_task_chaining()
         
         print("\n" + "=" * 60)
-        print("🎉 所有演示完成!")
+        print(f"🎉 所有演示完成! 总耗时 {time.perf_counter() - start:.2f}秒")
         print("\n要在真实环境中运行异步任务，请:")
         print("1. 启动Redis服务器")
         print("2. 修改broker_url为 'redis://localhost:6379/0'")
-        print("3. 设置task_always_eager=False")
+        print("3. 去掉内存传输和进程内结果后端的设置")
         print("4. 在单独的终端运行: celery -A final_demo worker --loglevel=info")
         print("=" * 60)
         
@@ -174,6 +202,8 @@ def main():
         print(f"\n程序出错: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        local_executor.stop()
 
 if __name__ == '__main__':
     main()
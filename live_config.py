@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+配置热更新模块
+不重启worker即可生效的配置项：
+- celery.worker_prefetch_multiplier、worker_profiles.<队列>.prefetch_multiplier：调整预取额度
+- worker_profiles.<队列>.concurrency：进程池/线程池扩缩（不支持扩缩的池只打印提示）
+- celery.result_expires：结果过期时间
+- rate_limits：集群级令牌桶规则
+- task_logging：任务日志级别、采样率和截断长度
+其他配置（连接、路由、序列化等）变化时只提示需要重启。
+
+配置来源有两个：
+- 本机 config.json：worker主进程定期检查修改时间，校验通过后生效
+- 推送配置：python live_config.py --push 校验本地配置后写入Redis，
+  并广播远程控制命令 apply_live_config，各worker立即重新检查
+进程级配置（结果过期时间、限流规则、任务日志）在每个执行任务的进程中按 interval 节流检查，
+任务热路径上只有一次时间比较；预取和池大小只存在于worker主进程，由控制命令在消费者线程中调整。
+"""
+
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from celery.worker.control import control_command, ok
+
+import task_log
+
+# 可热更新的配置块（celery块中只有以下两项）
+LIVE_BLOCKS = ('rate_limits', 'task_logging', 'worker_profiles', 'live_config')
+LIVE_CELERY_KEYS = ('worker_prefetch_multiplier', 'result_expires')
+
+
+def live_settings(config_manager) -> Dict[str, Any]:
+    """从当前配置中提取可热更新的部分"""
+    celery_config = config_manager.get_celery_config()
+    return {
+        'worker_prefetch_multiplier': celery_config.get('worker_prefetch_multiplier', 1),
+        'result_expires': celery_config.get('result_expires', 3600),
+        'rate_limits': config_manager.get_rate_limits_config(),
+        'task_logging': config_manager.get_task_logging_config(),
+        'worker_profiles': {
+            name: {key: profile.get(key) for key in ('concurrency', 'prefetch_multiplier')}
+            for name, profile in config_manager.get_worker_profiles().items()
+        },
+    }
+
+
+def restart_required(changes: Dict[str, Tuple[Any, Any]]) -> list:
+    """变化中需要重启worker才能生效的配置项"""
+    keys = []
+    for block, (old, new) in changes.items():
+        if block in LIVE_BLOCKS:
+            continue
+        if block == 'celery' and isinstance(old, dict) and isinstance(new, dict):
+            keys.extend(f"celery.{key}" for key in set(old) | set(new)
+                        if key not in LIVE_CELERY_KEYS and old.get(key) != new.get(key))
+        else:
+            keys.append(block)
+    return sorted(keys)
+
+
+class LiveConfig:
+    """进程内的热更新状态"""
+
+    def __init__(self, app, config_manager):
+        self.app = app
+        self.config_manager = config_manager
+        live_config = config_manager.get_live_config()
+        self.interval = live_config['interval']
+        self.key = live_config['key']
+        self.settings = live_settings(config_manager)
+        self.pushed_version: Optional[str] = None
+        # 上次应用到消费者（预取、池大小）的配置，只在worker主进程中使用
+        self.worker_applied: Optional[Dict[str, Any]] = None
+        self._next_check = time.monotonic() + self.interval
+        self._lock = threading.Lock()
+
+    # ---- 进程级 ----
+
+    def _fetch_pushed(self) -> Optional[Dict[str, Any]]:
+        client = self.config_manager.get_backend_redis_client()
+        if client is None:
+            return None
+        version, payload = client.hmget(self.key, 'version', 'settings')
+        if version is None:
+            self.pushed_version = None
+            return None
+        version = version.decode() if isinstance(version, bytes) else version
+        self.pushed_version = version
+        return json.loads(payload)
+
+    def refresh(self) -> bool:
+        """检查本机配置文件和推送配置，有变化时应用进程级配置；返回是否变化"""
+        changes = self.config_manager.check_for_changes()
+        if changes:
+            keys = restart_required(changes)
+            if keys:
+                print(f"⚠️  以下配置需要重启worker才能生效: {', '.join(keys)}")
+        settings = live_settings(self.config_manager)
+        try:
+            pushed = self._fetch_pushed()
+        except Exception as e:
+            print(f"⚠️  读取推送配置失败: {e}")
+            pushed = None
+        if pushed:
+            settings.update(pushed)
+        if settings == self.settings:
+            return False
+
+        if settings['result_expires'] != self.settings['result_expires']:
+            self.app.conf.result_expires = settings['result_expires']
+        if settings['rate_limits'] != self.settings['rate_limits']:
+            # rate_limit导入时依赖celery_app，这里延迟导入
+            import rate_limit
+            rate_limit.configure(settings['rate_limits'])
+        if settings['task_logging'] != self.settings['task_logging']:
+            task_log.configure(settings['task_logging'])
+        self.settings = settings
+        print(f"🔄 配置已更新{'（推送版本 ' + self.pushed_version + '）' if self.pushed_version else ''}")
+        return True
+
+    def maybe_refresh(self):
+        """按间隔节流的检查，供任务热路径调用"""
+        if time.monotonic() < self._next_check:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = time.monotonic() + self.interval
+            self.refresh()
+        except Exception as e:
+            print(f"⚠️  检查配置变化失败: {e}")
+        finally:
+            self._lock.release()
+
+    def on_prerun(self, task=None, **kwargs):
+        self.maybe_refresh()
+        # 线程池中每个线程有自己的结果后端实例，各自对齐过期时间
+        backend = task.backend
+        expires = self.settings['result_expires']
+        if getattr(backend, 'expires', expires) != expires:
+            backend.expires = expires
+
+    # ---- worker主进程 ----
+
+    def _targets(self, settings: Dict[str, Any], hostname: str) -> Tuple[Optional[int], int]:
+        """按worker名找到对应的worker配置（自动伸缩启动的worker名为 队列-序号）"""
+        name = hostname.split('@')[0]
+        profiles = settings['worker_profiles']
+        profile = profiles.get(name) or profiles.get(re.sub(r'-\d+$', '', name)) or {}
+        multiplier = profile.get('prefetch_multiplier')
+        if multiplier is None:
+            multiplier = settings['worker_prefetch_multiplier']
+        return profile.get('concurrency'), multiplier
+
+    def apply_worker(self, consumer) -> Dict[str, Any]:
+        """把池大小和预取额度的变化应用到消费者；只在配置值本身变化时调整"""
+        applied: Dict[str, Any] = {}
+        if self.worker_applied is None:
+            self.worker_applied = self.settings
+            return applied
+        old_concurrency, old_multiplier = self._targets(self.worker_applied, consumer.hostname)
+        concurrency, multiplier = self._targets(self.settings, consumer.hostname)
+        self.worker_applied = self.settings
+
+        pool = consumer.pool
+        if concurrency and concurrency != old_concurrency and concurrency != pool.num_processes:
+            delta = concurrency - pool.num_processes
+            try:
+                if delta > 0:
+                    pool.grow(delta)
+                else:
+                    pool.shrink(-delta)
+                consumer._update_prefetch_count(delta)
+                applied['concurrency'] = concurrency
+            except (AttributeError, NotImplementedError, ValueError) as e:
+                print(f"⚠️  当前并发模型不支持在线调整池大小，需要重启: {e}")
+
+        if multiplier != old_multiplier and multiplier != consumer.prefetch_multiplier:
+            old_prefetch = consumer.initial_prefetch_count
+            consumer.prefetch_multiplier = multiplier
+            consumer.initial_prefetch_count = pool.num_processes * multiplier
+            if old_prefetch and consumer.initial_prefetch_count:
+                # 保留ETA任务占用的额外额度
+                consumer.qos.value = max(1, consumer.qos.value + consumer.initial_prefetch_count - old_prefetch)
+            else:
+                consumer.qos.value = consumer.initial_prefetch_count
+            consumer.qos.update()
+            applied['prefetch_multiplier'] = multiplier
+
+        if applied:
+            print(f"🔄 {consumer.hostname} 已调整: {applied}")
+        return applied
+
+    def watch(self, hostname: str):
+        """worker主进程中定期检查，池大小或预取需要调整时通过控制命令在消费者线程中应用"""
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self._lock:
+                    self.refresh()
+                # 任务线程也可能先完成检查，这里按是否已应用到消费者判断
+                if self.worker_applied is not None and \
+                        self._targets(self.worker_applied, hostname) != self._targets(self.settings, hostname):
+                    self.app.control.broadcast('apply_live_config', destination=[hostname], reply=False)
+            except Exception as e:
+                print(f"⚠️  检查配置变化失败: {e}")
+
+
+live: Optional[LiveConfig] = None
+
+
+@control_command()
+def apply_live_config(state, **kwargs):
+    """重新检查配置（本机文件和推送配置）并应用到本worker"""
+    if live is None:
+        return ok('live config disabled')
+    with live._lock:
+        live.refresh()
+    return ok(live.apply_worker(state.consumer))
+
+
+def install(app, config_manager) -> Optional[LiveConfig]:
+    """连接任务信号；worker就绪后开始检查配置变化"""
+    global live
+    if not config_manager.get_live_config()['enabled'] or live is not None:
+        return live
+
+    from celery import signals
+
+    live = LiveConfig(app, config_manager)
+    signals.task_prerun.connect(live.on_prerun, weak=False)
+
+    def on_worker_ready(sender=None, **kwargs):
+        live.apply_worker(sender)
+        threading.Thread(target=live.watch, args=(sender.hostname,), name='live-config', daemon=True).start()
+
+    signals.worker_ready.connect(on_worker_ready, weak=False)
+    return live
+
+
+def push(app, config_manager) -> Dict[str, Any]:
+    """校验本地配置后写入Redis并通知所有worker，返回各worker的应用结果"""
+    from config_manager import validate_config
+
+    errors = validate_config(config_manager.config)
+    if errors:
+        raise ValueError('; '.join(errors))
+    client = config_manager.get_backend_redis_client()
+    if client is None:
+        raise RuntimeError("当前使用内存传输，无法推送配置")
+    version = time.strftime('%Y%m%d%H%M%S')
+    client.hset(config_manager.get_live_config()['key'],
+                mapping={'version': version, 'settings': json.dumps(live_settings(config_manager))})
+    replies = app.control.broadcast('apply_live_config', reply=True, timeout=2)
+    return {'version': version, 'replies': replies}
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='把可热更新的配置推送到运行中的worker')
+    parser.add_argument('--push', action='store_true', help='推送本地config.json中可热更新的配置')
+    parser.add_argument('--clear', action='store_true', help='删除推送配置，worker回到各自的本机配置')
+    args = parser.parse_args()
+
+    from celery_app import app, config_manager
+
+    client = config_manager.get_backend_redis_client()
+    key = config_manager.get_live_config()['key']
+    if args.push:
+        result = push(app, config_manager)
+        print(f"✅ 已推送配置版本 {result['version']}")
+        for reply in result['replies']:
+            for hostname, response in reply.items():
+                print(f"  {hostname}: {response.get('ok', response)}")
+    elif args.clear:
+        if client is not None:
+            client.delete(key)
+        app.control.broadcast('apply_live_config', reply=False)
+        print("✅ 已删除推送配置")
+    else:
+        print("可热更新的配置")
+        print("=" * 50)
+        print(json.dumps(live_settings(config_manager), indent=2, ensure_ascii=False))
+        if client is not None and client.exists(key):
+            version = client.hget(key, 'version')
+            print(f"\n已推送版本: {version.decode() if isinstance(version, bytes) else version}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+本地并发执行模式（代替 task_always_eager）
+task_always_eager 在调用 .delay() 的线程里同步执行任务，任务之间完全串行，
+也没有真正的任务状态流转。本地执行模式在本进程内嵌一个worker：
+- 消息走内存传输（memory://），结果写入进程内结果后端，不需要Redis
+- 任务在线程池中并发执行，AsyncResult 的 state/get/进度（update_state）、重试（countdown）、
+  chain/group/chord 与连接真实worker时一致
+- get() 在结果写入时立即被唤醒，不按 interval 轮询
+
+config.json 中 local_executor.enabled 为 true 时，celery_app 使用本地执行模式，
+第一次发送任务时启动内嵌worker；也可以在演示和测试中直接使用：
+
+    with LocalExecutor(app, concurrency=4):
+        add.delay(1, 2).get()
+
+pool 为 threads（默认）或 solo；prefork 的子进程看不到本进程内存中的消息和结果，
+只能配合真实的消息代理和结果后端（如本地Redis）使用。
+"""
+
+import atexit
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from celery import signals, states
+from celery.backends.cache import CacheBackend
+from celery.exceptions import TimeoutError
+
+import metrics
+
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "enabled": False,
+    "pool": "threads",
+    "concurrency": 4,
+    "queues": [],
+    "polling_interval": 0.005,
+    "shutdown_timeout": 30,
+}
+
+BROKER_URL = 'memory://'
+RESULT_BACKEND = f'{__name__}.LocalResultBackend+memory://'
+
+# 本进程启动的本地执行器（由 install 按配置在首次发送任务时启动）
+_executor: Optional['LocalExecutor'] = None
+_executor_lock = threading.Lock()
+# 通过celery命令启动的worker进程中不再内嵌worker
+_in_worker = False
+
+
+class LocalResultBackend(CacheBackend):
+    """进程内结果后端：结果写入时唤醒等待的线程"""
+
+    # 所有实例（每个线程一个）共享同一份内存缓存，也共享同一个条件变量
+    _changed = threading.Condition()
+    _version = 0
+
+    def set(self, key, value):
+        super().set(key, value)
+        with self._changed:
+            LocalResultBackend._version += 1
+            self._changed.notify_all()
+
+    def wait_for(self, task_id, timeout=None, interval=0.5, no_ack=True, on_interval=None):
+        """等待任务结束；结果写入时立即返回，interval只作为调用on_interval的间隔"""
+        self._ensure_not_eager()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            version = LocalResultBackend._version
+            meta = self.get_task_meta(task_id)
+            if meta['status'] in states.READY_STATES:
+                return meta
+            if on_interval:
+                on_interval()
+            wait = interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    raise TimeoutError('The operation timed out.')
+            with self._changed:
+                if LocalResultBackend._version == version:
+                    self._changed.wait(wait)
+
+
+class LocalExecutor:
+    """
+    本进程内嵌的worker
+
+    start() 在后台线程中启动worker，等待它开始消费后返回；stop() 等待正在执行的任务结束后退出。
+    """
+
+    def __init__(self, app, pool: str = 'threads', concurrency: int = 4,
+                 queues: Optional[List[str]] = None, shutdown_timeout: float = 30,
+                 loglevel: str = 'WARNING'):
+        if pool not in ('threads', 'solo', 'prefork'):
+            raise ValueError(f"本地执行模式不支持的并发模型: {pool}（可用: threads, solo, prefork）")
+        if pool == 'prefork' and (app.conf.broker_url or '').startswith('memory://'):
+            raise ValueError("prefork子进程无法读取内存传输中的消息，请使用threads或配合本地Redis使用")
+        self.app = app
+        self.pool = pool
+        self.concurrency = 1 if pool == 'solo' else concurrency
+        self.queues = queues or metrics._routed_queues(app)
+        self.shutdown_timeout = shutdown_timeout
+        self.loglevel = loglevel
+        self.worker = None
+        self._context = None
+
+    def start(self) -> 'LocalExecutor':
+        from celery.app.trace import setup_worker_optimizations
+        from celery.contrib.testing.worker import start_worker
+
+        if self._context is not None:
+            return self
+        # 与 task_always_eager 互斥：打开时 .delay() 仍会同步执行
+        self.app.conf.task_always_eager = False
+        # 与celery命令启动的worker一致：自定义 __call__ 的任务基类（RateLimitedTask）在执行时
+        # 读到的是worker的请求（任务ID等），否则绑定任务的进度、断点都拿不到任务ID
+        setup_worker_optimizations(self.app)
+        start = time.perf_counter()
+        self._context = start_worker(self.app, pool=self.pool, concurrency=self.concurrency,
+                                     loglevel=self.loglevel, perform_ping_check=False,
+                                     queues=self.queues, shutdown_timeout=self.shutdown_timeout)
+        self.worker = self._context.__enter__()
+        print(f"🚀 本地执行模式: {self.pool} x {self.concurrency}，队列 {', '.join(self.queues)}"
+              f"（启动 {time.perf_counter() - start:.2f}s）")
+        return self
+
+    def stop(self):
+        if self._context is None:
+            return
+        context, self._context = self._context, None
+        context.__exit__(None, None, None)
+        self.worker = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+def app_settings(local_config: Dict[str, Any]) -> Dict[str, Any]:
+    """本地执行模式需要的Celery配置（不含消息代理和结果后端）"""
+    return {
+        'task_always_eager': False,
+        # 内存传输默认每秒轮询一次队列，且没有事件循环：预取额度用完后worker要等到
+        # drain_events 超时才继续取消息，本地执行时不限制预取
+        'worker_prefetch_multiplier': 0,
+        'broker_transport_options': {'polling_interval': local_config['polling_interval']},
+    }
+
+
+def start(app, local_config: Optional[Dict[str, Any]] = None) -> LocalExecutor:
+    """按配置启动本进程的本地执行器（已启动时直接返回）"""
+    global _executor
+    config = dict(DEFAULT_CONFIG)
+    config.update(local_config or {})
+    with _executor_lock:
+        if _executor is None:
+            executor = LocalExecutor(app, pool=config['pool'], concurrency=config['concurrency'],
+                                     queues=config['queues'], shutdown_timeout=config['shutdown_timeout'])
+            _executor = executor.start()
+            atexit.register(stop)
+        return _executor
+
+
+def stop():
+    """停止本进程的本地执行器"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.stop()
+
+
+def install(app, config_manager) -> Optional[Dict[str, Any]]:
+    """local_executor.enabled 时设置本地执行模式，首次发送任务时启动内嵌worker；返回生效的配置"""
+    local_config = config_manager.get_local_executor_config()
+    if not local_config['enabled']:
+        return None
+
+    # 消息代理和结果后端由 ConfigManager.resolve_backend 解析为 BROKER_URL / RESULT_BACKEND，
+    # 轮询间隔由 ConfigManager.get_celery_pool_settings 写入传输选项（导入时不读取app.conf）
+    settings = app_settings(local_config)
+    del settings['broker_transport_options']
+    app.conf.update(settings)
+
+    def on_worker_init(sender=None, **kwargs):
+        global _in_worker
+        from celery.contrib.testing.worker import TestWorkController
+
+        if not isinstance(sender, TestWorkController):
+            _in_worker = True
+
+    def on_before_task_publish(**kwargs):
+        if _executor is None and not _in_worker:
+            start(app, local_config)
+
+    signals.worker_init.connect(on_worker_init, weak=False)
+    signals.before_task_publish.connect(on_before_task_publish, weak=False)
+    return local_config
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+确定性任务的结果记忆与在途去重模块
+用 @app.task(base=MemoizedTask, deterministic=True) 声明的纯函数任务：
+- 以 任务名 + 规范化参数 的哈希为键，在Redis中记录首次提交的任务ID（带TTL）
+- 提交时键已存在（正在执行或已完成）则不再发送消息，直接返回原任务的AsyncResult，
+  相同请求只执行一次、结果只存一份
+- worker上另有有界的进程内LRU，并可读取Redis记录指向的已完成结果，
+  覆盖未经提交去重的执行（如chain/group中的任务）
+- 任务失败或消息发送失败时删除记录，之后的相同请求重新执行
+- apply_async(memoize=False) 既不做提交去重，worker上也不复用结果（用于基准测试等需要实际执行的场景）
+- 调用方显式指定 queue/routing_key/exchange/priority 时不做提交去重（附着到已有任务会丢失这些选项），
+  仍会在worker上复用已完成的结果
+命中/未命中/淘汰计数见 get_memo_stats()，启用指标时同时计入 celery_memo_total
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import redis
+from celery import states
+from celery.utils import uuid
+
+import metrics
+from celery_app import app, config_manager
+
+# 出现这些选项时任务属于canvas的一部分，必须真正发送以触发回调
+CANVAS_OPTIONS = ('link', 'link_error', 'chain', 'chord', 'group_id')
+# 附着到已有任务时无法生效的路由选项
+ROUTING_OPTIONS = ('queue', 'routing_key', 'exchange', 'priority')
+
+# 仅当键仍指向本任务时删除（避免误删其他任务写入的记录）
+_DELETE_IF_OWNER = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_memo_config = config_manager.get_memoization_config()
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = {
+    'submit_hits': 0,
+    'submit_misses': 0,
+    'lru_hits': 0,
+    'remote_hits': 0,
+    'misses': 0,
+    'evictions': 0,
+    'invalidations': 0,
+}
+
+
+def _count(event: str):
+    with _stats_lock:
+        _stats[event] += 1
+    if metrics.registry is not None:
+        metrics.registry.inc('celery_memo_total', (('event', event),))
+
+
+def get_memo_stats() -> Dict[str, int]:
+    """当前进程的命中/未命中/淘汰计数"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _canonical(obj):
+    """JSON无法直接表示的类型转换为稳定形式；数组按值处理，与解码前的列表得到相同的键"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=repr)
+    raise TypeError(f"无法为类型 {type(obj).__name__} 生成记忆键")
+
+
+def memo_key(task_name: str, args, kwargs) -> str:
+    """任务名 + 规范化参数的内容哈希"""
+    payload = json.dumps([task_name, list(args or ()), kwargs or {}], sort_keys=True,
+                         separators=(',', ':'), default=_canonical)
+    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return f"{_memo_config['key_prefix']}{task_name}:{digest}"
+
+
+class LRUCache:
+    """线程安全的有界LRU"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Tuple[bool, Any]:
+        with self._lock:
+            if key not in self._data:
+                return False, None
+            self._data.move_to_end(key)
+            return True, self._data[key]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        evicted = 0
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                evicted += 1
+        for _ in range(evicted):
+            _count('evictions')
+
+    def __len__(self):
+        return len(self._data)
+
+
+_lru = LRUCache(_memo_config['lru_size'])
+_delete_script = None
+
+
+def _redis():
+    return config_manager.get_backend_redis_client()
+
+
+class MemoizedTask(app.Task):
+    """声明 deterministic=True 时启用结果记忆和在途去重的任务基类"""
+
+    deterministic = False
+    # 记忆时间（秒），为空时使用配置；不超过结果过期时间
+    memo_ttl: Optional[int] = None
+
+    def _memo_enabled(self) -> bool:
+        # 记忆依赖结果后端中的结果，不存储成功结果的任务不启用
+        return (self.deterministic and _memo_config['enabled'] and not self.ignore_result
+                and getattr(self, 'result_policy', None) != 'failure_only')
+
+    def _ttl(self) -> int:
+        ttl = self.memo_ttl or _memo_config['ttl']
+        result_expires = getattr(self, 'result_ttl', None) or self.app.conf.result_expires
+        if result_expires:
+            seconds = result_expires.total_seconds() if hasattr(result_expires, 'total_seconds') else result_expires
+            ttl = min(ttl, int(seconds))
+        return max(1, int(ttl))
+
+    def apply_async(self, args=None, kwargs=None, task_id=None, **options):
+        memoize = options.pop('memoize', True)
+        if not memoize:
+            # worker上也不复用结果（流水线中的每个签名各自携带该选项）
+            options['headers'] = dict(options.get('headers') or {}, memoize=False)
+        # 指定了task_id（chain预分配的ID、重试、调用方自行跟踪）时必须以该ID发送
+        if (not memoize or task_id is not None or not self._memo_enabled()
+                or self.app.conf.task_always_eager
+                or any(options.get(name) for name in CANVAS_OPTIONS)
+                or any(options.get(name) is not None for name in ROUTING_OPTIONS)):
+            return super().apply_async(args, kwargs, task_id=task_id, **options)
+
+        client = _redis()
+        if client is None:
+            return super().apply_async(args, kwargs, task_id=task_id, **options)
+
+        key = memo_key(self.name, args, kwargs)
+        task_id = uuid()
+        # 抢占记录：成功者发送消息，其余请求附着到已有任务
+        if client.set(key, task_id, nx=True, ex=self._ttl()):
+            _count('submit_misses')
+            try:
+                return super().apply_async(args, kwargs, task_id=task_id, **options)
+            except Exception:
+                # 消息没有发出：释放记录，否则TTL内相同请求都附着到不存在的任务
+                self._release(client, key, task_id)
+                raise
+
+        existing = client.get(key)
+        if isinstance(existing, bytes):
+            existing = existing.decode()
+        if existing is None:
+            # 记录恰好过期或被删除
+            _count('submit_misses')
+            return super().apply_async(args, kwargs, task_id=task_id, **options)
+        _count('submit_hits')
+        return self.AsyncResult(existing)
+
+    def __call__(self, *args, **kwargs):
+        if (not self._memo_enabled() or self.request.called_directly
+                or getattr(self.request, 'memoize', True) is False):
+            return super().__call__(*args, **kwargs)
+
+        key = memo_key(self.name, args, kwargs)
+        found, value = _lru.get(key)
+        if found:
+            _count('lru_hits')
+            return value
+
+        client = _redis()
+        if client is not None:
+            found, value = self._lookup_remote(client, key)
+            if found:
+                _count('remote_hits')
+                _lru.put(key, value)
+                return value
+
+        _count('misses')
+        value = super().__call__(*args, **kwargs)
+        _lru.put(key, value)
+        if client is not None:
+            # 未经提交去重的执行（canvas中的任务）也登记，供之后的相同请求复用
+            client.set(key, self.request.id, nx=True, ex=self._ttl())
+        return value
+
+    def _lookup_remote(self, client, key: str) -> Tuple[bool, Any]:
+        """Redis记录指向其他已成功的任务时，直接读取它的结果"""
+        owner = client.get(key)
+        if owner is None:
+            return False, None
+        owner = owner.decode() if isinstance(owner, bytes) else owner
+        if owner == self.request.id:
+            return False, None
+        meta = self.backend.get_task_meta(owner)
+        if meta.get('status') == states.SUCCESS:
+            return True, meta.get('result')
+        return False, None
+
+    @staticmethod
+    def _release(client, key: str, task_id: str) -> bool:
+        """删除仍指向 task_id 的记录"""
+        global _delete_script
+        if _delete_script is None:
+            _delete_script = client.register_script(_DELETE_IF_OWNER)
+        try:
+            return bool(_delete_script(keys=[key], args=[task_id], client=client))
+        except redis.RedisError as e:
+            print(f"⚠️  删除结果记忆记录失败 {key}: {e}")
+            return False
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        """失败结果不复用：删除仍指向本任务的记录"""
+        if self._memo_enabled():
+            client = _redis()
+            if client is not None:
+                if self._release(client, memo_key(self.name, args, kwargs), task_id):
+                    _count('invalidations')
+        return super().on_failure(exc, task_id, args, kwargs, einfo)
@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+热路径埋点与指标导出模块
+通过Celery信号（before/after_task_publish、task_prerun、task_postrun、task_retry、task_failure）
+按任务和队列记录直方图：排队等待、执行耗时、发布耗时、结果写入耗时；按序列化器记录编解码耗时；
+定期采样消息代理中各队列的积压长度，并通过本地HTTP端点以Prometheus文本格式导出。
+
+prefork子进程各自记录，定期把快照写入以worker主进程PID命名的目录，
+由主进程的HTTP端点合并后导出；单进程（solo/threads）直接导出内存中的数据。
+"""
+
+import argparse
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from kombu.serialization import registry as serializer_registry
+from kombu.transport.redis import PRIORITY_STEPS, Channel
+
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# 指标名 -> 说明
+HISTOGRAMS = {
+    'celery_task_queue_wait_seconds': '任务从发布到开始执行的等待时间',
+    'celery_task_runtime_seconds': '任务执行耗时（含结果写入）',
+    'celery_task_publish_seconds': '发布任务消息耗时（序列化+发送）',
+    'celery_task_result_store_seconds': '写入结果后端耗时',
+    'celery_serialization_seconds': '消息编解码耗时',
+}
+COUNTERS = {
+    'celery_task_published_total': '已发布的任务数',
+    'celery_task_finished_total': '执行结束的任务数（按最终状态）',
+    'celery_task_retries_total': '任务重试次数',
+    'celery_task_failures_total': '任务失败次数',
+    'celery_memo_total': '确定性任务的结果记忆事件（命中/未命中/淘汰）',
+    'celery_retry_denied_total': '被重试预算或熔断器拒绝的重试次数',
+    'celery_rate_limit_total': '集群级令牌桶限流结果（放行/推迟）',
+    'celery_priority_promoted_total': '低优先级通道中等待过久而被提升的消息数',
+    'celery_endpoint_switch_total': '端点切换次数（故障转移/故障恢复）',
+    'celery_checkpoint_total': '长任务断点事件（保存/续跑/取消/退回队列）',
+    'celery_task_log_total': '任务日志条数（写出/采样丢弃/队列满丢弃）',
+    'celery_result_store_total': '任务结果写入（批量写出/合并/按策略跳过/写出失败的批次）',
+    'celery_result_store_saved_total': '批量写入结果节省的往返、命令和字节数',
+}
+GAUGES = {
+    'celery_queue_depth': '消息代理中的队列积压长度',
+    'celery_circuit_state': '任务重试熔断器状态（0关闭 1半开 2打开）',
+    'celery_endpoint_up': '消息代理/结果后端端点是否健康（1健康 0不可用）',
+    'celery_endpoint_rtt_ms': '端点PING往返时延（指数平滑，毫秒）',
+}
+
+# 发布时写入消息头的时间戳（墙上时钟，跨主机时受时钟偏差影响）
+PUBLISHED_AT_HEADER = 'x_published_at'
+
+
+class Histogram:
+    """固定桶的直方图"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class MetricsRegistry:
+    """进程内的指标存储，标签为 (名称, 值) 元组"""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.gauges: Dict[Tuple[str, Tuple], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, labels: Tuple, value: float):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram(self.buckets))
+        histogram.observe(value)
+
+    def inc(self, name: str, labels: Tuple, amount: float = 1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name: str, labels: Tuple, value: float):
+        self.gauges[(name, labels)] = value
+
+    def snapshot(self) -> Dict[str, List]:
+        """可JSON序列化的快照"""
+        with self._lock:
+            histograms = list(self.histograms.items())
+            counters = list(self.counters.items())
+            gauges = list(self.gauges.items())
+        return {
+            'histograms': [[name, list(labels), list(h.counts), h.sum, h.count]
+                           for (name, labels), h in histograms],
+            'counters': [[name, list(labels), value] for (name, labels), value in counters],
+            'gauges': [[name, list(labels), value] for (name, labels), value in gauges],
+        }
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, List]]) -> Dict[str, Dict]:
+    """合并多个进程的快照：直方图和计数器相加，仪表取最后一个值"""
+    histograms: Dict[Tuple[str, Tuple], List] = {}
+    counters: Dict[Tuple[str, Tuple], float] = {}
+    gauges: Dict[Tuple[str, Tuple], float] = {}
+    for snapshot in snapshots:
+        for name, labels, counts, total, count in snapshot.get('histograms', []):
+            key = (name, tuple(tuple(label) for label in labels))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = [list(counts), total, count]
+            else:
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        for name, labels, value in snapshot.get('counters', []):
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, value in snapshot.get('gauges', []):
+            gauges[(name, tuple(tuple(label) for label in labels))] = value
+    return {'histograms': histograms, 'counters': counters, 'gauges': gauges}
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Tuple, extra: Optional[Tuple] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in items) + '}'
+
+
+def render_prometheus(merged: Dict[str, Dict], buckets: Tuple[float, ...]) -> str:
+    """按Prometheus文本格式输出"""
+    lines = []
+    by_name: Dict[str, List] = {}
+    for (name, labels), value in merged['histograms'].items():
+        by_name.setdefault(name, []).append((labels, value))
+    for name in sorted(by_name):
+        lines.append(f'# HELP {name} {HISTOGRAMS.get(name, name)}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, (counts, total, count) in by_name[name]:
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels(labels, ("le", repr(bound)))} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, ("le", "+Inf"))} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+    for kind, series, help_texts in (('counter', merged['counters'], COUNTERS),
+                                     ('gauge', merged['gauges'], GAUGES)):
+        by_name = {}
+        for (name, labels), value in series.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for name in sorted(by_name):
+            lines.append(f'# HELP {name} {help_texts.get(name, name)}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in by_name[name]:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def queue_keys(queue: str, priority_steps=PRIORITY_STEPS) -> List[str]:
+    """kombu Redis传输中一个队列对应的各优先级列表键"""
+    keys = []
+    for step in priority_steps:
+        key = f"{queue}{Channel.sep}{step}" if step else queue
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+def queue_depths(client, queues: Iterable[str], priority_steps=PRIORITY_STEPS) -> Dict[str, int]:
+    """一次管道读取多个队列的积压长度（各优先级列表之和）"""
+    pipe = client.pipeline(transaction=False)
+    layout = []
+    for queue in queues:
+        keys = queue_keys(queue, priority_steps)
+        layout.append((queue, len(keys)))
+        for key in keys:
+            pipe.llen(key)
+    lengths = pipe.execute()
+
+    depths, offset = {}, 0
+    for queue, count in layout:
+        depths[queue] = sum(lengths[offset:offset + count])
+        offset += count
+    return depths
+
+
+class TaskInstrumentation:
+    """信号处理器：记录发布、排队、执行、结果写入和失败/重试"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self._publishing: Dict[str, float] = {}
+        self._running: Dict[str, float] = {}
+
+    @staticmethod
+    def _queue_of(task) -> str:
+        delivery_info = getattr(task.request, 'delivery_info', None) or {}
+        return delivery_info.get('routing_key') or 'unknown'
+
+    def before_publish(self, sender=None, headers=None, routing_key=None, **kwargs):
+        if headers is None:
+            return
+        headers[PUBLISHED_AT_HEADER] = time.time()
+        self._publishing[headers.get('id')] = time.perf_counter()
+
+    def after_publish(self, sender=None, headers=None, routing_key=None, **kwargs):
+        started = self._publishing.pop((headers or {}).get('id'), None)
+        labels = (('task', sender), ('queue', routing_key or 'unknown'))
+        if started is not None:
+            self.registry.observe('celery_task_publish_seconds', labels, time.perf_counter() - started)
+        self.registry.inc('celery_task_published_total', labels)
+
+    def prerun(self, task_id=None, task=None, **kwargs):
+        self._running[task_id] = time.perf_counter()
+        published_at = getattr(task.request, PUBLISHED_AT_HEADER, None)
+        if published_at is not None:
+            labels = (('task', task.name), ('queue', self._queue_of(task)))
+            self.registry.observe('celery_task_queue_wait_seconds', labels, max(0.0, time.time() - published_at))
+        self._wrap_backend(task.backend)
+
+    def postrun(self, task_id=None, task=None, state=None, **kwargs):
+        started = self._running.pop(task_id, None)
+        labels = (('task', task.name), ('queue', self._queue_of(task)))
+        if started is not None:
+            self.registry.observe('celery_task_runtime_seconds', labels, time.perf_counter() - started)
+        self.registry.inc('celery_task_finished_total', labels + (('state', state or 'unknown'),))
+
+    def retry(self, sender=None, request=None, **kwargs):
+        queue = ((getattr(request, 'delivery_info', None) or {}).get('routing_key')) or 'unknown'
+        self.registry.inc('celery_task_retries_total', (('task', sender.name), ('queue', queue)))
+
+    def failure(self, sender=None, **kwargs):
+        self.registry.inc('celery_task_failures_total', (('task', sender.name), ('queue', self._queue_of(sender))))
+
+    def _wrap_backend(self, backend):
+        """结果后端实例按线程缓存，首次见到时包装其store_result"""
+        if getattr(backend, '_metrics_wrapped', False):
+            return
+        store_result = backend.store_result
+        registry = self.registry
+
+        def timed_store_result(task_id, result, state, traceback=None, request=None, **kwargs):
+            started = time.perf_counter()
+            try:
+                return store_result(task_id, result, state, traceback=traceback, request=request, **kwargs)
+            finally:
+                delivery_info = getattr(request, 'delivery_info', None) or {}
+                labels = (('task', getattr(request, 'task', None) or 'unknown'),
+                          ('queue', delivery_info.get('routing_key') or 'unknown'))
+                registry.observe('celery_task_result_store_seconds', labels, time.perf_counter() - started)
+
+        backend.store_result = timed_store_result
+        backend._metrics_wrapped = True
+
+
+def instrument_serializers(registry: MetricsRegistry):
+    """包装kombu已注册的编解码器，按序列化器记录耗时"""
+    for name, codec in list(serializer_registry._encoders.items()):
+        if getattr(codec.encoder, '_metrics_wrapped', False):
+            continue
+        serializer_registry._encoders[name] = codec._replace(
+            encoder=_timed(codec.encoder, registry, (('serializer', name), ('op', 'encode'))))
+        decoder = serializer_registry._decoders.get(codec.content_type)
+        if decoder is not None and not getattr(decoder, '_metrics_wrapped', False):
+            serializer_registry._decoders[codec.content_type] = _timed(
+                decoder, registry, (('serializer', name), ('op', 'decode')))
+
+
+def _timed(func, registry: MetricsRegistry, labels: Tuple):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            registry.observe('celery_serialization_seconds', labels, time.perf_counter() - started)
+    wrapper._metrics_wrapped = True
+    return wrapper
+
+
+class MetricsExporter:
+    """本地HTTP端点、队列积压采样和prefork子进程快照合并"""
+
+    def __init__(self, registry: MetricsRegistry, metrics_config: Dict[str, Any]):
+        self.registry = registry
+        self.config = metrics_config
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.port: Optional[int] = None
+        self.snapshot_dir: Optional[str] = None
+
+    # ---- prefork子进程快照 ----
+
+    def _base_dir(self) -> str:
+        return self.config.get('multiprocess_dir') or os.path.join(tempfile.gettempdir(), 'celery_metrics')
+
+    def prepare_snapshot_dir(self):
+        """worker主进程：创建本进程的快照目录，清理已退出worker留下的目录"""
+        base = self._base_dir()
+        os.makedirs(base, exist_ok=True)
+        for entry in os.scandir(base):
+            if entry.is_dir() and entry.name.isdigit() and not _pid_alive(int(entry.name)):
+                for child in os.scandir(entry.path):
+                    try:
+                        os.remove(child.path)
+                    except OSError:
+                        pass
+                try:
+                    os.rmdir(entry.path)
+                except OSError:
+                    pass
+        self.snapshot_dir = os.path.join(base, str(os.getpid()))
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+
+    def start_child_flusher(self):
+        """prefork子进程：定期把快照写入父进程的目录（退出的子进程文件保留，计数不回退）"""
+        directory = os.path.join(self._base_dir(), str(os.getppid()))
+        if not os.path.isdir(directory):
+            return
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        interval = self.config['flush_interval']
+
+        def flush_loop():
+            while True:
+                time.sleep(interval)
+                self._write_snapshot(path)
+
+        threading.Thread(target=flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _write_snapshot(self, path: str):
+        tmp_path = f'{path}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.registry.snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def collect(self) -> Dict[str, Dict]:
+        snapshots = [self.registry.snapshot()]
+        if self.snapshot_dir and os.path.isdir(self.snapshot_dir):
+            for entry in os.scandir(self.snapshot_dir):
+                if entry.name.endswith('.json'):
+                    try:
+                        with open(entry.path) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        pass
+        return merge_snapshots(snapshots)
+
+    def render(self) -> str:
+        return render_prometheus(self.collect(), self.registry.buckets)
+
+    # ---- HTTP端点 ----
+
+    def start_http_server(self) -> Optional[int]:
+        """在配置端口起依次尝试绑定，返回实际端口（同一主机多个worker时各占一个端口）"""
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        host, port = self.config['host'], self.config['port']
+        for candidate in range(port, port + self.config['port_range']):
+            try:
+                self.server = ThreadingHTTPServer((host, candidate), Handler)
+            except OSError:
+                continue
+            self.server.daemon_threads = True
+            self.port = candidate
+            threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True).start()
+            print(f"📊 指标端点: http://{host}:{candidate}/metrics")
+            return candidate
+        print(f"⚠️  端口 {port}-{port + self.config['port_range'] - 1} 均被占用，未启动指标端点")
+        return None
+
+    # ---- 队列积压采样 ----
+
+    def start_queue_sampler(self, app, client_factory, queues: Iterable[str]):
+        interval = self.config['queue_depth_interval']
+        if not interval:
+            return
+        queues = list(queues)
+        transport_options = app.conf.broker_transport_options or {}
+        priority_steps = transport_options.get('priority_steps', PRIORITY_STEPS)
+
+        def sample_loop():
+            while True:
+                try:
+                    client = client_factory()
+                    if client is None:
+                        return
+                    for queue, depth in queue_depths(client, queues, priority_steps).items():
+                        self.registry.set_gauge('celery_queue_depth', (('queue', queue),), depth)
+                except Exception as e:
+                    print(f"⚠️  采样队列积压失败: {e}")
+                time.sleep(interval)
+
+        threading.Thread(target=sample_loop, name='metrics-queue-depth', daemon=True).start()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _routed_queues(app) -> List[str]:
+    """默认队列加上task_routes中出现的队列"""
+    queues = [app.conf.task_default_queue]
+    for route in (app.conf.task_routes or {}).values():
+        if route.get('queue') and route['queue'] not in queues:
+            queues.append(route['queue'])
+    return queues
+
+
+registry: Optional[MetricsRegistry] = None
+exporter: Optional[MetricsExporter] = None
+
+
+def install(app, config_manager) -> Optional[MetricsExporter]:
+    """连接信号处理器；worker启动时自动开启HTTP端点和队列采样"""
+    global registry, exporter
+    metrics_config = config_manager.get_metrics_config()
+    if not metrics_config['enabled'] or exporter is not None:
+        return exporter
+
+    from celery import signals
+
+    registry = MetricsRegistry(metrics_config['buckets'])
+    exporter = MetricsExporter(registry, metrics_config)
+    instrumentation = TaskInstrumentation(registry)
+
+    signals.before_task_publish.connect(instrumentation.before_publish, weak=False)
+    signals.after_task_publish.connect(instrumentation.after_publish, weak=False)
+    signals.task_prerun.connect(instrumentation.prerun, weak=False)
+    signals.task_postrun.connect(instrumentation.postrun, weak=False)
+    signals.task_retry.connect(instrumentation.retry, weak=False)
+    signals.task_failure.connect(instrumentation.failure, weak=False)
+    if metrics_config['serialization']:
+        instrument_serializers(registry)
+
+    def on_worker_init(sender=None, **kwargs):
+        exporter.prepare_snapshot_dir()
+        if metrics_config['worker_endpoint']:
+            exporter.start_http_server()
+        exporter.start_queue_sampler(app, config_manager.get_backend_redis_client, _routed_queues(app))
+
+    def on_worker_process_init(**kwargs):
+        # fork继承了父进程的数据，子进程从零开始计数，避免合并时重复
+        registry.histograms.clear()
+        registry.counters.clear()
+        registry.gauges.clear()
+        exporter.start_child_flusher()
+
+    signals.worker_init.connect(on_worker_init, weak=False)
+    signals.worker_process_init.connect(on_worker_process_init, weak=False)
+    return exporter
+
+
+def measure_overhead(iterations: int = 100000) -> Dict[str, float]:
+    """直接调用信号处理器，测量每个任务的埋点开销（微秒）"""
+    from types import SimpleNamespace
+
+    instrumentation = TaskInstrumentation(MetricsRegistry())
+    request = SimpleNamespace(delivery_info={'routing_key': 'math'})
+    task = SimpleNamespace(name='tasks.add', request=request, backend=SimpleNamespace(
+        _metrics_wrapped=True))
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        headers = {'id': i}
+        instrumentation.before_publish(sender='tasks.add', headers=headers, routing_key='math')
+        instrumentation.after_publish(sender='tasks.add', headers=headers, routing_key='math')
+    publish = (time.perf_counter() - start) / iterations
+
+    setattr(request, PUBLISHED_AT_HEADER, time.time())
+    start = time.perf_counter()
+    for i in range(iterations):
+        instrumentation.prerun(task_id=i, task=task)
+        instrumentation.postrun(task_id=i, task=task, state='SUCCESS')
+    execute = (time.perf_counter() - start) / iterations
+    return {'publish_us': publish * 1e6, 'execute_us': execute * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='指标埋点工具')
+    parser.add_argument('--overhead', action='store_true', help='测量每个任务的埋点开销')
+    parser.add_argument('--iterations', type=int, default=100000)
+    parser.add_argument('--serve', action='store_true', help='启动独立的指标端点（导出队列积压）')
+    args = parser.parse_args()
+
+    if args.overhead:
+        result = measure_overhead(args.iterations)
+        print("埋点开销（每个任务）")
+        print("=" * 40)
+        print(f"发布侧 (before+after_task_publish): {result['publish_us']:.2f} µs")
+        print(f"执行侧 (task_prerun+task_postrun):  {result['execute_us']:.2f} µs")
+        return
+
+    if args.serve:
+        # 独立进程导出队列积压（以及本进程发布的任务指标）
+        import metrics as installed
+        from celery_app import app, config_manager
+        if installed.exporter is None:
+            print("❌ 指标未启用，请在config.json的metrics中设置 enabled")
+            return
+        installed.exporter.start_http_server()
+        installed.exporter.start_queue_sampler(app, config_manager.get_backend_redis_client,
+                                               _routed_queues(app))
+        print("按 Ctrl+C 退出")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+队列内优先级通道模块
+kombu Redis传输把每个队列按 priority_steps 拆成多个列表（通道），worker的BRPOP
+按通道顺序取消息；注意Redis传输中数值越小优先级越高（0最高，9最低）。
+- 通道划分、级别名称（high/normal/low/bulk）和默认级别来自 config.json 的 priority 块，
+  可按队列或任务指定默认级别（通过task_annotations设置任务的priority属性）
+- 生产者按次指定：submit(add, (1, 2), priority='high')，
+  或整批指定：bulk.submit_many(add, items, priority='bulk')
+- 防饥饿：worker主进程定期检查各低优先级通道最旧的消息，
+  同一条消息停留超过 aging.max_wait 秒仍未被取走时，把该通道最旧的一批消息
+  移到上一级通道的出队端（老化提升）；Redis锁保证集群内同一时刻只有一个进程在做
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+
+import metrics
+
+DEFAULT_LEVELS = {'high': 0, 'normal': 3, 'low': 6, 'bulk': 9}
+
+# KEYS[1] 低优先级通道 KEYS[2] 上一级通道 KEYS[3] 记录各通道出队端消息及其首次出现时间的哈希
+# ARGV: 当前时间 最长等待秒数 每次提升条数
+# 返回提升的消息数
+_AGING_SCRIPT = """
+local tail = redis.call('LINDEX', KEYS[1], -1)
+local tail_field = KEYS[1] .. ':tail'
+if not tail then
+    redis.call('HDEL', KEYS[3], KEYS[1], tail_field)
+    return 0
+end
+local now = tonumber(ARGV[1])
+local seen = redis.call('HMGET', KEYS[3], KEYS[1], tail_field)
+if seen[2] ~= tail then
+    -- 出队端的消息变了（或首次检查），重新计时
+    redis.call('HSET', KEYS[3], KEYS[1], now, tail_field, tail)
+    return 0
+end
+if now - tonumber(seen[1]) < tonumber(ARGV[2]) then
+    return 0
+end
+local moved = {}
+for i = 1, tonumber(ARGV[3]) do
+    local message = redis.call('RPOP', KEYS[1])
+    if not message then
+        break
+    end
+    moved[#moved + 1] = message
+end
+-- 倒序压入上一级的出队端，保持原有先后顺序
+for i = #moved, 1, -1 do
+    redis.call('RPUSH', KEYS[2], moved[i])
+end
+redis.call('HDEL', KEYS[3], KEYS[1], tail_field)
+return #moved
+"""
+
+# 运行参数（由 install 根据配置设置）
+_config: Dict[str, Any] = {'levels': dict(DEFAULT_LEVELS)}
+_stats_lock = threading.Lock()
+_promoted: Dict[str, int] = {}
+
+
+def resolve_priority(value: Union[str, int, None]) -> Optional[int]:
+    """级别名称或数值转换为Redis传输的优先级数值（0最高）"""
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return _config['levels'][value]
+    except KeyError:
+        raise ValueError(f"未知的优先级: {value}（可用: {', '.join(_config['levels'])}）") from None
+
+
+def submit(task, args=None, kwargs=None, priority: Union[str, int, None] = None, **options):
+    """按指定优先级提交单个任务"""
+    if priority is not None:
+        options['priority'] = resolve_priority(priority)
+    return task.apply_async(args, kwargs, **options)
+
+
+class PriorityAnnotation:
+    """
+    按配置为任务设置默认优先级（作为Celery的task_annotations使用）
+
+    priority_config['tasks'] 为 {任务名: 级别}，优先级最高；
+    priority_config['queues'] 为 {队列: 级别}，作用于路由到该队列的任务
+    """
+
+    def __init__(self, priority_config: Dict[str, Any], task_routes: Dict[str, Dict],
+                 default_queue: str = 'celery'):
+        self.tasks = priority_config.get('tasks', {})
+        self.queues = priority_config.get('queues', {})
+        self.task_routes = task_routes
+        self.default_queue = default_queue
+
+    def annotate(self, task):
+        level = self.tasks.get(task.name)
+        if level is None:
+            queue = self.task_routes.get(task.name, {}).get('queue', self.default_queue)
+            level = self.queues.get(queue)
+        if level is None:
+            return None
+        return {'priority': resolve_priority(level)}
+
+
+class PriorityAger:
+    """低优先级通道的老化提升"""
+
+    def __init__(self, client, queues: List[str], priority_steps: List[int], aging_config: Dict[str, Any],
+                 key_prefix: str):
+        self.client = client
+        self.lanes = {queue: metrics.queue_keys(queue, priority_steps) for queue in queues}
+        self.max_wait = aging_config['max_wait']
+        self.interval = aging_config['interval']
+        self.batch = aging_config['batch']
+        self.state_key = f"{key_prefix}aging"
+        self.lock_key = f"{key_prefix}aging-lock"
+        self._script = client.register_script(_AGING_SCRIPT)
+
+    def sweep(self) -> int:
+        """检查一次所有通道，返回提升的消息数；其他进程正在检查时跳过"""
+        # 锁在一个检查周期后自动过期，不主动释放，保证全集群按周期只检查一次
+        if not self.client.set(self.lock_key, 1, nx=True, px=max(1, int(self.interval * 1000))):
+            return 0
+        now = time.time()
+        total = 0
+        for queue, keys in self.lanes.items():
+            # 从次高通道开始，每个通道向上一级提升
+            for level in range(1, len(keys)):
+                moved = self._script(keys=[keys[level], keys[level - 1], self.state_key],
+                                     args=[now, self.max_wait, self.batch])
+                if moved:
+                    total += moved
+                    self._record(queue, level, moved)
+        return total
+
+    def _record(self, queue: str, level: int, moved: int):
+        with _stats_lock:
+            _promoted[queue] = _promoted.get(queue, 0) + moved
+        if metrics.registry is not None:
+            metrics.registry.inc('celery_priority_promoted_total',
+                                 (('queue', queue), ('lane', str(level))), moved)
+        print(f"⏫ {queue}: {moved} 条消息等待超过 {self.max_wait}s，从第 {level + 1} 级通道提升到第 {level} 级")
+
+    def lane_depths(self) -> Dict[str, List[int]]:
+        """各队列每个通道的积压（从高到低）"""
+        pipe = self.client.pipeline(transaction=False)
+        for keys in self.lanes.values():
+            for key in keys:
+                pipe.llen(key)
+        lengths = pipe.execute()
+        depths, offset = {}, 0
+        for queue, keys in self.lanes.items():
+            depths[queue] = lengths[offset:offset + len(keys)]
+            offset += len(keys)
+        return depths
+
+    def run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️  优先级老化检查失败: {e}")
+            time.sleep(self.interval)
+
+
+def get_promotion_stats() -> Dict[str, int]:
+    """本进程各队列老化提升的消息数"""
+    with _stats_lock:
+        return dict(_promoted)
+
+
+def build_ager(app, config_manager) -> Optional[PriorityAger]:
+    """按配置创建老化提升器；使用内存传输时返回None"""
+    priority_config = config_manager.get_priority_config()
+    client = config_manager.get_backend_redis_client()
+    if client is None:
+        return None
+    queues = priority_config['aging'].get('queues') or metrics._routed_queues(app)
+    return PriorityAger(client, queues, priority_config['steps'], priority_config['aging'],
+                        priority_config['key_prefix'])
+
+
+def install(app, config_manager, task_routes: Dict[str, Dict],
+            default_queue: str) -> Optional[PriorityAnnotation]:
+    """
+    设置默认级别，worker启动时开启老化提升；返回需要加入task_annotations的注解
+    优先级通道（priority_steps）由 ConfigManager.get_celery_pool_settings 写入传输选项；
+    这里只写配置不读配置，读取app.conf会提前解析消息代理和结果后端
+    """
+    priority_config = config_manager.get_priority_config()
+    if not priority_config['enabled']:
+        return None
+    _config['levels'] = dict(priority_config['levels'])
+
+    from celery import signals
+
+    app.conf.update(
+        task_default_priority=resolve_priority(priority_config['default']),
+        task_inherit_parent_priority=priority_config['inherit_parent'],
+    )
+
+    def on_worker_init(sender=None, **kwargs):
+        if not priority_config['aging']['enabled']:
+            return
+        ager = build_ager(app, config_manager)
+        if ager is not None:
+            threading.Thread(target=ager.run, name='priority-aging', daemon=True).start()
+
+    signals.worker_init.connect(on_worker_init, weak=False)
+    return PriorityAnnotation(priority_config, task_routes, default_queue)
+
+
+def main():
+    """查看各队列优先级通道的积压，或手动执行一次老化提升"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='查看队列优先级通道')
+    parser.add_argument('--sweep', action='store_true', help='立即执行一次老化提升')
+    args = parser.parse_args()
+
+    from celery_app import app, config_manager
+
+    ager = build_ager(app, config_manager)
+    if ager is None:
+        print("❌ 当前使用内存传输，没有优先级通道")
+        return
+    if args.sweep:
+        ager.client.delete(ager.lock_key)
+        print(f"提升 {ager.sweep()} 条消息")
+    levels = config_manager.get_priority_config()['levels']
+    print("优先级通道积压（从高到低）")
+    print("=" * 50)
+    for queue, depths in ager.lane_depths().items():
+        print(f"{queue}: {depths}")
+    print(f"级别: {levels}")
+
+
+if __name__ == '__main__':
+    main()
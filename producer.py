@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import time
-from tasks import add, multiply, long_running_task, generate_random_numbers, process_list, failing_task, retry_task
+from tasks import add, multiply, add_many, multiply_many, long_running_task, failing_task, retry_task
+from batching import map_pairs
+from bulk import submit_many
+from result_collector import collect
+from progress import stream_progress
+from workflows import random_numbers_pipeline, arithmetic_pipeline
 
 def demo_basic_tasks():
     """演示基本任务"""
@@ -12,13 +16,16 @@ def demo_basic_tasks():
     print("发送加法任务...")
     result1 = add.delay(4, 4)
     print(f"任务ID: {result1.id}")
-    print(f"任务结果: {result1.get(timeout=10)}")
     
     # 发送乘法任务
     print("\n发送乘法任务...")
     result2 = multiply.delay(3, 7)
     print(f"任务ID: {result2.id}")
-    print(f"任务结果: {result2.get(timeout=10)}")
+    
+    # 同时等待两个任务，先完成的先输出
+    names = {result1.id: '加法', result2.id: '乘法'}
+    for task_id, result in collect([result1, result2]).iter(timeout=10):
+        print(f"{names[task_id]}任务结果: {result}")
 
 def demo_long_running_task():
     """演示长时间运行任务"""
@@ -28,12 +35,10 @@ def demo_long_running_task():
     result = long_running_task.delay(5)
     print(f"任务ID: {result.id}")
     
-    # 监控任务进度
-    while not result.ready():
-        if result.state == 'PROGRESS':
-            meta = result.info
-            print(f"进度: {meta['current']}/{meta['total']} - {meta['status']}")
-        time.sleep(1)
+    # 订阅任务进度（阻塞等待推送，不轮询结果后端）
+    for event in stream_progress(result.id, timeout=30):
+        if event['state'] == 'PROGRESS':
+            print(f"进度: {event['current']}/{event['total']} - {event['status']}")
     
     print(f"任务完成! 结果: {result.get()}")
 
@@ -41,16 +46,14 @@ def demo_chained_tasks():
     """演示任务链"""
     print("\n=== 任务链演示 ===")
     
-    # 先生成随机数，然后处理这些数字
-    print("发送生成随机数任务...")
-    numbers_result = generate_random_numbers.delay(8)
-    numbers = numbers_result.get(timeout=10)
-    print(f"生成的随机数: {numbers}")
+    # 先生成随机数，然后处理这些数字（整条流水线在worker上执行）
+    print("发送流水线: 生成随机数 -> 处理数字...")
+    result = random_numbers_pipeline(8).apply_async()
+    print(f"处理结果: {result.get(timeout=10)}")
     
-    print("发送处理数字任务...")
-    process_result = process_list.delay(numbers)
-    result = process_result.get(timeout=10)
-    print(f"处理结果: {result}")
+    print("\n发送流水线: 加法 -> 乘法 -> 数据处理...")
+    result = arithmetic_pipeline(10, 20, 2).apply_async()
+    print(f"处理结果: {result.get(timeout=10)}")
 
 def demo_error_handling():
     """演示错误处理"""
@@ -77,19 +80,31 @@ def demo_async_tasks():
     """演示异步任务"""
     print("\n=== 异步任务演示 ===")
     
-    # 同时发送多个任务
+    # 同时发送多个任务（批量提交，一次pipeline发送）
     print("同时发送多个任务...")
-    tasks = []
-    for i in range(5):
-        task = add.delay(i, i * 2)
-        tasks.append(task)
-        print(f"发送任务 {i+1}: {i} + {i*2}")
+    pairs = [(i, i * 2) for i in range(5)]
+    tasks = submit_many(add, pairs)
+    for i, (x, y) in enumerate(pairs):
+        print(f"发送任务 {i+1}: {x} + {y}")
     
-    # 等待所有任务完成
+    # 按完成顺序收集结果（批量读取结果后端）
     print("\n等待所有任务完成...")
-    for i, task in enumerate(tasks):
-        result = task.get(timeout=10)
-        print(f"任务 {i+1} 结果: {result}")
+    index = {task_id: i for i, task_id in enumerate(tasks.ids)}
+    for task_id, result in tasks.collect().iter(timeout=10):
+        print(f"任务 {index[task_id]+1} 结果: {result}")
+
+def demo_batch_tasks():
+    """演示批量任务"""
+    print("\n=== 批量任务演示 ===")
+    
+    pairs = [(i, i * 2) for i in range(10)]
+    print(f"分批发送 {len(pairs)} 个加法，每批最多4个...")
+    for (x, y), result in zip(pairs, map_pairs(add_many, pairs, max_batch_size=4, timeout=10)):
+        print(f"{x} + {y} = {result}")
+    
+    print("\n分批发送乘法...")
+    results = list(map_pairs(multiply_many, pairs, max_batch_size=4, timeout=10))
+    print(f"乘法结果: {results}")
 
 def main():
     """主函数"""
@@ -103,6 +118,7 @@ def main():
         demo_chained_tasks()
         demo_error_handling()
         demo_async_tasks()
+        demo_batch_tasks()
         
         print("\n" + "=" * 50)
         print("所有演示完成!")
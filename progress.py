@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+任务进度推送模块
+绑定任务通过 ProgressReporter 上报进度：更新按最小间隔合并，发布到Redis Stream，
+客户端用 stream_progress 阻塞读取（XREAD BLOCK），不再轮询结果后端。
+结果后端只按较低频率写入PROGRESS状态，最终结果仍由任务返回值写入。
+"""
+
+import json
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from celery import states
+from celery.exceptions import Reject
+from celery_app import app, config_manager
+from checkpoint import TaskCancelled
+
+PROGRESS_STREAM_PREFIX = 'celery-progress:'
+
+# 结束事件的状态
+FINISHED_STATES = frozenset({states.SUCCESS, states.FAILURE, states.REVOKED})
+
+
+def progress_stream_key(task_id: str) -> str:
+    """任务进度流的键名"""
+    return f"{PROGRESS_STREAM_PREFIX}{task_id}"
+
+
+class ProgressReporter:
+    """
+    绑定任务的进度上报器
+
+    update() 可以每次迭代调用；距上次发布不足 min_interval 的更新只保留最新值，
+    在下次到期或 finish() 时发布。使用内存传输时退化为限速的 update_state。
+    """
+
+    def __init__(self, task, min_interval: Optional[float] = None,
+                 backend_interval: Optional[float] = None):
+        progress_config = config_manager.get_progress_config()
+        self.task = task
+        self.task_id = task.request.id
+        self.min_interval = progress_config['min_interval'] if min_interval is None else min_interval
+        self.backend_interval = (progress_config['backend_interval']
+                                 if backend_interval is None else backend_interval)
+        self.stream_ttl = progress_config['stream_ttl']
+        self.maxlen = progress_config['maxlen']
+
+        # 直接调用（非worker执行）时没有任务ID，不推送
+        self.client = config_manager.get_backend_redis_client() if self.task_id else None
+        self.key = progress_stream_key(self.task_id) if self.task_id else None
+
+        self._latest: Optional[Dict[str, Any]] = None
+        self._dirty = False
+        self._last_publish = float('-inf')
+        self._last_backend_write = float('-inf')
+
+        self.updates = 0
+        self.published = 0
+        self.backend_writes = 0
+
+    def update(self, current, total, status: Optional[str] = None, **extra):
+        """上报一次进度（可高频调用）"""
+        meta = {'current': current, 'total': total, 'status': status}
+        meta.update(extra)
+        self._latest = meta
+        self._dirty = True
+        self.updates += 1
+
+        now = time.monotonic()
+        if now - self._last_publish >= self.min_interval:
+            self._publish('PROGRESS', meta, now)
+        if self.task_id and self.backend_interval and now - self._last_backend_write >= self.backend_interval:
+            self._write_backend(meta, now)
+
+    def flush(self):
+        """发布尚未发出的最新进度"""
+        if self._dirty and self._latest is not None:
+            self._publish('PROGRESS', self._latest, time.monotonic())
+
+    def finish(self, state: str = states.SUCCESS, **extra):
+        """发布结束事件，客户端收到后停止等待"""
+        self.flush()
+        self._publish(state, extra, time.monotonic())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finish(states.SUCCESS)
+        elif issubclass(exc_type, Reject):
+            # 消息退回队列，续跑后接着上报
+            self.flush()
+        elif issubclass(exc_type, TaskCancelled):
+            self.finish(states.REVOKED)
+        else:
+            self.finish(states.FAILURE, error=repr(exc))
+
+    def _publish(self, state: str, meta: Dict[str, Any], now: float):
+        self._last_publish = now
+        self._dirty = False
+        if not self.task_id:
+            return
+
+        if self.client is None:
+            # 没有Redis时只能写结果后端（结束事件由任务返回值落地）
+            if state == 'PROGRESS' and now - self._last_backend_write >= self.min_interval:
+                self._write_backend(meta, now)
+            return
+
+        event = dict(meta, state=state)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.xadd(self.key, {'data': json.dumps(event, ensure_ascii=False)},
+                      maxlen=self.maxlen, approximate=True)
+            pipe.expire(self.key, self.stream_ttl)
+            pipe.execute()
+            self.published += 1
+        except Exception as e:
+            # 进度推送失败不影响任务本身
+            print(f"⚠️  进度推送失败: {e}")
+
+    def _write_backend(self, meta: Dict[str, Any], now: float):
+        self._last_backend_write = now
+        self.task.update_state(state='PROGRESS', meta=meta)
+        self.backend_writes += 1
+
+
+def stream_progress(task_id: str, timeout: Optional[float] = None,
+                    block: float = 2.0) -> Iterator[Dict[str, Any]]:
+    """
+    阻塞读取任务进度事件，直到收到结束事件、任务结束或超时
+
+    每个事件是包含 state/current/total/status 的字典。
+    block 为单次XREAD阻塞秒数，超过连接池 socket_timeout 的一半时按一半计算
+    （多端点模式下 socket_timeout 只有2秒），避免阻塞读取被当作连接超时。
+    """
+    result = app.AsyncResult(task_id)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    client = config_manager.get_backend_redis_client()
+
+    if client is None:
+        # 内存传输：只能退化为轮询结果后端
+        while not result.ready():
+            if result.state == 'PROGRESS':
+                yield dict(result.info, state='PROGRESS')
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            time.sleep(block)
+        return
+
+    pool = getattr(client, 'connection_pool', None)
+    socket_timeout = pool.connection_kwargs.get('socket_timeout') if pool is not None else None
+    if socket_timeout:
+        block = min(block, socket_timeout / 2)
+
+    key = progress_stream_key(task_id)
+    last_id = '0-0'
+    while True:
+        wait = block if deadline is None else min(block, max(0.0, deadline - time.monotonic()))
+        response = client.xread({key: last_id}, count=100, block=max(1, int(wait * 1000)))
+        if not response:
+            # 没有新事件：任务可能已结束但没有推送结束事件（例如直接抛出异常）
+            if result.ready():
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            continue
+
+        for entry_id, fields in response[0][1]:
+            last_id = entry_id
+            event = json.loads(fields[b'data'])
+            yield event
+            if event['state'] in FINISHED_STATES:
+                return
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+集群级令牌桶限流模块
+Celery自带的 rate_limit 只在单个worker内生效，扩容后总速率随worker数增长。
+这里的令牌桶存放在Redis/Tair中，由Lua脚本原子地补充和扣减（使用Redis服务器时间，
+不受worker时钟偏差影响），按 config.json 中 rate_limits 的任务名和队列配置：
+任务同时命中任务规则和队列规则时需要两个桶都有令牌。
+
+拿不到令牌的任务不在worker中等待：按桶的补充时间以同一任务ID重新发送一条
+带countdown的消息，当前执行以Ignore结束并确认消息。ETA消息不占用预取额度，
+也不会忙等轮询。
+"""
+
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+from celery import Task
+from celery.exceptions import Ignore
+
+import metrics
+from celery_app import config_manager
+
+# KEYS: 各令牌桶；ARGV: 每个桶的 速率(个/秒) 容量
+# 全部有令牌时各扣一个并返回 "0"，否则不扣减并返回需要等待的秒数（字符串，避免浮点被截断）
+_TOKEN_BUCKET_SCRIPT = """
+if redis.replicate_commands then
+    pcall(redis.replicate_commands)
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local wait = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local h = redis.call('HMGET', key, 'tokens', 'ts')
+    local current = tonumber(h[1]) or burst
+    local ts = tonumber(h[2]) or now
+    current = math.min(burst, current + math.max(0, now - ts) * rate)
+    tokens[i] = current
+    if current < 1 then
+        wait = math.max(wait, (1 - current) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', tokens[i] - 1, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(burst / rate) * 2 + 1)
+end
+return '0'
+"""
+
+
+class TokenBucketLimiter:
+    """按任务名/队列查找规则并从Redis令牌桶取令牌"""
+
+    def __init__(self, client, limits_config: Dict[str, Any]):
+        self.client = client
+        self.tasks = limits_config.get('tasks', {})
+        self.queues = limits_config.get('queues', {})
+        self.key_prefix = limits_config['key_prefix']
+        self.max_defer = limits_config['max_defer']
+        self.jitter = limits_config['jitter']
+        self._script = client.register_script(_TOKEN_BUCKET_SCRIPT)
+        self._stats: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, limits_config: Dict[str, Any]):
+        """替换规则（配置热更新），已有的令牌桶状态保留"""
+        self.tasks = limits_config.get('tasks', {})
+        self.queues = limits_config.get('queues', {})
+        self.max_defer = limits_config['max_defer']
+        self.jitter = limits_config['jitter']
+
+    def rules_for(self, task_name: str, queue: Optional[str]) -> List[Tuple[str, Dict[str, Any]]]:
+        rules = []
+        if task_name in self.tasks:
+            rules.append((f"{self.key_prefix}task:{task_name}", self.tasks[task_name]))
+        if queue and queue in self.queues:
+            rules.append((f"{self.key_prefix}queue:{queue}", self.queues[queue]))
+        return rules
+
+    def acquire(self, task_name: str, queue: Optional[str]) -> float:
+        """取一个令牌，返回需要推迟的秒数（0表示放行）"""
+        rules = self.rules_for(task_name, queue)
+        if not rules:
+            return 0.0
+        args = []
+        for _, rule in rules:
+            args.extend([rule['rate'], rule.get('burst', rule['rate'])])
+        wait = float(self._script(keys=[key for key, _ in rules], args=args))
+        self._record(task_name, queue, 'deferred' if wait else 'allowed')
+        if not wait:
+            return 0.0
+        # 加少量抖动，避免同一批被推迟的任务同时到期
+        return min(self.max_defer, wait * (1 + random.uniform(0, self.jitter)))
+
+    def _record(self, task_name: str, queue: Optional[str], outcome: str):
+        with self._lock:
+            self._stats[(task_name, outcome)] = self._stats.get((task_name, outcome), 0) + 1
+        if metrics.registry is not None:
+            metrics.registry.inc('celery_rate_limit_total',
+                                 (('task', task_name), ('queue', queue or 'unknown'), ('outcome', outcome)))
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """本进程各任务的放行/推迟次数"""
+        stats: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for (task_name, outcome), count in self._stats.items():
+                stats.setdefault(task_name, {'allowed': 0, 'deferred': 0})[outcome] = count
+        return stats
+
+    def bucket_state(self) -> Dict[str, Dict[str, Any]]:
+        """各已配置令牌桶在Redis中的当前状态"""
+        state = {}
+        keys = [f"{self.key_prefix}task:{name}" for name in self.tasks] + \
+               [f"{self.key_prefix}queue:{name}" for name in self.queues]
+        for key in keys:
+            raw = self.client.hgetall(key)
+            state[key] = {(k.decode() if isinstance(k, bytes) else k): float(v) for k, v in raw.items()}
+        return state
+
+
+_limiter: Optional[TokenBucketLimiter] = None
+_limiter_lock = threading.Lock()
+_limits_config = config_manager.get_rate_limits_config()
+
+
+def get_limiter() -> Optional[TokenBucketLimiter]:
+    """当前进程的限流器；未配置规则或使用内存传输时返回None"""
+    global _limiter
+    if _limiter is None:
+        if not _limits_config['enabled'] or not (_limits_config['tasks'] or _limits_config['queues']):
+            return None
+        with _limiter_lock:
+            if _limiter is None:
+                client = config_manager.get_backend_redis_client()
+                if client is None:
+                    return None
+                _limiter = TokenBucketLimiter(client, _limits_config)
+    return _limiter
+
+
+def configure(limits_config: Dict[str, Any]):
+    """应用新的限流配置（配置热更新时调用）"""
+    global _limits_config
+    _limits_config = limits_config
+    if _limiter is not None:
+        if limits_config['enabled']:
+            _limiter.configure(limits_config)
+        else:
+            _limiter.configure(dict(limits_config, tasks={}, queues={}))
+
+
+class RateLimitedTask(Task):
+    """应用的默认任务基类：执行前按集群级令牌桶限流"""
+
+    def __call__(self, *args, **kwargs):
+        if not self.request.called_directly and not self.request.is_eager:
+            limiter = get_limiter()
+            if limiter is not None:
+                queue = (self.request.delivery_info or {}).get('routing_key')
+                try:
+                    wait = limiter.acquire(self.name, queue)
+                except redis.RedisError as e:
+                    # 限流存储不可用时放行，不阻塞任务
+                    print(f"⚠️  限流器不可用: {e}")
+                    wait = 0.0
+                if wait:
+                    self._defer(args, kwargs, wait)
+        return super().__call__(*args, **kwargs)
+
+    def _defer(self, args, kwargs, countdown: float):
+        """以同一任务ID重新发送一条延迟消息，结束当前执行"""
+        signature = self.signature_from_request(self.request, args, kwargs, countdown=countdown)
+        signature.apply_async()
+        raise Ignore()
+
+
+def main():
+    """查看令牌桶状态"""
+    limiter = get_limiter()
+    if limiter is None:
+        print("未配置限流规则或当前使用内存传输")
+        return
+    print("令牌桶状态")
+    print("=" * 50)
+    for key, state in limiter.bucket_state().items():
+        if state:
+            print(f"{key}: 令牌 {state.get('tokens', 0):.2f}，更新于 "
+                  f"{time.strftime('%H:%M:%S', time.localtime(state.get('ts', 0)))}")
+        else:
+            print(f"{key}: 满")
+
+
+if __name__ == '__main__':
+    main()
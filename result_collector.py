@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+并发结果收集模块
+对大量任务ID分块执行MGET批量读取结果后端，按完成顺序产出结果，
+替代逐个 AsyncResult.get() 的顺序等待；同时提供生成器与asyncio两种接口
+"""
+
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from celery import states
+from celery.exceptions import TimeoutError
+
+
+class ResultCollector:
+    """
+    批量收集任务结果
+
+    每一轮对所有未完成的任务ID分块MGET，就绪的结果立即产出；
+    没有新结果时轮询间隔逐步加大到 max_interval，有进展时恢复。
+    """
+
+    def __init__(self, task_ids: Iterable[str], app=None, chunk_size: int = 1000,
+                 interval: float = 0.05, max_interval: float = 1.0):
+        if app is None:
+            from celery_app import app
+        self.app = app
+        self.backend = app.backend
+        if not hasattr(self.backend, 'mget'):
+            raise TypeError(f"结果后端 {type(self.backend).__name__} 不支持批量读取(MGET)")
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.max_interval = max_interval
+        # 保留提交顺序，便于按顺序轮询
+        self.pending: Dict[str, None] = dict.fromkeys(task_ids)
+        self.total = len(self.pending)
+        self.backend_calls = 0
+
+    def __len__(self):
+        return self.total
+
+    def __iter__(self):
+        return self.iter()
+
+    def poll(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """对所有未完成任务执行一轮MGET，返回本轮新完成的 (任务ID, 元数据)"""
+        ready = []
+        ids = list(self.pending)
+        for start in range(0, len(ids), self.chunk_size):
+            chunk = ids[start:start + self.chunk_size]
+            keys = [self.backend.get_key_for_task(task_id) for task_id in chunk]
+            values = self.backend.mget(keys)
+            self.backend_calls += 1
+            if hasattr(values, 'get'):
+                # 部分后端（如cache）返回字典
+                values = [values.get(key) for key in keys]
+            for task_id, value in zip(chunk, values):
+                if value is None:
+                    continue
+                meta = self.backend.decode_result(value)
+                if meta['status'] in states.READY_STATES:
+                    del self.pending[task_id]
+                    ready.append((task_id, meta))
+        return ready
+
+    def _unpack(self, task_id: str, meta: Dict[str, Any], propagate: bool) -> Tuple[str, Any]:
+        if propagate and meta['status'] in states.PROPAGATE_STATES:
+            raise meta['result']
+        return task_id, meta['result']
+
+    def iter(self, timeout: Optional[float] = None, propagate: bool = False) -> Iterator[Tuple[str, Any]]:
+        """按完成顺序产出 (任务ID, 结果)；propagate=True 时失败任务抛出异常"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = self.interval
+        while self.pending:
+            ready = self.poll()
+            for task_id, meta in ready:
+                yield self._unpack(task_id, meta, propagate)
+            if not self.pending:
+                break
+            interval = self.interval if ready else min(interval * 2, self.max_interval)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"仍有 {len(self.pending)} 个任务未完成")
+                interval = min(interval, remaining)
+            time.sleep(interval)
+
+    async def aiter(self, timeout: Optional[float] = None,
+                    propagate: bool = False) -> AsyncIterator[Tuple[str, Any]]:
+        """asyncio版本：MGET在线程池中执行，等待期间不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        interval = self.interval
+        while self.pending:
+            ready = await loop.run_in_executor(None, self.poll)
+            for task_id, meta in ready:
+                yield self._unpack(task_id, meta, propagate)
+            if not self.pending:
+                break
+            interval = self.interval if ready else min(interval * 2, self.max_interval)
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"仍有 {len(self.pending)} 个任务未完成")
+                interval = min(interval, remaining)
+            await asyncio.sleep(interval)
+
+    def get_all(self, timeout: Optional[float] = None, propagate: bool = True) -> Dict[str, Any]:
+        """等待全部完成，返回 {任务ID: 结果}"""
+        return dict(self.iter(timeout=timeout, propagate=propagate))
+
+
+def collect(results, app=None, **kwargs) -> ResultCollector:
+    """根据AsyncResult列表或任务ID列表创建收集器"""
+    results = list(results)
+    task_ids = [getattr(r, 'id', r) for r in results]
+    if app is None:
+        app = getattr(results[0], 'app', None) if task_ids else None
+    return ResultCollector(task_ids, app=app, **kwargs)
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+任务结果存储策略与批量写入模块
+全局 result_expires 之外，任务可以声明自己的结果存储策略：
+
+    @app.task(result_policy='ignore')            # 不存储结果
+    @app.task(result_policy='failure_only')      # 只存储失败（成功结果无人读取，get()等不到成功结果）
+    @app.task(result_policy={'ttl': 300})        # 存储，300秒后过期
+    @app.task(result_policy={'mode': 'failure_only', 'ttl': 86400})
+
+也可在 config.json 的 result_store 块按任务名（tasks）或队列（queues）指定，
+tasks 配置优先于任务声明，任务声明优先于 queues 和 default。
+ignore 通过Celery的 ignore_result 实现，结果连编码都省掉；failure_only 保持结果启用
+（等待任务的调用方仍能收到失败异常），由批量写入的Redis结果后端丢弃成功结果，
+成功时 get() 只会超时。被chord头部或其他任务读取结果的任务不要设置这两种策略。
+
+worker中的结果写入先进入进程内缓冲：同一任务的多次写入（PROGRESS后紧接SUCCESS）只保留最后一次，
+后台线程每 max_latency 秒或积累 max_batch 条时用一个非事务管道批量 SET/SETEX + PUBLISH，
+代替每个结果一次 MULTI/SETEX/PUBLISH/EXEC 往返；缓冲超过 max_pending 时写入方同步写出。
+缓冲中的结果对本进程的读取立即可见；worker被强制杀死时最多丢失 max_latency 内的结果。
+节省的往返、命令和字节数见 get_stats()，启用指标时计入 celery_result_store_saved_total。
+"""
+
+import atexit
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple, Union
+
+from celery import signals, states
+from celery.backends.redis import RedisBackend
+from celery.exceptions import BackendStoreError
+
+import metrics
+from endpoints import FailoverRedisBackend
+
+POLICY_MODES = ('store', 'ignore', 'failure_only')
+
+# 每个结果原本的事务包装：MULTI 与 EXEC 两条命令的协议字节数
+_TRANSACTION_BYTES = len(b'*1\r\n$5\r\nMULTI\r\n') + len(b'*1\r\n$4\r\nEXEC\r\n')
+
+# 运行参数（由 install 根据配置设置）
+_config: Dict[str, Any] = {
+    'batching': {'enabled': False, 'max_batch': 200, 'max_latency': 0.02, 'max_pending': 5000},
+}
+
+# 当前线程正在写入的结果的过期时间（由 _store_result 设置，set 读取）
+_context = threading.local()
+
+
+def parse_policy(value: Union[str, int, float, Dict[str, Any], None]) -> Optional[Tuple[str, Optional[int]]]:
+    """策略声明转换为 (模式, 过期秒数)；数值为只指定过期时间的store"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        mode, ttl = 'store', value
+    elif isinstance(value, str):
+        mode, ttl = value, None
+    elif isinstance(value, dict):
+        mode, ttl = value.get('mode', 'store'), value.get('ttl')
+    else:
+        raise ValueError(f"无效的结果存储策略: {value!r}")
+    if mode not in POLICY_MODES:
+        raise ValueError(f"未知的结果存储策略: {mode}（可用: {', '.join(POLICY_MODES)}）")
+    if ttl is not None and ttl <= 0:
+        raise ValueError(f"结果过期时间必须大于0: {ttl}")
+    return mode, None if ttl is None else int(ttl)
+
+
+class ResultPolicyAnnotation:
+    """
+    把任务的结果存储策略转换为Celery任务属性（作为Celery的task_annotations使用）
+
+    result_store_config['tasks'] 为 {任务名: 策略}，优先级最高；其次是任务声明的 result_policy，
+    再次是 result_store_config['queues'] 中任务所在队列的策略，最后是 default
+    """
+
+    def __init__(self, result_store_config: Dict[str, Any], task_routes: Dict[str, Dict],
+                 default_queue: str = 'celery'):
+        self.tasks = result_store_config.get('tasks', {})
+        self.queues = result_store_config.get('queues', {})
+        self.default = result_store_config.get('default')
+        self.task_routes = task_routes
+        self.default_queue = default_queue
+
+    def annotate(self, task):
+        policy = self.tasks.get(task.name)
+        if policy is None:
+            policy = getattr(task, 'result_policy', None)
+        if policy is None:
+            queue = self.task_routes.get(task.name, {}).get('queue', self.default_queue)
+            policy = self.queues.get(queue, self.default)
+        parsed = parse_policy(policy)
+        if parsed is None or parsed == ('store', None):
+            # 保持任务自身的 ignore_result 等设置
+            return None
+        mode, ttl = parsed
+        return {
+            'result_policy': mode,
+            'result_ttl': ttl,
+            # failure_only 不能用 ignore_result：客户端对忽略结果的任务 get() 直接返回None
+            'ignore_result': mode == 'ignore',
+        }
+
+
+def _command_size(*args) -> int:
+    """一条命令的RESP协议字节数（字符串按字符数估算）"""
+    size = 3 + len(str(len(args)))
+    for arg in args:
+        length = len(arg) if isinstance(arg, (bytes, str)) else len(str(arg))
+        size += 5 + len(str(length)) + length
+    return size
+
+
+def _entry_size(key, value, ttl: Optional[int]) -> int:
+    """一个结果的 SET/SETEX + PUBLISH 字节数"""
+    write = _command_size('SETEX', key, ttl, value) if ttl else _command_size('SET', key, value)
+    return write + _command_size('PUBLISH', key, value)
+
+
+class ResultWriter:
+    """进程内的结果写入缓冲，后台线程批量写出"""
+
+    def __init__(self):
+        self.pending: Dict[Any, Tuple[Any, Optional[int]]] = {}
+        # 正在写出的一批（写完之前本进程的读取仍从这里取）
+        self._inflight: Dict[Any, Tuple[Any, Optional[int]]] = {}
+        self.backend: Optional[RedisBackend] = None
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid: Optional[int] = None
+        # 上次写出后的写入次数和被覆盖结果的字节数
+        self._calls = 0
+        self._superseded_bytes = 0
+        self.stats = {'results': 0, 'written': 0, 'coalesced': 0, 'skipped': 0, 'failed': 0,
+                      'batches': 0, 'roundtrips_saved': 0, 'commands_saved': 0, 'bytes_saved': 0}
+        self._reported = dict(self.stats)
+        self.configure(_config['batching'])
+
+    def configure(self, batching: Dict[str, Any]):
+        self.max_batch = batching['max_batch']
+        self.max_latency = batching['max_latency']
+        self.max_pending = batching['max_pending']
+
+    # ---- 写入方 ----
+
+    def add(self, backend: RedisBackend, key, value, ttl: Optional[int]):
+        if self._pid != os.getpid():
+            self._start()
+        self.backend = backend
+        with self._lock:
+            previous = self.pending.pop(key, None)
+            if previous is not None:
+                self.stats['coalesced'] += 1
+                self._superseded_bytes += _entry_size(key, *previous)
+            self.pending[key] = (value, ttl)
+            self._calls += 1
+            self.stats['results'] += 1
+            size = len(self.pending)
+        if size >= self.max_pending:
+            # 后台写出跟不上时由写入方同步写出，缓冲有界
+            self.flush()
+        elif size >= self.max_batch:
+            self._wakeup.set()
+
+    def peek(self, key):
+        """缓冲中尚未写出的结果（没有时返回None）"""
+        entry = self.pending.get(key) or self._inflight.get(key)
+        return None if entry is None else entry[0]
+
+    def discard(self, key):
+        with self._lock:
+            self.pending.pop(key, None)
+
+    def _start(self):
+        with self._flush_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='result-writer', daemon=True).start()
+
+    # ---- 后台线程 ----
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.max_latency)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️  结果批量写入失败: {e}")
+
+    def flush(self):
+        """写出缓冲中的全部结果；失败时未被更新的结果放回缓冲并抛出异常"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self.pending = self.pending, {}
+                self._inflight = batch
+                calls, self._calls = self._calls, 0
+                superseded, self._superseded_bytes = self._superseded_bytes, 0
+            if not batch:
+                return
+            backend = self.backend
+            try:
+                backend.ensure(self._write, (backend.client, batch))
+            except Exception:
+                with self._lock:
+                    self._inflight = {}
+                    for key, entry in batch.items():
+                        self.pending.setdefault(key, entry)
+                    self._calls += calls
+                    self._superseded_bytes += superseded
+                    self.stats['failed'] += 1
+                self._report()
+                raise
+            with self._lock:
+                self._inflight = {}
+                self.stats['written'] += len(batch)
+                self.stats['batches'] += 1
+                # 原本每次写入一个事务（MULTI SETEX PUBLISH EXEC）一次往返
+                self.stats['roundtrips_saved'] += calls - 1
+                self.stats['commands_saved'] += 4 * calls - 2 * len(batch)
+                self.stats['bytes_saved'] += _TRANSACTION_BYTES * calls + superseded
+            self._report()
+
+    @staticmethod
+    def _write(client, batch: Dict[Any, Tuple[Any, Optional[int]]]):
+        pipe = client.pipeline(transaction=False)
+        for key, (value, ttl) in batch.items():
+            if ttl:
+                pipe.setex(key, ttl, value)
+            else:
+                pipe.set(key, value)
+            pipe.publish(key, value)
+        pipe.execute()
+
+    def count_skipped(self):
+        with self._lock:
+            self.stats['skipped'] += 1
+
+    def _report(self):
+        if metrics.registry is None:
+            return
+        with self._lock:
+            deltas = {name: value - self._reported[name] for name, value in self.stats.items()}
+            self._reported = dict(self.stats)
+        for outcome in ('written', 'coalesced', 'skipped', 'failed'):
+            if deltas[outcome]:
+                metrics.registry.inc('celery_result_store_total', (('outcome', outcome),), deltas[outcome])
+        for kind in ('roundtrips', 'commands', 'bytes'):
+            delta = deltas[f'{kind}_saved']
+            if delta:
+                metrics.registry.inc('celery_result_store_saved_total', (('kind', kind),), delta)
+
+    def after_fork(self):
+        """子进程中丢弃父进程的缓冲（由父进程写出），首次写入时重新启动写出线程"""
+        self.pending = {}
+        self._inflight = {}
+        self._pid = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._calls = self._superseded_bytes = 0
+        self.stats = dict.fromkeys(self.stats, 0)
+        self._reported = dict(self.stats)
+
+
+_writer = ResultWriter()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_writer.after_fork)
+
+
+def flush():
+    """立即写出缓冲中的结果"""
+    try:
+        _writer.flush()
+    except Exception as e:
+        print(f"❌ 结果写入失败，{len(_writer.pending)} 个结果未写出: {e}")
+
+
+atexit.register(flush)
+
+
+class BatchingRedisBackendMixin:
+    """按任务的 result_ttl 设置过期时间，worker中经缓冲批量写入的Redis结果后端"""
+
+    def _store_result(self, task_id, result, state, traceback=None, request=None, **kwargs):
+        task = self.app.tasks.get(getattr(request, 'task', None) or '')
+        if state == states.SUCCESS and getattr(task, 'result_policy', None) == 'failure_only':
+            # 只存储失败：成功结果不写入
+            _writer.count_skipped()
+            return result
+        _context.ttl = getattr(task, 'result_ttl', None)
+        try:
+            return super()._store_result(task_id, result, state, traceback=traceback,
+                                         request=request, **kwargs)
+        finally:
+            _context.ttl = None
+
+    def set(self, key, value, **retry_policy):
+        if not _writer.enabled:
+            return super().set(key, value, **retry_policy)
+        if isinstance(value, str) and len(value) > self._MAX_STR_VALUE_SIZE:
+            raise BackendStoreError('value too large for Redis backend')
+        _writer.add(self, key, value, getattr(_context, 'ttl', None) or self.expires)
+
+    def _set(self, key, value):
+        ttl = getattr(_context, 'ttl', None) or self.expires
+        with self.client.pipeline() as pipe:
+            if ttl:
+                pipe.setex(key, ttl, value)
+            else:
+                pipe.set(key, value)
+            pipe.publish(key, value)
+            pipe.execute()
+
+    def get(self, key):
+        value = _writer.peek(key)
+        return super().get(key) if value is None else value
+
+    def mget(self, keys):
+        values = super().mget(keys)
+        if _writer.pending or _writer._inflight:
+            values = [value if buffered is None else buffered
+                      for value, buffered in zip(values, map(_writer.peek, keys))]
+        return values
+
+    def delete(self, key):
+        _writer.discard(key)
+        super().delete(key)
+
+
+class BatchingRedisBackend(BatchingRedisBackendMixin, RedisBackend):
+    """单端点的Redis结果后端"""
+
+
+class BatchingFailoverRedisBackend(BatchingRedisBackendMixin, FailoverRedisBackend):
+    """多端点模式的Redis结果后端（写出时使用当时的当前端点）"""
+
+
+def backend_url(url: str, result_store_config: Dict[str, Any]) -> str:
+    """Redis结果后端URL换成支持任务过期时间和批量写入的后端；未启用或非Redis时原样返回"""
+    if not result_store_config['enabled']:
+        return url
+    failover_prefix = f"{FailoverRedisBackend.__module__}.{FailoverRedisBackend.__name__}+"
+    if url.startswith(failover_prefix):
+        return f"{__name__}.BatchingFailoverRedisBackend+{url[len(failover_prefix):]}"
+    if url.startswith(('redis://', 'rediss://')):
+        return f"{__name__}.BatchingRedisBackend+{url}"
+    return url
+
+
+def get_stats() -> Dict[str, int]:
+    """本进程的结果写入统计（含节省的往返、命令和字节数）与待写出的结果数"""
+    with _writer._lock:
+        stats = dict(_writer.stats)
+    stats['pending'] = len(_writer.pending)
+    return stats
+
+
+def install(app, config_manager, task_routes: Dict[str, Dict],
+            default_queue: str) -> Optional[ResultPolicyAnnotation]:
+    """设置结果存储策略和worker中的批量写入；返回需要加入task_annotations的注解"""
+    result_store_config = config_manager.get_result_store_config()
+    if not result_store_config['enabled']:
+        return None
+    _config.update(result_store_config)
+    _writer.configure(result_store_config['batching'])
+
+    def on_worker_init(**kwargs):
+        # 只在worker中缓冲写入，生产者和客户端（如保存group结果）仍立即写入
+        _writer.enabled = result_store_config['batching']['enabled']
+
+    def on_task_postrun(task=None, **kwargs):
+        # failure_only 跳过的成功结果由结果后端计数
+        if getattr(task, 'result_policy', None) == 'ignore':
+            _writer.count_skipped()
+
+    def on_worker_shutdown(**kwargs):
+        flush()
+        stats = get_stats()
+        if stats['results'] or stats['skipped']:
+            print(f"📊 结果写入: {stats['written']} 个结果 {stats['batches']} 批，"
+                  f"合并 {stats['coalesced']}，按策略跳过 {stats['skipped']}，"
+                  f"节省往返 {stats['roundtrips_saved']}、命令 {stats['commands_saved']}、"
+                  f"约 {stats['bytes_saved']} 字节")
+
+    signals.worker_init.connect(on_worker_init, weak=False)
+    signals.task_postrun.connect(on_task_postrun, weak=False)
+    # prefork子进程退出时不执行atexit
+    signals.worker_process_shutdown.connect(on_worker_shutdown, weak=False)
+    signals.worker_shutdown.connect(on_worker_shutdown, weak=False)
+    return ResultPolicyAnnotation(result_store_config, task_routes, default_queue)
+
+
+def main():
+    """检查 failure_only 任务：失败时 get() 仍抛出任务的异常（需要运行中的worker）"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='检查结果存储策略')
+    parser.add_argument('--timeout', type=float, default=10, help='等待任务结果的秒数')
+    args = parser.parse_args()
+
+    from tasks import failing_task
+
+    print(f"failing_task: result_policy={getattr(failing_task, 'result_policy', None)} "
+          f"ignore_result={failing_task.ignore_result}")
+    result = failing_task.delay()
+    try:
+        value = result.get(timeout=args.timeout)
+    except Exception as e:
+        if result.state != states.FAILURE:
+            print(f"❌ get() 抛出 {type(e).__name__}: {e}，任务状态 {result.state}")
+            raise SystemExit(1)
+        print(f"✅ get() 抛出任务的异常: {type(e).__name__}: {e}")
+        return
+    print(f"❌ get() 没有抛出异常，返回 {value!r}，任务状态 {result.state}")
+    raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+任务重试策略模块
+作为 autoretry_for 任务的基类使用：@app.task(base=RetryPolicyTask, autoretry_for=(...), ...)
+- 指数退避 + 完全抖动：countdown = uniform(0, min(backoff_max, backoff_base * 2^重试次数))，
+  避免同一时刻失败的任务同步重试
+- 按任务类型的重试预算：窗口内重试数不超过 执行数 × budget_ratio + budget_min
+- 熔断器：窗口内失败率超过阈值时打开，停止重试（任务直接失败）；
+  打开一段时间后进入半开，只放行少量重试作为探测，成功则关闭、失败（包括探测任务再次请求重试）则重新打开
+熔断和预算状态存放在Redis哈希中（Lua脚本原子更新），所有worker共享；
+Redis不可用时只做退避抖动，不限制重试
+"""
+
+import random
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import redis
+
+import metrics
+from celery_app import app, config_manager
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+STATE_CODES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+# KEYS[1] 状态哈希
+# ARGV: 操作(success/failure/retry) 当前时间 窗口秒数 失败率阈值 最少执行数
+#       打开秒数 半开探测数 预算比例 预算下限 键过期秒数 任务ID
+# 返回: {是否允许重试, 状态, 原因}
+_BREAKER_SCRIPT = """
+local key = KEYS[1]
+local op = ARGV[1]
+local now = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local threshold = tonumber(ARGV[4])
+local min_requests = tonumber(ARGV[5])
+local open_seconds = tonumber(ARGV[6])
+local half_open_probes = tonumber(ARGV[7])
+local budget_ratio = tonumber(ARGV[8])
+local budget_min = tonumber(ARGV[9])
+local ttl = tonumber(ARGV[10])
+local task_id = ARGV[11]
+
+local h = redis.call('HMGET', key, 'state', 'opened_at', 'probes', 'window_start', 'succ', 'fail', 'retries',
+                     'probe_ids')
+local state = h[1] or 'closed'
+local opened_at = tonumber(h[2]) or 0
+local probes = tonumber(h[3]) or 0
+local window_start = tonumber(h[4]) or now
+local succ = tonumber(h[5]) or 0
+local fail = tonumber(h[6]) or 0
+local retries = tonumber(h[7]) or 0
+-- 半开状态下放行为探测的任务ID（逗号分隔）
+local probe_ids = h[8] or ''
+local is_probe = task_id ~= '' and string.find(',' .. probe_ids .. ',', ',' .. task_id .. ',', 1, true) ~= nil
+
+-- 固定窗口，过期后清零
+if now - window_start >= window then
+    window_start = now
+    succ = 0
+    fail = 0
+    retries = 0
+end
+
+local allowed = 0
+local reason = ''
+
+if op == 'success' then
+    succ = succ + 1
+    if state ~= 'closed' then
+        state = 'closed'
+        probes = 0
+        window_start = now
+        succ = 1
+        fail = 0
+        retries = 0
+        probe_ids = ''
+        reason = 'recovered'
+    end
+else
+    -- failure 和 retry 都记录一次失败；探测任务还有重试次数时，它的失败以 retry 到达
+    fail = fail + 1
+    if state == 'half_open' and (op == 'failure' or is_probe) then
+        state = 'open'
+        opened_at = now
+        probe_ids = ''
+        reason = 'probe_failed'
+    elseif state == 'closed' and succ + fail >= min_requests and fail / (succ + fail) >= threshold then
+        state = 'open'
+        opened_at = now
+        probe_ids = ''
+        reason = 'tripped'
+    end
+
+    if op == 'retry' then
+        if state == 'open' and now - opened_at >= open_seconds then
+            state = 'half_open'
+            probes = 0
+            probe_ids = ''
+        end
+        if state == 'open' then
+            -- 本次刚打开时保留 tripped / probe_failed
+            if reason == '' then
+                reason = 'open'
+            end
+        elseif state == 'half_open' then
+            if probes < half_open_probes then
+                probes = probes + 1
+                retries = retries + 1
+                allowed = 1
+                reason = 'probe'
+                if task_id ~= '' then
+                    probe_ids = probe_ids == '' and task_id or (probe_ids .. ',' .. task_id)
+                end
+            else
+                reason = 'half_open'
+            end
+        elseif retries < budget_ratio * (succ + fail) + budget_min then
+            retries = retries + 1
+            allowed = 1
+            reason = 'ok'
+        else
+            reason = 'budget'
+        end
+    end
+end
+
+redis.call('HSET', key, 'state', state, 'opened_at', opened_at, 'probes', probes,
+           'window_start', window_start, 'succ', succ, 'fail', fail, 'retries', retries,
+           'probe_ids', probe_ids)
+redis.call('EXPIRE', key, ttl)
+return {allowed, state, reason}
+"""
+
+
+def full_jitter_backoff(retries: int, base: float, cap: float) -> float:
+    """指数退避 + 完全抖动（秒）"""
+    return random.uniform(0, min(cap, base * (2 ** retries)))
+
+
+class CircuitBreaker:
+    """按任务类型共享在Redis中的熔断器与重试预算"""
+
+    def __init__(self, client, name: str, policy: Dict[str, Any]):
+        self.client = client
+        self.name = name
+        self.policy = policy
+        self.key = f"{policy['key_prefix']}{name}"
+        self._script = client.register_script(_BREAKER_SCRIPT)
+
+    def _call(self, op: str, task_id: Optional[str] = None) -> Tuple[bool, str, str]:
+        policy = self.policy
+        allowed, state, reason = self._script(keys=[self.key], args=[
+            op, time.time(), policy['window'], policy['failure_threshold'], policy['min_requests'],
+            policy['open_seconds'], policy['half_open_probes'], policy['budget_ratio'],
+            policy['budget_min'], max(policy['window'], policy['open_seconds']) * 2, task_id or '',
+        ])
+        state = state.decode() if isinstance(state, bytes) else state
+        reason = reason.decode() if isinstance(reason, bytes) else reason
+        if metrics.registry is not None:
+            metrics.registry.set_gauge('celery_circuit_state', (('task', self.name),), STATE_CODES[state])
+        if reason in ('tripped', 'probe_failed', 'recovered'):
+            icon = '✅' if reason == 'recovered' else '🔌'
+            print(f"{icon} 熔断器 {self.name}: {state} ({reason})")
+        return bool(allowed), state, reason
+
+    def record_success(self):
+        self._call('success')
+
+    def record_failure(self, task_id: Optional[str] = None):
+        self._call('failure', task_id)
+
+    def allow_retry(self, task_id: Optional[str] = None) -> Tuple[bool, str, str]:
+        """记录一次失败并判断是否允许重试；半开状态下放行的探测按任务ID记录（重试保持同一ID）"""
+        return self._call('retry', task_id)
+
+    def state(self) -> Dict[str, Any]:
+        raw = self.client.hgetall(self.key)
+        return {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+                for k, v in raw.items()}
+
+
+def get_retry_policy(task_name: str) -> Dict[str, Any]:
+    """合并默认策略与任务级覆盖"""
+    retry_config = config_manager.get_retry_policy_config()
+    policy = dict(retry_config['default'])
+    policy.update(retry_config['tasks'].get(task_name, {}))
+    policy['key_prefix'] = retry_config['key_prefix']
+    policy['enabled'] = retry_config['enabled']
+    return policy
+
+
+class RetryPolicyTask(app.Task):
+    """带退避抖动、重试预算和共享熔断器的任务基类"""
+
+    _policy: Optional[Dict[str, Any]] = None
+    _breaker: Optional[CircuitBreaker] = None
+    _breaker_unavailable = False
+
+    @property
+    def policy(self) -> Dict[str, Any]:
+        if self._policy is None:
+            self._policy = get_retry_policy(self.name)
+        return self._policy
+
+    @property
+    def breaker(self) -> Optional[CircuitBreaker]:
+        if self._breaker is None and not self._breaker_unavailable:
+            client = config_manager.get_backend_redis_client() if self.policy['enabled'] else None
+            if client is None:
+                self._breaker_unavailable = True
+            else:
+                self._breaker = CircuitBreaker(client, self.name, self.policy)
+        return self._breaker
+
+    def _breaker_call(self, method: str, default=None, *args):
+        breaker = self.breaker
+        if breaker is None:
+            return default
+        try:
+            return getattr(breaker, method)(*args)
+        except redis.RedisError as e:
+            # Redis故障时不因熔断器本身阻止重试
+            print(f"⚠️  熔断器 {self.name} 不可用: {e}")
+            return default
+
+    def retry(self, args=None, kwargs=None, exc=None, throw=True, eta=None, countdown=None,
+              max_retries=None, **options):
+        self.request.breaker_recorded = True
+        limit = self.max_retries if max_retries is None else max_retries
+        if limit is not None and self.request.retries >= limit:
+            # 已达最大重试次数，父类会抛出异常，只记录失败
+            self._breaker_call('record_failure', None, self.request.id)
+            return super().retry(args=args, kwargs=kwargs, exc=exc, throw=throw, eta=eta,
+                                 countdown=countdown, max_retries=max_retries, **options)
+
+        allowed, state, reason = self._breaker_call('allow_retry', (True, STATE_CLOSED, 'local'), self.request.id)
+        if not allowed:
+            if metrics.registry is not None:
+                queue = (self.request.delivery_info or {}).get('routing_key') or 'unknown'
+                metrics.registry.inc('celery_retry_denied_total',
+                                     (('task', self.name), ('queue', queue), ('reason', reason)))
+            print(f"⛔ {self.name} 不再重试（{reason}）: {exc}")
+            if exc is not None:
+                raise exc
+            raise RuntimeError(f"{self.name} 重试被拒绝: {reason}")
+
+        # 调用方显式指定的 countdown / eta 优先
+        if countdown is None and eta is None:
+            countdown = full_jitter_backoff(self.request.retries, self.policy['backoff_base'],
+                                            self.policy['backoff_max'])
+        return super().retry(args=args, kwargs=kwargs, exc=exc, throw=throw, eta=eta,
+                             countdown=countdown, max_retries=max_retries, **options)
+
+    def on_success(self, retval, task_id, args, kwargs):
+        self._breaker_call('record_success')
+        return super().on_success(retval, task_id, args, kwargs)
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        # 经过retry()的失败已经计入
+        if not getattr(self.request, 'breaker_recorded', False):
+            self._breaker_call('record_failure', None, task_id)
+        return super().on_failure(exc, task_id, args, kwargs, einfo)
+
+
+def main():
+    """查看或重置各任务的熔断器状态"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='查看任务熔断器状态')
+    parser.add_argument('tasks', nargs='*', help='任务名（默认为配置中列出的任务）')
+    parser.add_argument('--reset', action='store_true', help='重置熔断器')
+    args = parser.parse_args()
+
+    client = config_manager.get_backend_redis_client()
+    if client is None:
+        print("❌ 当前使用内存传输，没有共享的熔断器状态")
+        return
+    names = args.tasks or list(config_manager.get_retry_policy_config()['tasks'])
+    for name in names:
+        breaker = CircuitBreaker(client, name, get_retry_policy(name))
+        if args.reset:
+            client.delete(breaker.key)
+            print(f"已重置 {name}")
+        else:
+            print(f"{name}: {breaker.state() or {'state': STATE_CLOSED}}")
+
+
+if __name__ == '__main__':
+    main()
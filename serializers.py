@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+数值负载的紧凑二进制序列化模块
+注册kombu序列化器 numpack（基于msgpack）：
+- 数值列表和NumPy数组编码为打包缓冲区（msgpack扩展类型），不再逐个数字转文本，
+  不超过 narrow_max_items 个元素的整数按取值范围用最窄的类型传输
+- 超过阈值的消息整体zlib压缩
+- 解码时数组直接用 np.frombuffer 映射到缓冲区，不逐元素解析、不复制；
+  窄类型传输的整数解码时恢复为原dtype（复制一次，只对小数组做窄化）
+解码得到的NumPy数组都是只读的，需要修改时先 .copy()
+"""
+
+import datetime
+import struct
+import zlib
+from typing import Any, Dict
+
+import msgpack
+import numpy as np
+from kombu.serialization import register
+from kombu.utils.json import register_type
+
+SERIALIZER_NAME = 'numpack'
+CONTENT_TYPE = 'application/x-numpack'
+
+# msgpack扩展类型编号
+EXT_NDARRAY = 1
+EXT_DATETIME = 2
+EXT_BIGINT = 3
+
+# 负载首字节：是否压缩
+FLAG_RAW = b'\x00'
+FLAG_ZLIB = b'\x01'
+
+# 运行参数（由 register_numpack 根据配置设置）
+_options = {
+    'array_threshold': 16,
+    'compress_threshold': 65536,
+    'compress_level': 1,
+    'decode_arrays': 'numpy',
+    # 整数窄化的元素数上限：更大的数组按原dtype传输，解码时零复制
+    'narrow_max_items': 65536,
+}
+
+
+def _pack_array(array: np.ndarray, wire_dtype=None) -> msgpack.ExtType:
+    """
+    数组 -> 扩展类型：1字节头长度 + msgpack头(传输dtype, shape, 原dtype) + 原始字节
+
+    wire_dtype 用于把取值范围小的整数按更窄的类型传输，解码时恢复原dtype
+    """
+    array = np.ascontiguousarray(array)
+    logical = array.dtype.str
+    if wire_dtype is not None and wire_dtype != array.dtype:
+        array = array.astype(wire_dtype)
+    header = msgpack.packb((array.dtype.str, list(array.shape), logical))
+    return msgpack.ExtType(EXT_NDARRAY, struct.pack('B', len(header)) + header + array.tobytes())
+
+
+def _narrow_int_dtype(array: np.ndarray):
+    """能容纳数组取值范围的最窄整数类型；超过 narrow_max_items 个元素时不窄化"""
+    if array.size > _options['narrow_max_items']:
+        return array.dtype
+    dtype = np.result_type(np.min_scalar_type(array.min()), np.min_scalar_type(array.max()))
+    if dtype.kind not in 'iu':
+        # 负数与需要uint64的值混合时没有共同的整数类型（result_type为float64），按原类型传输
+        return array.dtype
+    return dtype
+
+
+def _pack_numeric_list(values: list):
+    """同类型数值列表打包为扩展类型，其他情况返回None"""
+    if len(values) < _options['array_threshold']:
+        return None
+    types = set(map(type, values))
+    if types == {int}:
+        try:
+            array = np.fromiter(values, dtype=np.int64, count=len(values))
+        except OverflowError:
+            return None
+        return _pack_array(array, _narrow_int_dtype(array))
+    if types == {float}:
+        return _pack_array(np.fromiter(values, dtype=np.float64, count=len(values)))
+    return None
+
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.hasobject:
+            return obj.tolist()
+        if obj.dtype.kind in 'iu' and obj.size:
+            return _pack_array(obj, _narrow_int_dtype(obj))
+        return _pack_array(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return msgpack.ExtType(EXT_DATETIME, obj.isoformat().encode('ascii'))
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, int):
+        # 超出64位的整数（JSON可以表示，msgpack不能）
+        return msgpack.ExtType(EXT_BIGINT, str(obj).encode('ascii'))
+    raise TypeError(f"numpack无法序列化类型: {type(obj).__name__}")
+
+
+def _prepare(obj):
+    """递归把大的数值列表替换为数组，其余结构保持不变"""
+    if isinstance(obj, (list, tuple)):
+        if obj and isinstance(obj, list):
+            packed = _pack_numeric_list(obj)
+            if packed is not None:
+                return packed
+        return [_prepare(item) for item in obj]
+    if isinstance(obj, dict):
+        return {key: _prepare(value) for key, value in obj.items()}
+    return obj
+
+
+def _ext_hook(code: int, data: bytes):
+    if code == EXT_NDARRAY:
+        header_len = data[0]
+        wire_dtype, shape, logical = msgpack.unpackb(data[1:1 + header_len])
+        # 直接映射到缓冲区，不复制（只读数组）；窄类型传输的整数恢复为原dtype
+        array = np.frombuffer(data, dtype=np.dtype(wire_dtype), offset=1 + header_len).reshape(shape)
+        if wire_dtype != logical:
+            array = array.astype(logical)
+            # 与零复制的数组一致，解码结果只读
+            array.setflags(write=False)
+        if _options['decode_arrays'] == 'list':
+            return array.tolist()
+        return array
+    if code == EXT_DATETIME:
+        value = data.decode('ascii')
+        if 'T' in value:
+            return datetime.datetime.fromisoformat(value)
+        return datetime.date.fromisoformat(value)
+    if code == EXT_BIGINT:
+        return int(data)
+    return msgpack.ExtType(code, data)
+
+
+def dumps(obj) -> bytes:
+    """编码，超过阈值时压缩"""
+    payload = msgpack.packb(_prepare(obj), default=_default, use_bin_type=True)
+    threshold = _options['compress_threshold']
+    if threshold is not None and len(payload) >= threshold:
+        return FLAG_ZLIB + zlib.compress(payload, _options['compress_level'])
+    return FLAG_RAW + payload
+
+
+def loads(data) -> Any:
+    """解码"""
+    if isinstance(data, str):
+        data = data.encode('latin-1')
+    view = memoryview(data)
+    flag, body = bytes(view[:1]), view[1:]
+    if flag == FLAG_ZLIB:
+        body = zlib.decompress(body)
+    return msgpack.unpackb(body, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+def register_numpack(options: Dict[str, Any] = None):
+    """注册numpack序列化器，并让JSON序列化器也能处理NumPy数组"""
+    if options:
+        _options.update({key: options[key] for key in _options if key in options})
+
+    register(SERIALIZER_NAME, dumps, loads, content_type=CONTENT_TYPE, content_encoding='binary')
+
+    # 以JSON传递结果时，NumPy数组按列表编码，客户端仍得到列表
+    register_type(np.ndarray, 'ndarray', lambda array: array.tolist(), lambda value: value)
+
+
+class SerializerAnnotation:
+    """
+    按配置为任务选择序列化器（作为Celery的task_annotations使用）
+
+    serialization_config['tasks'] 为 {任务名: 序列化器}，优先级最高；
+    serialization_config['queues'] 为 {队列: 序列化器}，作用于路由到该队列的任务
+    """
+
+    def __init__(self, serialization_config: Dict[str, Any], task_routes: Dict[str, Dict],
+                 default_queue: str = 'celery'):
+        self.tasks = serialization_config.get('tasks', {})
+        self.queues = serialization_config.get('queues', {})
+        self.task_routes = task_routes
+        self.default_queue = default_queue
+
+    def annotate(self, task):
+        serializer = self.tasks.get(task.name)
+        if serializer is None:
+            queue = self.task_routes.get(task.name, {}).get('queue', self.default_queue)
+            serializer = self.queues.get(queue)
+        if serializer is None:
+            return None
+        return {'serializer': serializer}
@@ -18,5 +18,5 @@ if [ $? -ne 0 ]; then
     exit 1
 fi
 
-echo "Tair is running, starting Celery worker..."
-celery -A celery_app worker --loglevel=info --pool=solo --queues=celery,math,long_tasks
+echo "Tair is running, starting Celery workers (one per queue, see worker_profiles in config.json)..."
+python worker_launcher.py --loglevel=info
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+聚合任务事件模块（代替逐任务的Celery事件）
+Flower 打开事件后，每个任务会经消息代理发送 task-sent/received/started/succeeded 等多条事件消息。
+这里在每个进程内按 任务 + 队列 汇总：
+- 计数：sent（发布）、started、succeeded、failed、retried 及其他结束状态（revoked/ignored等）
+- 执行耗时直方图（固定桶）
+每 interval 秒把本进程的汇总作为一条记录写入Redis Stream（有活动时才写），
+可按 sample_rate 抽样保留单个事件，写入另一个Stream。监控开销与时间间隔数成正比，与任务数无关。
+
+disable_remote_enable 为 true 时worker拒绝远程开启逐任务事件（Flower的 enable_events），
+任务级监控改用这里的汇总：
+
+    python task_events.py                 # 最近5分钟按任务和队列的汇总
+    python task_events.py --watch         # 每个间隔刷新一次
+    python task_events.py --samples 20    # 最近抽样的单个事件
+"""
+
+import atexit
+import json
+import os
+import random
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from celery import signals, states
+
+import metrics
+
+# 任务结束状态 -> 汇总中的计数名
+_FINISHED = {states.SUCCESS: 'succeeded', states.FAILURE: 'failed', states.RETRY: 'retried'}
+COUNT_COLUMNS = ('sent', 'started', 'succeeded', 'failed', 'retried')
+
+
+class EventAggregator:
+    """进程内按 (任务, 队列) 汇总任务事件，后台线程按间隔写出"""
+
+    def __init__(self, config: Dict[str, Any], client_factory):
+        self.config = config
+        self.client_factory = client_factory
+        self.bounds = tuple(sorted(config['buckets']))
+        self.source = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid: Optional[int] = None
+        self._reset()
+
+    def _reset(self):
+        self._counts: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._runtimes: Dict[Tuple[str, str], metrics.Histogram] = {}
+        self._samples: List[Dict[str, Any]] = []
+        self._running: Dict[str, Tuple[float, str, str]] = {}
+        self._since = time.time()
+
+    # ---- 信号处理 ----
+
+    def record(self, event: str, task_name: str, queue: str, **fields):
+        if self._pid != os.getpid():
+            self._start()
+        key = (task_name, queue)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = dict.fromkeys(COUNT_COLUMNS, 0)
+            counts[event] = counts.get(event, 0) + 1
+        rate = self.config['sample_rate']
+        if rate and random.random() < rate:
+            sample = dict(fields, event=event, task=task_name, queue=queue, time=round(time.time(), 3))
+            with self._lock:
+                self._samples.append(sample)
+
+    def on_publish(self, sender=None, routing_key=None, headers=None, **kwargs):
+        self.record('sent', sender, routing_key or 'unknown', task_id=(headers or {}).get('id'))
+
+    def on_prerun(self, task_id=None, task=None, **kwargs):
+        queue = (getattr(task.request, 'delivery_info', None) or {}).get('routing_key') or 'unknown'
+        self._running[task_id] = (time.perf_counter(), task.name, queue)
+        self.record('started', task.name, queue, task_id=task_id)
+
+    def on_postrun(self, task_id=None, task=None, state=None, **kwargs):
+        running = self._running.pop(task_id, None)
+        if running is None:
+            return
+        started, task_name, queue = running
+        runtime = time.perf_counter() - started
+        key = (task_name, queue)
+        with self._lock:
+            histogram = self._runtimes.get(key)
+            if histogram is None:
+                histogram = self._runtimes[key] = metrics.Histogram(self.bounds)
+        histogram.observe(runtime)
+        self.record(_FINISHED.get(state, (state or 'unknown').lower()), task_name, queue,
+                    task_id=task_id, runtime=round(runtime, 6))
+
+    # ---- 写出 ----
+
+    def _start(self):
+        with self._flush_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='task-events', daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.config['interval'])
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️  任务事件汇总写出失败: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """取出当前间隔的汇总并开始新的间隔"""
+        with self._lock:
+            counts, runtimes, samples = self._counts, self._runtimes, self._samples
+            since = self._since
+            self._counts, self._runtimes, self._samples = {}, {}, []
+            self._since = time.time()
+        rows = []
+        for (task_name, queue), row_counts in counts.items():
+            row = {'task': task_name, 'queue': queue, 'counts': row_counts}
+            histogram = runtimes.get((task_name, queue))
+            if histogram is not None:
+                row['runtime'] = {'counts': histogram.counts, 'sum': round(histogram.sum, 6),
+                                  'count': histogram.count}
+            rows.append(row)
+        return {'source': self.source, 'start': round(since, 3), 'end': round(self._since, 3),
+                'buckets': list(self.bounds), 'rows': rows, 'samples': samples}
+
+    def flush(self):
+        """把当前间隔的汇总（和抽样事件）写入Redis Stream；没有活动时不写"""
+        with self._flush_lock:
+            summary = self.snapshot()
+            if not summary['rows']:
+                return
+            client = self.client_factory()
+            if client is None:
+                return
+            samples = summary.pop('samples')
+            pipe = client.pipeline(transaction=False)
+            pipe.xadd(self.config['stream'], {'data': json.dumps(summary, ensure_ascii=False)},
+                      maxlen=self.config['maxlen'], approximate=True)
+            pipe.expire(self.config['stream'], self.config['ttl'])
+            if samples:
+                for sample in samples:
+                    pipe.xadd(self.config['samples_stream'], {'data': json.dumps(sample, ensure_ascii=False)},
+                              maxlen=self.config['samples_maxlen'], approximate=True)
+                pipe.expire(self.config['samples_stream'], self.config['ttl'])
+            pipe.execute()
+
+    def after_fork(self):
+        """子进程重新开始汇总（父进程的数据由父进程写出），首次记录时启动写出线程"""
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self.source = f"{socket.gethostname()}:{os.getpid()}"
+        self._reset()
+
+
+aggregator: Optional[EventAggregator] = None
+
+
+def flush():
+    if aggregator is None:
+        return
+    try:
+        aggregator.flush()
+    except Exception as e:
+        print(f"⚠️  任务事件汇总写出失败: {e}")
+
+
+def _disable_remote_enable():
+    """替换 enable_events 远程命令：只保留worker心跳，不开启逐任务事件"""
+    from celery.worker.control import control_command, ok
+
+    @control_command(name='enable_events')
+    def enable_events(state):
+        return ok('task events are aggregated by task_events, per-task events stay disabled')
+
+
+def install(app, config_manager) -> Optional[EventAggregator]:
+    """连接任务信号，按间隔写出汇总；返回聚合器"""
+    global aggregator
+    events_config = config_manager.get_task_events_config()
+    if not events_config['enabled'] or aggregator is not None:
+        return aggregator
+
+    aggregator = EventAggregator(events_config, config_manager.get_backend_redis_client)
+    app.conf.update(worker_send_task_events=False, task_send_sent_event=False)
+    if events_config['disable_remote_enable']:
+        signals.worker_init.connect(lambda **kwargs: _disable_remote_enable(), weak=False)
+
+    signals.before_task_publish.connect(aggregator.on_publish, weak=False)
+    signals.task_prerun.connect(aggregator.on_prerun, weak=False)
+    signals.task_postrun.connect(aggregator.on_postrun, weak=False)
+    # prefork子进程退出时不执行atexit
+    signals.worker_process_shutdown.connect(lambda **kwargs: flush(), weak=False)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=aggregator.after_fork)
+    atexit.register(flush)
+    return aggregator
+
+
+# ---- 读取汇总（命令行） ----
+
+def read_summaries(client, events_config: Dict[str, Any], since: float) -> List[Dict[str, Any]]:
+    """读取 since 秒内写入的汇总"""
+    start_id = f"{int((time.time() - since) * 1000)}-0"
+    entries = client.xrange(events_config['stream'], min=start_id, max='+')
+    return [json.loads(fields[b'data']) for _, fields in entries]
+
+
+def merge_summaries(summaries: List[Dict[str, Any]], by: str = 'task') -> Dict[Tuple[str, ...], Dict[str, Any]]:
+    """按 任务+队列 / 任务 / 队列 合并各进程各间隔的汇总"""
+    merged: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    for summary in summaries:
+        for row in summary['rows']:
+            if by == 'task':
+                key = (row['task'], row['queue'])
+            elif by == 'queue':
+                key = (row['queue'],)
+            else:
+                key = (row['task'],)
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = {'counts': {}, 'buckets': summary['buckets'],
+                                       'runtime_counts': [0] * (len(summary['buckets']) + 1),
+                                       'runtime_sum': 0.0, 'runtime_count': 0}
+            for name, value in row['counts'].items():
+                entry['counts'][name] = entry['counts'].get(name, 0) + value
+            runtime = row.get('runtime')
+            if runtime is not None and summary['buckets'] == entry['buckets']:
+                entry['runtime_counts'] = [a + b for a, b in zip(entry['runtime_counts'], runtime['counts'])]
+                entry['runtime_sum'] += runtime['sum']
+                entry['runtime_count'] += runtime['count']
+    return merged
+
+
+def histogram_quantile(bounds: List[float], counts: List[int], q: float) -> Optional[float]:
+    """按桶上界估计分位数（落在最后一个桶时返回最大的上界）"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        cumulative += count
+        if cumulative >= rank:
+            return bounds[min(index, len(bounds) - 1)]
+    return bounds[-1]
+
+
+def format_table(merged: Dict[Tuple[str, ...], Dict[str, Any]], window: float, by: str) -> str:
+    headers = {'task': ['任务', '队列'], 'queue': ['队列'], 'name': ['任务']}[by]
+    headers = headers + ['发布', '开始', '成功', '失败', '重试', '其他', '成功/秒', '平均', 'p50≤', 'p95≤']
+    lines = []
+    rows = []
+    for key in sorted(merged):
+        entry = merged[key]
+        counts = entry['counts']
+        other = sum(value for name, value in counts.items() if name not in COUNT_COLUMNS)
+        average = entry['runtime_sum'] / entry['runtime_count'] if entry['runtime_count'] else None
+        p50 = histogram_quantile(entry['buckets'], entry['runtime_counts'], 0.5)
+        p95 = histogram_quantile(entry['buckets'], entry['runtime_counts'], 0.95)
+        rows.append(list(key) + [str(counts.get(name, 0)) for name in COUNT_COLUMNS] + [
+            str(other),
+            f"{counts.get('succeeded', 0) / window:.2f}",
+            '-' if average is None else f"{average * 1000:.1f}ms",
+            '-' if p50 is None else f"{p50 * 1000:g}ms",
+            '-' if p95 is None else f"{p95 * 1000:g}ms",
+        ])
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    for row in [headers] + rows:
+        lines.append('  '.join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+    return '\n'.join(lines)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='查看按任务/队列聚合的任务事件')
+    parser.add_argument('--since', type=float, default=300, help='统计最近多少秒（默认300）')
+    parser.add_argument('--by', choices=['task', 'queue', 'name'], default='task',
+                        help='按 任务+队列 / 队列 / 任务 汇总')
+    parser.add_argument('--watch', action='store_true', help='每个汇总间隔刷新一次')
+    parser.add_argument('--samples', type=int, default=0, help='显示最近N条抽样的单个事件')
+    args = parser.parse_args()
+
+    from celery_app import config_manager
+
+    events_config = config_manager.get_task_events_config()
+    client = config_manager.get_backend_redis_client()
+    if client is None:
+        print("❌ 当前使用内存传输，没有可读取的任务事件汇总")
+        return
+
+    if args.samples:
+        for _, fields in reversed(client.xrevrange(events_config['samples_stream'], count=args.samples)):
+            print(fields[b'data'].decode())
+        return
+
+    while True:
+        summaries = read_summaries(client, events_config, args.since)
+        if args.watch:
+            print('\033[2J\033[H', end='')
+        sources = {summary['source'] for summary in summaries}
+        print(f"📊 最近 {args.since:.0f} 秒: {len(summaries)} 条汇总，来自 {len(sources)} 个进程"
+              f"（{time.strftime('%H:%M:%S')}）")
+        if summaries:
+            print(format_table(merge_summaries(summaries, args.by), args.since, args.by))
+        if not args.watch:
+            return
+        time.sleep(events_config['interval'])
+
+
+if __name__ == '__main__':
+    main()
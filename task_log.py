@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+任务日志模块（替代任务热路径中的print）
+    logger = get_task_logger(__name__)
+    logger.info("计算 %s + %s", x, y)
+
+- 调用方只做级别判断、采样和一次入队（无锁的deque），不格式化字符串、不写标准输出
+- 后台线程按 flush_interval 或积累 batch_size 条时批量格式化并一次写出；
+  参数在格式化时按 max_arg_chars / max_items 截断（大列表只输出前几项），整条消息不超过 max_message_chars
+- 按任务设置采样率（task_logging.tasks），每次任务执行开始时决定是否保留本次执行的日志，
+  WARNING及以上级别总是保留；队列满时丢弃并计数
+- format 为 text 时输出 "[时间: 级别/任务名[任务ID]] 消息 键=值"，为 json 时每条一行JSON
+- enabled 为 false 时退回同步print（与原来的行为一致），便于对比开销
+参数在后台线程中才格式化，调用后不要再修改作为参数传入的可变对象。
+"""
+
+import atexit
+import json
+import logging
+import os
+import random
+import reprlib
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Dict, Optional
+
+from celery import signals
+
+import metrics
+
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "enabled": True,
+    "level": "INFO",
+    "format": "text",
+    "stream": "stderr",
+    "sample_rate": 1.0,
+    "tasks": {},
+    "max_arg_chars": 200,
+    "max_items": 10,
+    "max_message_chars": 2000,
+    "batch_size": 500,
+    "flush_interval": 0.2,
+    "queue_size": 10000,
+}
+
+# 运行参数（由 configure 设置），热路径只读取这里的值
+_config: Dict[str, Any] = dict(DEFAULT_CONFIG)
+_level = logging.INFO
+
+
+class _Repr(reprlib.Repr):
+    """截断的repr，NumPy数组只取前几项，不格式化整个数组"""
+
+    def repr_ndarray(self, value, level):
+        head = self.repr1(value.ravel()[:self.maxlist + 1].tolist(), level - 1)
+        return f"array(shape={value.shape}, dtype={value.dtype}, {head})"
+
+
+class _Writer:
+    """后台批量写出日志"""
+
+    def __init__(self):
+        self.buffer: deque = deque()
+        self.written = 0
+        self.sampled = 0
+        self.dropped = 0
+        self._reported = {'written': 0, 'sampled': 0, 'dropped': 0}
+        self._pid: Optional[int] = None
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._stream = None
+        self._repr = _Repr()
+        self.configure(_config)
+
+    def configure(self, config: Dict[str, Any]):
+        self.queue_size = config['queue_size']
+        self.batch_size = config['batch_size']
+        self.flush_interval = config['flush_interval']
+        self.max_message_chars = config['max_message_chars']
+        self.max_arg_chars = config['max_arg_chars']
+        self.json_format = config['format'] == 'json'
+        items = config['max_items']
+        self._repr.maxlist = self._repr.maxtuple = self._repr.maxset = self._repr.maxfrozenset = items
+        self._repr.maxdict = self._repr.maxdeque = self._repr.maxarray = items
+        self._repr.maxstring = self._repr.maxother = self.max_arg_chars
+        self._repr.maxlevel = 3
+        if self._stream is not None and self._stream not in (sys.__stdout__, sys.__stderr__):
+            self._stream.close()
+        self._stream = None
+        self._stream_name = config['stream']
+
+    # ---- 调用方 ----
+
+    def put(self, entry: tuple):
+        if self._pid != os.getpid():
+            self._start()
+        if len(self.buffer) >= self.queue_size:
+            self.dropped += 1
+            return
+        self.buffer.append(entry)
+        if len(self.buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _start(self):
+        with self._flush_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='task-log-writer', daemon=True).start()
+
+    # ---- 后台线程 ----
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️  任务日志写出失败: {e}")
+
+    def flush(self):
+        """格式化并写出队列中的全部日志"""
+        with self._flush_lock:
+            lines = []
+            while True:
+                try:
+                    entry = self.buffer.popleft()
+                except IndexError:
+                    break
+                lines.append(self.format(entry))
+            if lines:
+                stream = self._get_stream()
+                stream.write(''.join(lines))
+                stream.flush()
+                self.written += len(lines)
+            self._report()
+
+    def _get_stream(self):
+        if self._stream is None:
+            if self._stream_name == 'stdout':
+                # worker会把sys.stdout重定向到日志，这里直接写原始的标准输出
+                self._stream = sys.__stdout__
+            elif self._stream_name == 'stderr':
+                self._stream = sys.__stderr__
+            else:
+                self._stream = open(self._stream_name, 'a', encoding='utf-8')
+        return self._stream
+
+    def _report(self):
+        if metrics.registry is None:
+            return
+        for outcome in ('written', 'sampled', 'dropped'):
+            value = getattr(self, outcome)
+            delta = value - self._reported[outcome]
+            if delta:
+                metrics.registry.inc('celery_task_log_total', (('outcome', outcome),), delta)
+                self._reported[outcome] = value
+
+    def _arg(self, value):
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        if isinstance(value, str):
+            return value if len(value) <= self.max_arg_chars else value[:self.max_arg_chars] + '...'
+        return self._repr.repr(value).replace('\n', ' ')
+
+    def format(self, entry: tuple) -> str:
+        created, level, task_name, task_id, msg, args, fields = entry
+        if args:
+            try:
+                message = msg % tuple(self._arg(arg) for arg in args)
+            except (TypeError, ValueError):
+                message = f"{msg} {self._repr.repr(args)}"
+        else:
+            message = msg
+        if len(message) > self.max_message_chars:
+            message = message[:self.max_message_chars] + '...'
+        level_name = logging.getLevelName(level)
+        if self.json_format:
+            record = {'time': round(created, 6), 'level': level_name, 'task': task_name,
+                      'task_id': task_id, 'message': message}
+            for key, value in fields.items():
+                record[key] = self._arg(value)
+            return json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created))
+        line = f"[{timestamp},{int(created % 1 * 1000):03d}: {level_name}/{task_name or '-'}"
+        if task_id:
+            line += f"[{task_id}]"
+        line += f"] {message}"
+        if fields:
+            line += ' ' + ' '.join(f"{key}={self._arg(value)}" for key, value in fields.items())
+        return line + '\n'
+
+    def after_fork(self):
+        """子进程中丢弃父进程未写出的日志（由父进程写出），首次使用时重新启动写出线程"""
+        self.buffer = deque()
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self.written = self.sampled = self.dropped = 0
+        self._reported = {'written': 0, 'sampled': 0, 'dropped': 0}
+
+
+_writer = _Writer()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_writer.after_fork)
+atexit.register(_writer.flush)
+
+
+# 当前线程正在执行的任务 (任务名, 任务ID, 本次执行的日志是否保留)，由任务信号设置；
+# 同步调用的子任务（如eager模式）执行完后恢复外层任务
+_context = threading.local()
+
+
+def task_started(task_name: str, task_id: Optional[str]):
+    """进入一次任务执行：采样按任务执行决定，同一次执行的日志要么全部保留，要么全部丢弃"""
+    rate = _config['tasks'].get(task_name, _config['sample_rate'])
+    current = (task_name, task_id, rate >= 1.0 or random.random() < rate)
+    stack = _context.__dict__.setdefault('stack', [])
+    stack.append(current)
+    _context.task = current
+
+
+def task_finished():
+    stack = _context.__dict__.get('stack')
+    if stack:
+        stack.pop()
+    _context.task = stack[-1] if stack else None
+
+
+def _on_task_prerun(task_id=None, task=None, **kwargs):
+    task_started(task.name, task_id)
+
+
+def _on_task_postrun(**kwargs):
+    task_finished()
+
+
+signals.task_prerun.connect(_on_task_prerun, weak=False)
+signals.task_postrun.connect(_on_task_postrun, weak=False)
+
+
+class TaskLogger:
+    """任务日志记录器，接口与logging.Logger的常用方法一致"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def isEnabledFor(self, level: int) -> bool:
+        return level >= _level
+
+    def log(self, level: int, msg: str, *args, **fields):
+        if level < _level:
+            return
+        if not _config['enabled']:
+            print(msg % args if args else msg)
+            return
+        current = getattr(_context, 'task', None)
+        if current is None:
+            task_name = task_id = None
+        else:
+            task_name, task_id, keep = current
+            if not keep and level < logging.WARNING:
+                _writer.sampled += 1
+                return
+        _writer.put((time.time(), level, task_name, task_id, msg, args, fields))
+
+    def debug(self, msg: str, *args, **fields):
+        self.log(logging.DEBUG, msg, *args, **fields)
+
+    def info(self, msg: str, *args, **fields):
+        self.log(logging.INFO, msg, *args, **fields)
+
+    def warning(self, msg: str, *args, **fields):
+        self.log(logging.WARNING, msg, *args, **fields)
+
+    def error(self, msg: str, *args, **fields):
+        self.log(logging.ERROR, msg, *args, **fields)
+
+    def exception(self, msg: str, *args, **fields):
+        """记录错误和当前异常的堆栈（堆栈在调用时格式化）"""
+        fields['exc'] = traceback.format_exc()
+        self.log(logging.ERROR, msg, *args, **fields)
+
+
+_loggers: Dict[str, TaskLogger] = {}
+
+
+def get_task_logger(name: str) -> TaskLogger:
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers[name] = TaskLogger(name)
+    return logger
+
+
+def configure(config: Optional[Dict[str, Any]] = None):
+    """应用 task_logging 配置（未给出的项使用默认值）"""
+    global _level
+    new_config = dict(DEFAULT_CONFIG)
+    new_config.update(config or {})
+    level = logging.getLevelName(str(new_config['level']).upper())
+    if not isinstance(level, int):
+        raise ValueError(f"未知的日志级别: {new_config['level']}")
+    _writer.flush()
+    _config.clear()
+    _config.update(new_config)
+    _level = level
+    _writer.configure(_config)
+
+
+def flush():
+    """立即写出队列中的日志"""
+    _writer.flush()
+
+
+def get_stats() -> Dict[str, int]:
+    """本进程已写出、被采样丢弃、因队列满丢弃和待写出的日志条数"""
+    return {
+        'written': _writer.written,
+        'sampled': _writer.sampled,
+        'dropped': _writer.dropped,
+        'pending': len(_writer.buffer),
+    }
@@ -1,77 +1,192 @@
 import time
 import random
+import numpy as np
 from celery import current_task
 from celery_app import app
+from checkpoint import Checkpoint
+from progress import ProgressReporter
+from memoize import MemoizedTask
+from retry_policy import RetryPolicyTask
+from task_log import get_task_logger
 
-@app.task
+logger = get_task_logger(__name__)
+
+@app.task(base=MemoizedTask, deterministic=True)
 def add(x, y):
     """简单的加法任务"""
-    print(f"计算 {x} + {y}")
+    logger.info("计算 %s + %s", x, y)
     result = x + y
-    print(f"结果: {result}")
+    logger.info("结果: %s", result)
     return result
 
-@app.task
+@app.task(base=MemoizedTask, deterministic=True)
 def multiply(x, y):
     """简单的乘法任务"""
-    print(f"计算 {x} * {y}")
+    logger.info("计算 %s * %s", x, y)
     result = x * y
-    print(f"结果: {result}")
+    logger.info("结果: %s", result)
     return result
 
+INT64_MAX = int(np.iinfo(np.int64).max)
+
+
+def _max_abs(values):
+    """整数数组的最大绝对值（Python整数，不会溢出）"""
+    return max(int(values.max()), -int(values.min()))
+
+
+def _operands(xs, ys, bound):
+    """
+    转换批量任务的操作数
+
+    整数结果的绝对值上界 bound(max|x|, max|y|) 超出int64时改用Python整数（object数组）计算，
+    与逐个计算的 add/multiply 一样得到精确结果，不返回溢出回绕的值
+    """
+    xs, ys = np.asarray(xs), np.asarray(ys)
+    if xs.shape != ys.shape:
+        raise ValueError(f"操作数长度不一致: {xs.shape} vs {ys.shape}")
+    if (xs.size and xs.dtype.kind in 'iuO' and ys.dtype.kind in 'iuO'
+            and (xs.dtype.kind == 'O' or ys.dtype.kind == 'O'
+                 or bound(_max_abs(xs), _max_abs(ys)) > INT64_MAX)):
+        xs, ys = xs.astype(object), ys.astype(object)
+    return xs, ys
+
+@app.task
+def add_many(xs, ys):
+    """批量加法任务，按列传入操作数，一次NumPy运算完成"""
+    xs, ys = _operands(xs, ys, lambda x, y: x + y)
+    logger.info("批量计算 %d 个加法", len(xs))
+    return np.add(xs, ys).tolist()
+
+@app.task
+def multiply_many(xs, ys):
+    """批量乘法任务，按列传入操作数，一次NumPy运算完成"""
+    xs, ys = _operands(xs, ys, lambda x, y: x * y)
+    logger.info("批量计算 %d 个乘法", len(xs))
+    return np.multiply(xs, ys).tolist()
+
 @app.task(bind=True)
 def long_running_task(self, duration=10):
-    """长时间运行的任务，带进度更新"""
-    print(f"开始执行长时间任务，预计耗时 {duration} 秒")
-    
-    for i in range(duration):
-        time.sleep(1)
-        # 更新任务状态
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': i + 1, 'total': duration, 'status': f'处理中... {i+1}/{duration}'}
-        )
-        print(f"进度: {i+1}/{duration}")
+    """长时间运行的任务，带进度更新；重新投递后从断点继续，可协作式取消"""
+    # 进度按限速推送到Redis Stream，结果后端只低频写入PROGRESS状态
+    with Checkpoint(self) as checkpoint, ProgressReporter(self) as progress:
+        start = checkpoint.load({'i': 0})['i']
+        if start:
+            logger.info("从第 %d 秒继续长时间任务，剩余 %d 秒", start, duration - start)
+        else:
+            logger.info("开始执行长时间任务，预计耗时 %d 秒", duration)
+        for i in range(start, duration):
+            time.sleep(1)
+            progress.update(i + 1, duration, status=f'处理中... {i+1}/{duration}')
+            logger.info("进度: %d/%d", i + 1, duration)
+            checkpoint.step({'i': i + 1})
     
     return {'current': duration, 'total': duration, 'status': '任务完成!', 'result': f'任务执行了 {duration} 秒'}
 
 @app.task
 def generate_random_numbers(count=5):
     """生成随机数列表"""
-    print(f"生成 {count} 个随机数")
+    logger.info("生成 %d 个随机数", count)
     numbers = [random.randint(1, 100) for _ in range(count)]
-    print(f"生成的随机数: {numbers}")
+    logger.info("生成的随机数: %s", numbers)
     return numbers
 
-@app.task
+@app.task(base=MemoizedTask, deterministic=True)
 def process_list(numbers):
     """处理数字列表，计算总和和平均值"""
-    print(f"处理数字列表: {numbers}")
-    total = sum(numbers)
-    average = total / len(numbers) if numbers else 0
+    logger.info("处理数字列表: %s", numbers)
+    if isinstance(numbers, np.ndarray):
+        # numpack序列化器解码得到的数组，直接用NumPy计算
+        total = numbers.sum().item()
+    else:
+        total = sum(numbers)
+    average = total / len(numbers) if len(numbers) else 0
     result = {
         'numbers': numbers,
         'sum': total,
         'average': average,
         'count': len(numbers)
     }
-    print(f"处理结果: {result}")
+    logger.info("处理结果: %s", result)
+    return result
+
+@app.task
+def partial_stats(chunk):
+    """计算一个分片的可合并统计量（数量/总和/均值/M2/最小/最大）"""
+    values = np.asarray(chunk)
+    count = int(values.size)
+    if count == 0:
+        return {'count': 0, 'sum': 0, 'mean': 0.0, 'm2': 0.0, 'min': None, 'max': None}
+    mean = float(values.mean())
+    return {
+        'count': count,
+        'sum': values.sum().item(),
+        'mean': mean,
+        'm2': float(((values - mean) ** 2).sum()),
+        'min': values.min().item(),
+        'max': values.max().item()
+    }
+
+def _merge_two_stats(a, b):
+    """合并两份统计量（Chan并行方差算法）"""
+    if a['count'] == 0:
+        return b
+    if b['count'] == 0:
+        return a
+    count = a['count'] + b['count']
+    delta = b['mean'] - a['mean']
+    return {
+        'count': count,
+        'sum': a['sum'] + b['sum'],
+        'mean': a['mean'] + delta * b['count'] / count,
+        'm2': a['m2'] + b['m2'] + delta * delta * a['count'] * b['count'] / count,
+        'min': min(a['min'], b['min']),
+        'max': max(a['max'], b['max'])
+    }
+
+@app.task
+def merge_stats(partials):
+    """合并所有分片统计量，结果字段与 process_list 一致（numbers 不回传）"""
+    merged = {'count': 0, 'sum': 0, 'mean': 0.0, 'm2': 0.0, 'min': None, 'max': None}
+    for partial in partials:
+        merged = _merge_two_stats(merged, partial)
+    count = merged['count']
+    result = {
+        'numbers': None,
+        'sum': merged['sum'],
+        'average': merged['sum'] / count if count else 0,
+        'count': count,
+        'min': merged['min'],
+        'max': merged['max'],
+        'variance': merged['m2'] / count if count else 0.0
+    }
+    logger.info("合并 %d 个分片: %s", len(partials), result)
     return result
 
 @app.task
+def identity(value):
+    """原样返回输入，用于在工作流中保留中间结果"""
+    return value
+
+@app.task
+def append_values(values, *extra):
+    """在列表末尾追加常量，用于在工作流中拼接下一步的参数"""
+    return list(values) + list(extra)
+
+@app.task(result_policy='failure_only')
 def failing_task():
     """故意失败的任务，用于演示错误处理"""
-    print("这个任务将会失败...")
+    logger.info("这个任务将会失败...")
     raise Exception("这是一个故意的错误，用于演示错误处理")
 
-@app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3, 'countdown': 5})
+@app.task(bind=True, base=RetryPolicyTask, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3})
 def retry_task(self, fail_probability=0.7):
-    """带重试机制的任务"""
-    print(f"执行重试任务，失败概率: {fail_probability}")
+    """带重试机制的任务（指数退避+抖动，受重试预算和熔断器限制）"""
+    logger.info("执行重试任务，失败概率: %s", fail_probability)
     
     if random.random() < fail_probability:
-        print(f"任务失败，将在5秒后重试... (已重试 {self.request.retries} 次)")
+        logger.warning("任务失败，将按退避策略重试... (已重试 %d 次)", self.request.retries)
         raise Exception("随机失败")
     
-    print("任务成功执行!")
+    logger.info("任务成功执行!")
     return "任务成功完成"
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按队列启动worker的启动器
+根据 task_routes 中出现的队列（加上默认队列）为每个队列启动独立的worker，
+并发模型、并发数、预取倍数和子进程最大任务数由 config.json 的 worker_profiles 决定：
+CPU密集的 math 用 prefork（按CPU核数），sleep/IO密集的 long_tasks 用线程池
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 传给worker进程的预取倍数（celery_app读取，覆盖config.json中的worker_prefetch_multiplier）
+PREFETCH_ENV = 'CELERY_WORKER_PREFETCH_MULTIPLIER'
+
+# 未配置的队列使用的默认值
+DEFAULT_PROFILE = {
+    "pool": "prefork",
+    "concurrency": None,
+    "prefetch_multiplier": None,
+    "max_tasks_per_child": None,
+}
+
+
+def build_profiles(worker_profiles: Dict[str, Dict[str, Any]], task_routes: Dict[str, Dict],
+                   default_queue: str = 'celery') -> Dict[str, Dict[str, Any]]:
+    """为每个路由队列生成一个worker配置，concurrency为空时取CPU核数"""
+    queues = [default_queue]
+    for route in task_routes.values():
+        queue = route.get('queue')
+        if queue and queue not in queues:
+            queues.append(queue)
+
+    profiles = {}
+    for queue in queues:
+        profile = dict(DEFAULT_PROFILE)
+        profile.update(worker_profiles.get(queue, {}))
+        profile.setdefault('queues', [queue])
+        if not profile['concurrency']:
+            profile['concurrency'] = os.cpu_count() or 1
+        if os.name == 'nt' and profile['pool'] == 'prefork':
+            # Windows不支持prefork
+            profile['pool'] = 'threads'
+        profiles[queue] = profile
+    return profiles
+
+
+def build_command(name: str, profile: Dict[str, Any], loglevel: str = 'info') -> List[str]:
+    """生成单个worker的启动命令"""
+    command = [
+        sys.executable, '-m', 'celery', '-A', 'celery_app', 'worker',
+        f'--hostname={name}@%h',
+        f'--queues={",".join(profile["queues"])}',
+        f'--pool={profile["pool"]}',
+        f'--concurrency={profile["concurrency"]}',
+        f'--loglevel={loglevel}',
+    ]
+    if profile.get('prefetch_multiplier') is not None:
+        command.append(f'--prefetch-multiplier={profile["prefetch_multiplier"]}')
+    if profile.get('max_tasks_per_child') and profile['pool'] == 'prefork':
+        command.append(f'--max-tasks-per-child={profile["max_tasks_per_child"]}')
+    return command
+
+
+def worker_env(profile: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """子进程环境：保证从任意工作目录都能导入celery_app（config.json仍按当前目录读取）"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = PROJECT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    if profile is not None and profile.get('prefetch_multiplier') is not None:
+        # celery命令行把 --prefetch-multiplier=0（不限制预取）当作未指定，由celery_app按环境变量设置
+        env[PREFETCH_ENV] = str(profile['prefetch_multiplier'])
+    return env
+
+
+def launch(profiles: Dict[str, Dict[str, Any]], loglevel: str = 'info') -> Dict[str, subprocess.Popen]:
+    """启动所有worker进程"""
+    processes = {}
+    for name, profile in profiles.items():
+        command = build_command(name, profile, loglevel)
+        print(f"🚀 启动 {name}: pool={profile['pool']} concurrency={profile['concurrency']} "
+              f"queues={','.join(profile['queues'])}")
+        processes[name] = subprocess.Popen(command, env=worker_env(profile))
+    return processes
+
+
+def stop(processes: Dict[str, subprocess.Popen], timeout: float = 60):
+    """热关闭：发送SIGTERM，等待正在执行的任务完成，超时后强制结束"""
+    for process in processes.values():
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    for name, process in processes.items():
+        try:
+            process.wait(max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            print(f"⚠️  {name} 未在 {timeout} 秒内退出，强制结束")
+            process.kill()
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按队列启动Celery worker')
+    parser.add_argument('--only', help='只启动指定的队列配置，逗号分隔')
+    parser.add_argument('--loglevel', default='info')
+    parser.add_argument('--dry-run', action='store_true', help='只打印启动命令')
+    args = parser.parse_args()
+
+    from celery_app import app, config_manager
+    profiles = build_profiles(config_manager.get_worker_profiles(), app.conf.task_routes,
+                              app.conf.task_default_queue)
+    if args.only:
+        selected = args.only.split(',')
+        profiles = {name: profile for name, profile in profiles.items() if name in selected}
+
+    if args.dry_run:
+        for name, profile in profiles.items():
+            print(' '.join(build_command(name, profile, args.loglevel)))
+        return
+
+    # systemd / docker stop / supervisor 发送SIGTERM：与Ctrl+C一样热关闭所有worker，不留下孤儿进程
+    signal.signal(signal.SIGTERM, _interrupt)
+    processes = launch(profiles, args.loglevel)
+    try:
+        while all(process.poll() is None for process in processes.values()):
+            time.sleep(1)
+        exited = [name for name, process in processes.items() if process.poll() is not None]
+        print(f"❌ worker退出: {', '.join(exited)}，停止其余worker")
+    except KeyboardInterrupt:
+        print("\n收到中断或终止信号，正在热关闭所有worker...")
+    finally:
+        stop(processes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+服务端工作流模块
+用 chain / group / chord 声明多步任务流水线，整个流水线在worker上执行，
+生产者只提交一次、只取回最终结果，不再逐步 .get() 后再提交下一步
+"""
+
+from itertools import islice
+from typing import Iterable, Tuple
+
+from celery import chain, chord, group
+
+from tasks import (add, multiply, generate_random_numbers, process_list, identity, append_values,
+                   partial_stats, merge_stats)
+
+
+def random_numbers_pipeline(count: int = 8):
+    """生成随机数 -> 处理列表"""
+    return chain(generate_random_numbers.s(count), process_list.s())
+
+
+def arithmetic_pipeline(x, y, factor=2, extra: Iterable = (100,)):
+    """
+    加法 -> 乘法 -> 数据处理
+
+    加法结果同时传给 identity 与 multiply（chord头部），
+    两者结果按顺序汇总后追加常量，再交给 process_list，
+    即在worker上计算 process_list([x + y, (x + y) * factor, *extra])
+    """
+    return chain(
+        add.s(x, y),
+        group(identity.s(), multiply.s(factor)),
+        append_values.s(*extra),
+        process_list.s(),
+    )
+
+
+def fan_out_sum_pipeline(pairs: Iterable[Tuple]):
+    """并行执行多个加法，全部完成后汇总（chord）"""
+    return chord((add.s(x, y) for x, y in pairs), process_list.s())
+
+
+def _chunks(numbers: Iterable, chunk_size: int):
+    """惰性切分输入，支持生成器等超大输入而不整体载入内存"""
+    if hasattr(numbers, 'tolist'):
+        # NumPy数组按切片转换，避免逐个元素产生NumPy标量
+        for start in range(0, len(numbers), chunk_size):
+            yield numbers[start:start + chunk_size].tolist()
+        return
+    iterator = iter(numbers)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def sharded_process_list_pipeline(numbers: Iterable, chunk_size: int = 100_000):
+    """
+    分片版 process_list：各分片在多个worker上用NumPy计算可合并统计量，
+    由chord回调 merge_stats 合并，每个worker只持有一个分片
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size 必须大于0")
+    return chord((partial_stats.s(chunk) for chunk in _chunks(numbers, chunk_size)), merge_stats.s())
+
+
+# 可通过名称运行的流水线
+PIPELINES = {
+    'random_numbers': random_numbers_pipeline,
+    'arithmetic': arithmetic_pipeline,
+    'fan_out_sum': fan_out_sum_pipeline,
+    'sharded_process_list': sharded_process_list_pipeline,
+}
+
+
+def run_pipeline(name: str, *args, **kwargs):
+    """提交指定流水线，返回最终结果的AsyncResult"""
+    try:
+        factory = PIPELINES[name]
+    except KeyError:
+        raise ValueError(f"未知的流水线: {name}，可选: {', '.join(PIPELINES)}")
+    return factory(*args, **kwargs).apply_async()